@@ -14,7 +14,7 @@ load_dotenv()
 
 # Importar los modelos para crear las tablas
 from models import models
-from models.database import engine
+from models.database import engine, start_async_engine
 
 # Importar los routers
 from router import videos, playlists, raspberry, ui, devices, device_playlists, services_enhanced as services, device_service_api,playlists_api
@@ -24,8 +24,16 @@ from router.users import router as users_router
 from router.tiendas import router as tiendas_router
 from router.playlist_checker_api import router as playlist_checker_router
 from router.ui_auth import router as ui_auth_router
+from router.metrics import router as metrics_router
+from router.rollout import router as rollout_router
 from utils.list_checker import start_playlist_checker
 from utils.ping_checker import start_background_ping_checker
+from utils.query_budget import start_query_budget
+from services.chunked_upload import start_upload_sweeper
+from services.heartbeat_buffer import start_heartbeat_flusher
+from services.media_probe import start_media_probe_pool
+from services.thumbnails import start_thumbnail_pool
+from services.transcoding import start_transcode_worker
 
 # Crear las tablas en la base de datos
 models.Base.metadata.create_all(bind=engine)
@@ -141,6 +149,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Sentencias SQL por petición frente al presupuesto de cada endpoint (QUERY_BUDGET_ENABLED)
+start_query_budget(app)
+
 # ==========================================
 # CONFIGURACIÓN DE ARCHIVOS ESTÁTICOS
 # ==========================================
@@ -179,6 +190,8 @@ app.include_router(device_service_api.router)
 app.include_router(playlist_checker_router)
 app.include_router(client_api_router)
 app.include_router(tiendas_router)
+app.include_router(metrics_router)
+app.include_router(rollout_router)
 
 # ==========================================
 # MIDDLEWARE DE AUTENTICACIÓN UNIFICADO
@@ -259,6 +272,12 @@ async def auth_middleware(request: Request, call_next):
 
 # start_playlist_checker(app)
 # start_background_ping_checker(app)
+start_async_engine(app)
+start_heartbeat_flusher(app)
+start_media_probe_pool(app)
+start_thumbnail_pool(app)
+start_transcode_worker(app)
+start_upload_sweeper(app)
 
 # ==========================================
 # EVENTOS DE APLICACIÓN
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# add_content_hash_to_videos.py - Migración a almacenamiento direccionado por contenido
+
+import os
+import sys
+import logging
+import argparse
+import hashlib
+from collections import defaultdict
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_of(path):
+    """Calcula el SHA-256 de un archivo por bloques"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def add_content_hash_column(conn):
+    """Añade la columna content_hash y la tabla video_blobs si no existen"""
+    try:
+        conn.execute(text("SELECT content_hash FROM videos LIMIT 1"))
+        logger.info("La columna content_hash ya existe en la tabla videos")
+    except SQLAlchemyError:
+        conn.rollback()
+        logger.info("La columna content_hash no existe. Procediendo a crearla...")
+        conn.execute(text("ALTER TABLE videos ADD COLUMN content_hash VARCHAR(64)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_videos_content_hash ON videos (content_hash)"))
+        logger.info("Columna content_hash añadida correctamente")
+
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS video_blobs (
+            id SERIAL PRIMARY KEY,
+            content_hash VARCHAR(64) NOT NULL UNIQUE,
+            file_path VARCHAR(500) NOT NULL,
+            file_size INTEGER,
+            ref_count INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_video_blobs_content_hash ON video_blobs (content_hash)"))
+    conn.commit()
+
+
+def backfill_hashes(conn, dry_run=False):
+    """
+    Calcula el hash de los videos existentes y los agrupa en blobs
+
+    Los videos con el mismo contenido pasan a apuntar al archivo del primero y
+    los archivos duplicados se eliminan (salvo en modo --dry-run).
+    """
+    rows = conn.execute(text(
+        "SELECT id, file_path FROM videos WHERE content_hash IS NULL ORDER BY id"
+    )).fetchall()
+    logger.info(f"{len(rows)} videos sin hash de contenido")
+
+    groups = defaultdict(list)
+    for video_id, file_path in rows:
+        if not file_path or not os.path.isfile(file_path):
+            logger.warning(f"Video {video_id}: archivo no encontrado ({file_path}), se omite")
+            continue
+        groups[sha256_of(file_path)].append((video_id, file_path))
+
+    duplicates = 0
+    freed_bytes = 0
+    for content_hash, videos in groups.items():
+        existing = conn.execute(
+            text("SELECT file_path FROM video_blobs WHERE content_hash = :h"),
+            {"h": content_hash}
+        ).fetchone()
+        blob_path = existing[0] if existing else videos[0][1]
+
+        for video_id, file_path in videos:
+            if file_path != blob_path:
+                duplicates += 1
+                freed_bytes += os.path.getsize(file_path)
+            logger.info(f"Video {video_id}: {content_hash[:12]} -> {blob_path}")
+
+        if dry_run:
+            continue
+
+        if existing:
+            conn.execute(
+                text("UPDATE video_blobs SET ref_count = ref_count + :n WHERE content_hash = :h"),
+                {"n": len(videos), "h": content_hash}
+            )
+        else:
+            conn.execute(
+                text("INSERT INTO video_blobs (content_hash, file_path, file_size, ref_count, created_at) "
+                     "VALUES (:h, :p, :s, :n, NOW())"),
+                {"h": content_hash, "p": blob_path, "s": os.path.getsize(blob_path), "n": len(videos)}
+            )
+        for video_id, _ in videos:
+            conn.execute(
+                text("UPDATE videos SET content_hash = :h, file_path = :p WHERE id = :id"),
+                {"h": content_hash, "p": blob_path, "id": video_id}
+            )
+        conn.commit()
+
+        # Borrar los duplicados solo después de confirmar el cambio de rutas
+        for _, file_path in videos:
+            if file_path != blob_path and os.path.exists(file_path):
+                os.remove(file_path)
+
+    logger.info(f"{len(groups)} contenidos distintos, {duplicates} duplicados "
+                f"({freed_bytes / (1024 * 1024):.1f} MB {'recuperables' if dry_run else 'liberados'})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrar videos a almacenamiento direccionado por contenido")
+    parser.add_argument("--dry-run", action="store_true", help="Calcular hashes y duplicados sin modificar nada")
+    parser.add_argument("--skip-backfill", action="store_true", help="Solo crear la columna y la tabla")
+    args = parser.parse_args()
+
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    engine = create_engine(DATABASE_URL)
+
+    try:
+        with engine.connect() as conn:
+            if not args.dry_run:
+                add_content_hash_column(conn)
+            if not args.skip_backfill:
+                backfill_hashes(conn, dry_run=args.dry_run)
+        logger.info("Migración completada exitosamente")
+    except Exception as e:
+        logger.error(f"Error en la migración: {e}")
+        sys.exit(1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# add_hot_path_indexes.py - Índices para las consultas más frecuentes
+
+"""
+Índices añadidos (todos con CREATE INDEX CONCURRENTLY, sin bloquear escrituras):
+
+- device_playlists (playlist_id): dispositivos de una playlist (invalidación de
+  manifiestos, recuentos, borrado en cascada). uix_device_playlist empieza por
+  device_id y no sirve para esta búsqueda.
+- playlist_videos (video_id): playlists que contienen un video (borrado en
+  cascada, exportaciones, índice de acceso). El orden por posición dentro de
+  una playlist ya lo cubre uix_position_playlist (playlist_id, position).
+- playlists (is_active, expiration_date): playlists vigentes del manifiesto y
+  las que PlaylistChecker debe desactivar.
+- playlists (is_active, start_date): las que PlaylistChecker debe activar.
+- devices (tienda, is_active): filtros y recuentos de dispositivos activos
+  por tienda.
+- videos (expiration_date) WHERE expiration_date IS NOT NULL: videos próximos
+  a expirar; parcial porque la mayoría de los videos no tiene fecha.
+
+Para medir el efecto: migrations/benchmark_hot_path_indexes.py
+"""
+
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+# (nombre, tabla, definición)
+HOT_PATH_INDEXES = [
+    ("ix_device_playlists_playlist_id", "device_playlists", "(playlist_id)"),
+    ("ix_playlist_videos_video_id", "playlist_videos", "(video_id)"),
+    ("ix_playlists_active_expiration", "playlists", "(is_active, expiration_date)"),
+    ("ix_playlists_active_start", "playlists", "(is_active, start_date)"),
+    ("ix_devices_tienda_active", "devices", "(tienda, is_active)"),
+    ("ix_videos_expiration_date", "videos", "(expiration_date) WHERE expiration_date IS NOT NULL"),
+]
+
+
+def create_hot_path_indexes(conn, concurrently: bool = True):
+    """
+    Crea los índices que falten
+
+    Args:
+        conn: Conexión en modo AUTOCOMMIT (CONCURRENTLY no admite transacciones)
+        concurrently: Usar CREATE INDEX CONCURRENTLY
+    """
+    mode = "CONCURRENTLY " if concurrently else ""
+    for name, table, definition in HOT_PATH_INDEXES:
+        # Un CREATE INDEX CONCURRENTLY interrumpido deja un índice inválido que
+        # IF NOT EXISTS daría por bueno: eliminarlo y crearlo de nuevo
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            logger.warning(f"Índice inválido {name}, se vuelve a crear")
+            conn.execute(text(f"DROP INDEX {mode}IF EXISTS {name}"))
+
+        conn.execute(text(f"CREATE INDEX {mode}IF NOT EXISTS {name} ON {table} {definition}"))
+        logger.info(f"Índice {name} listo")
+
+    # Estadísticas actualizadas para que el planificador use los índices
+    for table in sorted({table for _, table, _ in HOT_PATH_INDEXES}):
+        conn.execute(text(f"ANALYZE {table}"))
+
+
+def drop_hot_path_indexes(conn):
+    """Elimina los índices (usado por el benchmark para medir sin ellos)"""
+    for name, _, _ in HOT_PATH_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+if __name__ == "__main__":
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    try:
+        engine = create_engine(DATABASE_URL)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            create_hot_path_indexes(conn)
+        logger.info("Migración completada")
+    except Exception as e:
+        logger.error(f"Error en la migración: {e}")
+        sys.exit(1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# add_media_metadata_to_videos.py - Columnas de metadatos técnicos de video
+
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+COLUMNS = [
+    ("width", "INTEGER"),
+    ("height", "INTEGER"),
+    ("video_codec", "VARCHAR(50)"),
+    ("audio_codec", "VARCHAR(50)"),
+    ("bitrate", "INTEGER"),
+    ("container", "VARCHAR(50)"),
+    ("probed_at", "TIMESTAMP"),
+]
+
+
+def add_media_columns():
+    """Añade las columnas de metadatos a la tabla videos si no existen"""
+    engine = create_engine(DATABASE_URL)
+
+    with engine.connect() as conn:
+        for name, column_type in COLUMNS:
+            conn.execute(text(f"ALTER TABLE videos ADD COLUMN IF NOT EXISTS {name} {column_type}"))
+            logger.info(f"Columna {name} lista")
+        conn.commit()
+
+
+if __name__ == "__main__":
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    try:
+        add_media_columns()
+        logger.info("Migración completada. Para rellenar la biblioteca existente: python -m services.media_probe")
+    except Exception as e:
+        logger.error(f"Error en la migración: {e}")
+        sys.exit(1)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# add_search_trigram_indexes.py - Extensión pg_trgm e índices GIN para las búsquedas
+
+"""
+Crea la extensión pg_trgm y un índice GIN gin_trgm_ops sobre el documento de
+búsqueda de dispositivos, playlists, videos y usuarios. Las expresiones se
+generan con services/search.py para que coincidan exactamente con las de las
+consultas (si no coinciden, PostgreSQL no usa el índice).
+"""
+
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Raíz del proyecto, para importar services.search
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.search import SEARCH_SPECS
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+
+def create_search_indexes(conn):
+    """
+    Crea pg_trgm y los índices que falten
+
+    Args:
+        conn: Conexión en modo AUTOCOMMIT (CONCURRENTLY no admite transacciones)
+    """
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    logger.info("Extensión pg_trgm lista")
+
+    for spec in SEARCH_SPECS:
+        # Un CREATE INDEX CONCURRENTLY interrumpido deja un índice inválido
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+        ), {"name": spec.index_name}).first()
+        if invalid:
+            logger.warning(f"Índice inválido {spec.index_name}, se vuelve a crear")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {spec.index_name}"))
+
+        conn.execute(text(spec.index_ddl()))
+        conn.execute(text(f"ANALYZE {spec.table}"))
+        logger.info(f"Índice {spec.index_name} listo")
+
+
+if __name__ == "__main__":
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    try:
+        engine = create_engine(DATABASE_URL)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            create_search_indexes(conn)
+        logger.info("Migración completada")
+    except Exception as e:
+        logger.error(f"Error en la migración: {e}")
+        sys.exit(1)
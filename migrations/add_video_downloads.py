@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# add_video_downloads.py - Tabla de descargas por dispositivo (progreso del despliegue)
+
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+
+def create_downloads_table():
+    """Crea video_downloads si no existe"""
+    engine = create_engine(DATABASE_URL)
+
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS video_downloads (
+                id SERIAL PRIMARY KEY,
+                device_id VARCHAR NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+                video_id INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+                first_fetched_at TIMESTAMP DEFAULT NOW(),
+                last_fetched_at TIMESTAMP DEFAULT NOW(),
+                fetch_count INTEGER NOT NULL DEFAULT 1,
+                CONSTRAINT uq_video_download_device UNIQUE (device_id, video_id)
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_video_downloads_video_id ON video_downloads (video_id)"))
+        conn.commit()
+        logger.info("Tabla video_downloads lista")
+
+
+if __name__ == "__main__":
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    try:
+        create_downloads_table()
+        logger.info("Migración completada")
+    except Exception as e:
+        logger.error(f"Error en la migración: {e}")
+        sys.exit(1)
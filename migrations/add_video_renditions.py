@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# add_video_renditions.py - Tabla de versiones recodificadas (y cola de trabajos)
+
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+
+def create_renditions_table():
+    """Crea video_renditions si no existe"""
+    engine = create_engine(DATABASE_URL)
+
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS video_renditions (
+                id SERIAL PRIMARY KEY,
+                video_id INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+                profile VARCHAR(20) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                file_path VARCHAR(500),
+                file_size BIGINT,
+                content_hash VARCHAR(64),
+                width INTEGER,
+                height INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT NOW(),
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                CONSTRAINT uq_video_rendition_profile UNIQUE (video_id, profile)
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_video_renditions_video_id ON video_renditions (video_id)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_video_renditions_status ON video_renditions (status)"))
+        conn.commit()
+        logger.info("Tabla video_renditions lista")
+
+
+if __name__ == "__main__":
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    try:
+        create_renditions_table()
+        logger.info("Migración completada. Para encolar la biblioteca existente: python -m services.transcoding")
+    except Exception as e:
+        logger.error(f"Error en la migración: {e}")
+        sys.exit(1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# add_video_uploads.py - Tabla de subidas reanudables y tamaños de archivo de 64 bits
+
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+
+def migrate():
+    """Crea video_uploads y amplía file_size a BIGINT (videos de más de 2 GB)"""
+    engine = create_engine(DATABASE_URL)
+
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS video_uploads (
+                id VARCHAR(36) PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                description TEXT,
+                expiration_date TIMESTAMP,
+                filename VARCHAR(255),
+                upload_length BIGINT NOT NULL,
+                upload_offset BIGINT NOT NULL DEFAULT 0,
+                temp_path VARCHAR(500) NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        logger.info("Tabla video_uploads lista")
+
+        conn.execute(text("ALTER TABLE videos ALTER COLUMN file_size TYPE BIGINT"))
+        conn.execute(text("""
+            DO $$
+            BEGIN
+                IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'video_blobs') THEN
+                    ALTER TABLE video_blobs ALTER COLUMN file_size TYPE BIGINT;
+                END IF;
+            END $$
+        """))
+        logger.info("Columnas file_size ampliadas a BIGINT")
+
+        conn.commit()
+
+
+if __name__ == "__main__":
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    try:
+        migrate()
+        logger.info("Migración completada exitosamente")
+    except Exception as e:
+        logger.error(f"Error en la migración: {e}")
+        sys.exit(1)
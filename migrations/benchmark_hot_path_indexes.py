@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# benchmark_hot_path_indexes.py - Planes y latencias de las consultas frecuentes con y sin índices
+
+"""
+Crea un esquema temporal en la base de datos configurada, lo llena con una
+flota simulada (tiendas, dispositivos, playlists y videos), y ejecuta las
+consultas frecuentes del servidor dos veces: sin los índices de
+add_hot_path_indexes.py y con ellos. Para cada consulta muestra el plan
+(EXPLAIN ANALYZE) y la latencia mediana y p95.
+
+El esquema se elimina al terminar (salvo con --keep); las tablas reales no se tocan.
+
+Uso:
+    python migrations/benchmark_hot_path_indexes.py --devices 5000 --playlists 3000
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+from add_hot_path_indexes import create_hot_path_indexes, drop_hot_path_indexes
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+load_dotenv()
+
+
+user_db = os.environ.get('POSTGRES_USER')
+password_db = os.environ.get('POSTGRES_PASSWORD')
+db = os.environ.get('POSTGRES_DB')
+server_db = os.environ.get('POSTGRES_HOST')
+
+DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
+
+SCHEMA = "index_benchmark"
+
+# Columnas que usan las consultas medidas, con las mismas restricciones que los modelos
+SCHEMA_DDL = [
+    """CREATE TABLE videos (
+        id SERIAL PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        file_path VARCHAR(500) NOT NULL,
+        duration INTEGER,
+        expiration_date TIMESTAMP
+    )""",
+    """CREATE TABLE playlists (
+        id SERIAL PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        start_date TIMESTAMP,
+        expiration_date TIMESTAMP,
+        is_active BOOLEAN DEFAULT TRUE,
+        updated_at TIMESTAMP DEFAULT NOW()
+    )""",
+    """CREATE TABLE playlist_videos (
+        id SERIAL PRIMARY KEY,
+        playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+        video_id INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+        position INTEGER DEFAULT 0,
+        CONSTRAINT uix_position_playlist UNIQUE (playlist_id, position)
+    )""",
+    """CREATE TABLE devices (
+        id SERIAL PRIMARY KEY,
+        device_id VARCHAR UNIQUE,
+        name VARCHAR,
+        model VARCHAR,
+        tienda VARCHAR,
+        is_active BOOLEAN DEFAULT TRUE,
+        last_seen TIMESTAMP DEFAULT NOW()
+    )""",
+    """CREATE TABLE device_playlists (
+        id SERIAL PRIMARY KEY,
+        device_id VARCHAR NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+        playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+        assigned_at TIMESTAMP DEFAULT NOW(),
+        CONSTRAINT uix_device_playlist UNIQUE (device_id, playlist_id)
+    )""",
+]
+
+# Flota simulada: pocas playlists vigentes, la mayoría de videos sin expiración
+SEED_SQL = [
+    "SELECT setseed(0.42)",
+    """INSERT INTO videos (title, file_path, duration, expiration_date)
+       SELECT 'Video ' || g, '/uploads/video_' || g || '.mp4', 15 + g % 120,
+              CASE WHEN random() < 0.15 THEN NOW() + ((random() * 90 - 30) || ' days')::interval END
+       FROM generate_series(1, :videos) g""",
+    """INSERT INTO playlists (title, start_date, expiration_date, is_active)
+       SELECT 'Playlist ' || g,
+              CASE WHEN random() < 0.3 THEN NOW() + ((random() * 60 - 40) || ' days')::interval END,
+              CASE WHEN random() < 0.7 THEN NOW() + ((random() * 120 - 100) || ' days')::interval END,
+              random() < 0.25
+       FROM generate_series(1, :playlists) g""",
+    """INSERT INTO playlist_videos (playlist_id, video_id, position)
+       SELECT p.id, 1 + ((p.id * 7919 + pos * 104729) % :videos), pos
+       FROM playlists p, generate_series(0, :videos_per_playlist - 1) pos""",
+    """INSERT INTO devices (device_id, name, model, tienda, is_active)
+       SELECT 'rpi-' || g, 'Caja ' || g,
+              CASE WHEN g % 3 = 0 THEN 'Raspberry Pi 5' ELSE 'Raspberry Pi 4' END,
+              'T' || lpad((1 + g % :tiendas)::text, 4, '0'), random() < 0.9
+       FROM generate_series(1, :devices) g""",
+    """INSERT INTO device_playlists (device_id, playlist_id)
+       SELECT 'rpi-' || g, 1 + ((g * 31 + k * 977) % :playlists)
+       FROM generate_series(1, :devices) g, generate_series(0, :playlists_per_device - 1) k
+       ON CONFLICT DO NOTHING""",
+]
+
+# (nombre, SQL equivalente a la consulta de la aplicación)
+QUERIES = [
+    ("manifiesto_dispositivo", """
+        SELECT p.id FROM playlists p
+        JOIN device_playlists dp ON dp.playlist_id = p.id
+        WHERE dp.device_id = :device_id AND p.is_active
+          AND (p.expiration_date IS NULL OR p.expiration_date > NOW())"""),
+    ("manifiesto_general", """
+        SELECT id FROM playlists
+        WHERE is_active AND (expiration_date IS NULL OR expiration_date > NOW())"""),
+    ("videos_de_playlist", """
+        SELECT v.id, v.title FROM playlist_videos pv
+        JOIN videos v ON v.id = pv.video_id
+        WHERE pv.playlist_id = :playlist_id ORDER BY pv.position"""),
+    ("dispositivos_de_playlist", """
+        SELECT device_id FROM device_playlists WHERE playlist_id = :playlist_id"""),
+    ("playlists_con_video", """
+        SELECT playlist_id FROM playlist_videos WHERE video_id = :video_id"""),
+    ("playlist_checker", """
+        SELECT id FROM playlists
+        WHERE (start_date IS NOT NULL AND start_date <= NOW() AND is_active = FALSE)
+           OR (expiration_date IS NOT NULL AND expiration_date <= NOW() AND is_active = TRUE)"""),
+    ("activos_por_tienda", """
+        SELECT COUNT(*) FROM devices WHERE tienda = :tienda AND is_active"""),
+    ("videos_por_expirar", """
+        SELECT id FROM videos
+        WHERE expiration_date IS NOT NULL AND expiration_date <= NOW() + INTERVAL '1 day'"""),
+]
+
+
+def query_params(args) -> dict:
+    return {
+        "device_id": f"rpi-{args.devices // 2}",
+        "playlist_id": args.playlists // 2,
+        "video_id": args.videos // 2,
+        "tienda": "T0001",
+    }
+
+
+def seed(conn, args):
+    """Crea el esquema temporal y lo llena"""
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    conn.execute(text(f"SET search_path TO {SCHEMA}"))
+    for ddl in SCHEMA_DDL:
+        conn.execute(text(ddl))
+
+    params = {
+        "videos": args.videos,
+        "playlists": args.playlists,
+        "videos_per_playlist": args.videos_per_playlist,
+        "devices": args.devices,
+        "tiendas": args.tiendas,
+        "playlists_per_device": args.playlists_per_device,
+    }
+    started = time.perf_counter()
+    for statement in SEED_SQL:
+        conn.execute(text(statement), params)
+    conn.execute(text("ANALYZE"))
+    logger.info(f"Flota simulada creada en {time.perf_counter() - started:.1f} s: "
+                f"{args.devices} dispositivos, {args.playlists} playlists, {args.videos} videos")
+
+
+def measure(conn, params: dict, repeat: int) -> dict:
+    """Plan y latencias de cada consulta"""
+    results = {}
+    for name, sql in QUERIES:
+        plan = "\n".join(row[0] for row in conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params))
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            "plan": plan,
+            "median_ms": statistics.median(timings),
+            "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        }
+    return results
+
+
+def report(before: dict, after: dict, show_plans: bool):
+    print(f"\n{'consulta':<26}{'sin índices (ms)':>20}{'con índices (ms)':>20}{'mejora':>10}")
+    print(f"{'':<26}{'mediana / p95':>20}{'mediana / p95':>20}")
+    for name, _ in QUERIES:
+        old, new = before[name], after[name]
+        speedup = old["median_ms"] / new["median_ms"] if new["median_ms"] else float("inf")
+        print(f"{name:<26}"
+              f"{old['median_ms']:>11.3f} / {old['p95_ms']:<7.3f}"
+              f"{new['median_ms']:>11.3f} / {new['p95_ms']:<7.3f}"
+              f"{speedup:>9.1f}x")
+
+    if show_plans:
+        for name, _ in QUERIES:
+            print(f"\n=== {name} (sin índices) ===\n{before[name]['plan']}")
+            print(f"\n=== {name} (con índices) ===\n{after[name]['plan']}")
+
+
+def run(args):
+    engine = create_engine(DATABASE_URL)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        try:
+            seed(conn, args)
+            params = query_params(args)
+
+            drop_hot_path_indexes(conn)
+            conn.execute(text("ANALYZE"))
+            before = measure(conn, params, args.repeat)
+
+            create_hot_path_indexes(conn, concurrently=False)
+            after = measure(conn, params, args.repeat)
+
+            report(before, after, not args.no_plans)
+        finally:
+            if args.keep:
+                logger.info(f"Esquema {SCHEMA} conservado")
+            else:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Medir las consultas frecuentes con y sin los índices de add_hot_path_indexes.py")
+    parser.add_argument("--tiendas", type=int, default=400, help="Número de tiendas")
+    parser.add_argument("--devices", type=int, default=3000, help="Número de dispositivos")
+    parser.add_argument("--playlists", type=int, default=2000, help="Número de playlists")
+    parser.add_argument("--videos", type=int, default=8000, help="Número de videos")
+    parser.add_argument("--videos-per-playlist", type=int, default=20, help="Videos por playlist")
+    parser.add_argument("--playlists-per-device", type=int, default=5, help="Playlists asignadas por dispositivo")
+    parser.add_argument("--repeat", type=int, default=200, help="Ejecuciones de cada consulta")
+    parser.add_argument("--no-plans", action="store_true", help="No mostrar los planes de ejecución")
+    parser.add_argument("--keep", action="store_true", help=f"Conservar el esquema {SCHEMA} al terminar")
+    args = parser.parse_args()
+
+    logger.info(f"Conectando a la base de datos: {server_db}/{db}")
+    try:
+        run(args)
+    except Exception as e:
+        logger.error(f"Error en el benchmark: {e}")
+        sys.exit(1)
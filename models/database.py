@@ -1,8 +1,13 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from dotenv import load_dotenv
 import os
+
+from utils.db_pool import engine_options
+
 load_dotenv()
 # Configuración de la base de datos
 #SQLALCHEMY_DATABASE_URL = "sqlite:///./RaspDatos.db"
@@ -17,8 +22,18 @@ server_db = os.environ.get('POSTGRES_HOST')
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{user_db}:{password_db}@{server_db}/{db}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Clases de tráfico con pool propio (ver utils/db_pool.py)
+PLAYER = "player"
+ADMIN = "admin"
+
+# Motor de administración, panel y scripts
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(ADMIN, ADMIN, QueuePool, "psycopg2"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Motor de los reproductores (manifiestos, estado, latidos, descargas)
+player_engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(PLAYER, PLAYER, QueuePool, "psycopg2"))
+PlayerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=player_engine)
+
 Base = declarative_base()
 
 # Dependencia para obtener la sesión de la base de datos
@@ -27,4 +42,73 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Dependencia para los endpoints de reproductores (pool separado del panel)
+def get_player_db():
+    db = PlayerSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ==========================================
+# MOTOR ASÍNCRONO (asyncpg) PARA ENDPOINTS async def
+# ==========================================
+# Los endpoints async def no deben usar SessionLocal: cada consulta psycopg2
+# bloquea el event loop. El motor síncrono queda para scripts, tareas en hilos
+# y endpoints def (que FastAPI ejecuta en el threadpool).
+
+SQLALCHEMY_ASYNC_DATABASE_URL = os.environ.get(
+    'ASYNC_DATABASE_URL',
+    f"postgresql+asyncpg://{user_db}:{password_db}@{server_db}/{db}"
+)
+
+_async_engines = {}
+_async_sessionmakers = {}
+
+
+def get_async_engine(traffic_class: str = ADMIN):
+    """Motor asíncrono de la clase de tráfico, creado en el primer uso (asyncpg solo se importa si se necesita)"""
+    if traffic_class not in _async_engines:
+        _async_engines[traffic_class] = create_async_engine(
+            SQLALCHEMY_ASYNC_DATABASE_URL,
+            **engine_options(f"{traffic_class}_async", traffic_class, AsyncAdaptedQueuePool, "asyncpg")
+        )
+    return _async_engines[traffic_class]
+
+
+def get_async_sessionmaker(traffic_class: str = ADMIN):
+    if traffic_class not in _async_sessionmakers:
+        # Sin expire_on_commit: tras el commit los atributos no pueden recargarse sin await
+        _async_sessionmakers[traffic_class] = async_sessionmaker(
+            get_async_engine(traffic_class), class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+    return _async_sessionmakers[traffic_class]
+
+
+# Dependencia para obtener una sesión asíncrona de la base de datos
+async def get_async_db():
+    async with get_async_sessionmaker(ADMIN)() as db:
+        yield db
+
+
+# Dependencia asíncrona para los endpoints de reproductores
+async def get_player_async_db():
+    async with get_async_sessionmaker(PLAYER)() as db:
+        yield db
+
+
+def start_async_engine(app):
+    """
+    Cierra las conexiones de los motores asíncronos al apagar la app
+
+    Args:
+        app: Instancia de FastAPI
+    """
+    @app.on_event("shutdown")
+    async def dispose_async_engines():
+        for async_engine in _async_engines.values():
+            await async_engine.dispose()
@@ -1,5 +1,5 @@
 # models/models.py  Version 2.0
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, UniqueConstraint, Float, func, or_
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, UniqueConstraint, Index, Float, func, or_
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.orm import relationship
 from typing import Optional
@@ -16,7 +16,8 @@ class PlaylistVideo(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     playlist_id = Column(Integer, ForeignKey("playlists.id", ondelete="CASCADE"), nullable=False)
-    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
+    # Índice propio para buscar las playlists que contienen un video (uix_position_playlist cubre playlist_id)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False, index=True)
     position = Column(Integer, default=0)  # Campo para mantener el orden
     created_at = Column(DateTime, default=datetime.now)
     
@@ -43,6 +44,11 @@ class Playlist(Base):
     is_active = Column(Boolean, default=True)
     id_tienda = Column(String(10), nullable=True, index=True, comment="Código de ubicación/tienda (location)")
     
+    # Playlists vigentes (manifiestos) y cambios de estado por fecha (PlaylistChecker)
+    __table_args__ = (
+        Index("ix_playlists_active_expiration", "is_active", "expiration_date"),
+        Index("ix_playlists_active_start", "is_active", "start_date"),
+    )
     
     # Relación con PlaylistVideo
     playlist_videos = relationship("PlaylistVideo", back_populates="playlist", cascade="all, delete-orphan")
@@ -138,13 +144,30 @@ class Video(Base):
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     file_path = Column(String(500), nullable=False)
-    file_size = Column(Integer, nullable=True)
+    file_size = Column(BigInteger, nullable=True)
     upload_date = Column(DateTime, default=datetime.now)
     duration = Column(Integer, nullable=True)
     expiration_date = Column(DateTime, nullable=True)
+    # SHA-256 del contenido; varios videos pueden compartir el mismo blob
+    content_hash = Column(String(64), nullable=True, index=True)
+    # Metadatos técnicos obtenidos con ffprobe después de la subida
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    video_codec = Column(String(50), nullable=True)
+    audio_codec = Column(String(50), nullable=True)
+    bitrate = Column(Integer, nullable=True)
+    container = Column(String(50), nullable=True)
+    probed_at = Column(DateTime, nullable=True)
+    
+    # Solo los videos con fecha de expiración (la mayoría no la tiene)
+    __table_args__ = (
+        Index("ix_videos_expiration_date", "expiration_date", postgresql_where=expiration_date.isnot(None)),
+    )
     
     # Relación con PlaylistVideo
     playlist_videos = relationship("PlaylistVideo", back_populates="video", cascade="all, delete-orphan")
+    # Versiones recodificadas para los reproductores
+    renditions = relationship("VideoRendition", back_populates="video", cascade="all, delete-orphan")
     
     @property
     def formatted_duration(self):
@@ -156,6 +179,30 @@ class Video(Base):
         minutes, seconds = divmod(remainder, 60)
         return f"{hours:02}:{minutes:02}:{seconds:02}"
     
+    def thumbnail_url(self, size: str = "medium"):
+        """URL de la miniatura; la versión del contenido permite cachearla indefinidamente"""
+        url = f"/api/videos/{self.id}/thumbnail?size={size}"
+        if self.content_hash:
+            url += f"&v={self.content_hash[:16]}"
+        return url
+    
+    @property
+    def thumbnail(self):
+        """URL de la miniatura mediana (se genera en segundo plano si aún no existe)"""
+        return self.thumbnail_url()
+    
+    @property
+    def poster(self):
+        """URL del fotograma de portada a tamaño completo"""
+        return self.thumbnail_url("poster")
+    
+    @property
+    def resolution(self):
+        """Devuelve la resolución como ANCHOxALTO, si se conoce"""
+        if not self.width or not self.height:
+            return None
+        return f"{self.width}x{self.height}"
+    
     @property
     def formatted_file_size(self):
         """Devuelve el tamaño de archivo en un formato legible"""
@@ -169,12 +216,75 @@ class Video(Base):
                 return f"{size_bytes:.2f} {unit}"
             size_bytes /= 1024
 
+class VideoBlob(Base):
+    """Archivo de video almacenado por su contenido (SHA-256), con conteo de referencias"""
+    __tablename__ = "video_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, nullable=False, index=True)
+    file_path = Column(String(500), nullable=False)
+    file_size = Column(BigInteger, nullable=True)
+    ref_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, default=datetime.now)
+
+class VideoRendition(Base):
+    """Versión H.264 de un video para un perfil de reproductor; también es la cola de trabajos"""
+    __tablename__ = "video_renditions"
+    __table_args__ = (UniqueConstraint("video_id", "profile", name="uq_video_rendition_profile"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False, index=True)
+    profile = Column(String(20), nullable=False)
+    # pending, processing, ready, failed o source (el original ya sirve para el perfil)
+    status = Column(String(20), nullable=False, default="pending", index=True)
+    file_path = Column(String(500), nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    content_hash = Column(String(64), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    video = relationship("Video", back_populates="renditions")
+
+class VideoUpload(Base):
+    """Subida de video por partes en curso (reanudable)"""
+    __tablename__ = "video_uploads"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    title = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    expiration_date = Column(DateTime, nullable=True)
+    filename = Column(String(255), nullable=True)
+    upload_length = Column(BigInteger, nullable=False)
+    # Bytes recibidos y confirmados en disco; el siguiente PATCH debe empezar aquí
+    upload_offset = Column(BigInteger, nullable=False, default=0)
+    temp_path = Column(String(500), nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class VideoDownload(Base):
+    """Descarga completa de un video por un dispositivo (progreso del despliegue)"""
+    __tablename__ = "video_downloads"
+    __table_args__ = (UniqueConstraint("device_id", "video_id", name="uq_video_download_device"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False, index=True)
+    first_fetched_at = Column(DateTime, default=datetime.now)
+    last_fetched_at = Column(DateTime, default=datetime.now)
+    fetch_count = Column(Integer, nullable=False, default=1)
+
 class DevicePlaylist(Base):
     __tablename__ = "device_playlists"
     
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String, ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False)
-    playlist_id = Column(Integer, ForeignKey("playlists.id", ondelete="CASCADE"), nullable=False)
+    # Búsqueda inversa playlist -> dispositivos (uix_device_playlist empieza por device_id)
+    playlist_id = Column(Integer, ForeignKey("playlists.id", ondelete="CASCADE"), nullable=False, index=True)
     assigned_at = Column(DateTime, default=datetime.now)
     
     # Relaciones
@@ -211,6 +321,10 @@ class Device(Base):
     last_seen = Column(DateTime, default=func.now(), onupdate=func.now())
     registered_at = Column(DateTime, default=func.now())
     service_logs = Column(String, nullable=True)
+    # Filtros y recuentos por tienda de dispositivos activos
+    __table_args__ = (
+        Index("ix_devices_tienda_active", "tienda", "is_active"),
+    )
     # Relación con DevicePlaylist
     device_playlists = relationship("DevicePlaylist", back_populates="device", cascade="all, delete-orphan")
     # api_key = Column(String, nullable=True)
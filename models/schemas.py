@@ -26,6 +26,32 @@ class VideoResponse(VideoBase):
     file_size: Optional[int] = None
     duration: Optional[int] = None
     upload_date: datetime
+    content_hash: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    bitrate: Optional[int] = None
+    container: Optional[str] = None
+    thumbnail: Optional[str] = None
+    poster: Optional[str] = None
+    
+    class Config:
+        orm_mode = True
+
+# Esquemas para subidas por partes
+class VideoUploadCreate(VideoBase):
+    filename: Optional[str] = None
+    upload_length: int = Field(..., gt=0, description="Tamaño total del archivo en bytes")
+
+class VideoUploadResponse(BaseModel):
+    id: str
+    title: str
+    filename: Optional[str] = None
+    upload_length: int
+    upload_offset: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         orm_mode = True
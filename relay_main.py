@@ -0,0 +1,61 @@
+# relay_main.py - Relé de tienda: caché local de videos y manifiestos
+
+"""
+Servidor ligero para un equipo de la tienda. Los reproductores se configuran
+con la URL del relé en lugar de la del servidor central; el relé no necesita
+base de datos.
+
+    RELAY_UPSTREAM_URL=https://central.ejemplo.com python relay_main.py
+
+Ver router/relay.py para la configuración.
+"""
+
+import os
+import logging
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI
+
+load_dotenv()
+
+from router import relay
+from services.relay_cache import RelayBlobCache
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="Relé de tienda",
+    description="Caché local de videos y manifiestos del servidor central",
+    version="1.0.0"
+)
+app.include_router(relay.router)
+
+
+@app.on_event("startup")
+async def startup_event():
+    if not relay.RELAY_UPSTREAM_URL:
+        raise RuntimeError("Falta RELAY_UPSTREAM_URL")
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(relay.RELAY_TIMEOUT),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    cache = RelayBlobCache(relay.RELAY_CACHE_DIR, relay.RELAY_CACHE_MAX_BYTES)
+    relay.store_relay = relay.StoreRelay(relay.RELAY_UPSTREAM_URL, cache, client)
+    logger.info(f"Relé iniciado hacia {relay.RELAY_UPSTREAM_URL} (caché en {relay.RELAY_CACHE_DIR})")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if relay.store_relay is not None:
+        await relay.store_relay.client.aclose()
+        relay.store_relay = None
+
+
+if __name__ == "__main__":
+    uvicorn.run("relay_main:app", host="0.0.0.0", port=int(os.getenv("RELAY_PORT", "8080")))
@@ -2,29 +2,35 @@
 
 # router/client_api.py - API para clientes externos
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Path
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Path, Query
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.background import BackgroundTask
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 from datetime import datetime, timedelta
 import os
-import json
-import uuid
 import jwt
 from pydantic import BaseModel
 
-from models.database import get_db
+from models.database import get_player_async_db
 from models.models import Playlist, Video, User, Device, DevicePlaylist
+from services.manifest_cache import get_manifest, manifest_response, manifest_cache, CLIENT, VIDEO_URL_TEMPLATES
+from services.manifest_delta import diff_manifest
+from services.heartbeat_buffer import heartbeat_buffer
+from services.client_auth import DevicePrincipal, client_token_cache
+from services.transcoding import profile_for_model, resolve_download_path
+from services.playlist_export import CLIENT as EXPORT_CLIENT, build_client_export, export_filename, export_response, playlist_export_cache
+from services.playlist_bundle import build_playlist_bundle, bundle_filename, bundle_response
+from services.rollout import admit_download, record_download_in_background
+from services.video_access import video_access_index
 
 # Configuración desde variables de entorno
 from dotenv import load_dotenv
 load_dotenv()
 
-# Directorios para archivos
-PLAYLIST_DIR = "temp/playlists"
-os.makedirs(PLAYLIST_DIR, exist_ok=True)
-
 # Configuración JWT
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "un_secreto_muy_seguro")
 ALGORITHM = "HS256"
@@ -57,9 +63,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_client(request: Request, db: Session = Depends(get_db)):
+async def _get_device(db: AsyncSession, device_id: str) -> Optional[Device]:
+    result = await db.execute(select(Device).where(Device.device_id == device_id))
+    return result.scalars().first()
+
+async def get_current_client(request: Request, db: AsyncSession = Depends(get_player_async_db)) -> DevicePrincipal:
     """
     Verifica el token JWT y retorna el dispositivo cliente si es válido.
+    Los tokens ya verificados se resuelven desde memoria, sin decodificar ni consultar la BD.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -81,30 +92,42 @@ async def get_current_client(request: Request, db: Session = Depends(get_db)):
     if scheme.lower() != "bearer":
         raise credentials_exception
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        client_id: str = payload.get("sub")
-        if client_id is None:
+    principal = client_token_cache.get(token)
+    if principal is None:
+        generation = client_token_cache.generation
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            client_id: str = payload.get("sub")
+            if client_id is None:
+                raise credentials_exception
+        except jwt.PyJWTError:
+            raise credentials_exception
+            
+        # Verificar si es un dispositivo registrado
+        device = await _get_device(db, client_id)
+        if device is None:
             raise credentials_exception
-    except jwt.PyJWTError:
-        raise credentials_exception
         
-    # Verificar si es un dispositivo registrado
-    device = db.query(Device).filter(Device.device_id == client_id).first()
-    if device is None:
-        raise credentials_exception
+        principal = DevicePrincipal.from_device(device)
+        client_token_cache.put(token, principal, payload.get("exp"), generation)
+    
+    # Un dispositivo desactivado deja de autenticarse, igual que en /login
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Este dispositivo está desactivado",
+        )
         
-    # Actualizar última conexión
-    device.last_seen = datetime.now()
-    db.commit()
+    # Actualizar última conexión (escritura diferida, sin commit por petición)
+    heartbeat_buffer.record(principal.device_id)
     
-    return device
+    return principal
 
 # Endpoint de login
 @router.post("/login", response_model=Token)
 async def login_for_access_token(
     auth_data: ClientAuth,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_player_async_db)
 ):
     """
     Endpoint para que los clientes obtengan un token de autenticación.
@@ -115,7 +138,7 @@ async def login_for_access_token(
     Retorna un token JWT válido por 24 horas
     """
     # Buscar dispositivo
-    device = db.query(Device).filter(Device.device_id == auth_data.client_id).first()
+    device = await _get_device(db, auth_data.client_id)
     
     if not device:
         raise HTTPException(
@@ -140,9 +163,9 @@ async def login_for_access_token(
     if not has_api_key:
         try:
             device.api_key = auth_data.client_secret
-            db.commit()
+            await db.commit()
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             # Si falla al añadir la api_key, continuamos de todos modos
             print(f"No se pudo asignar api_key al dispositivo: {e}")
     
@@ -162,7 +185,7 @@ async def login_for_access_token(
     
     # Actualizar última conexión
     device.last_seen = datetime.now()
-    db.commit()
+    await db.commit()
     
     return {
         "access_token": access_token,
@@ -174,88 +197,93 @@ async def login_for_access_token(
 @router.get("/playlists", response_model=List[dict])
 async def get_client_playlists(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_player_async_db)
 ):
     """
     Obtiene todas las listas de reproducción asignadas al dispositivo autenticado.
     Solo retorna listas activas y no expiradas.
+    Incluye un ETag con la versión del manifiesto y admite If-None-Match.
     """
     # Verificar autenticación
     current_client = await get_current_client(request, db)
     
-    now = datetime.now()
-    
-    # Obtener listas asignadas al dispositivo
-    query = db.query(Playlist).join(
-        DevicePlaylist,
-        DevicePlaylist.playlist_id == Playlist.id
-    ).filter(
-        Playlist.is_active == True,
-        (Playlist.expiration_date == None) | (Playlist.expiration_date > now),
-        DevicePlaylist.device_id == current_client.device_id
-    )
-    
-    playlists = query.all()
+    # Manifiesto desde la caché; responde 304 si el cliente ya tiene esta versión
+    entry = await db.run_sync(get_manifest, current_client.device_id, CLIENT)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     
-    result = []
-    for playlist in playlists:
-        # Filtrar videos que no hayan expirado
-        active_videos = [
-            video for video in playlist.videos 
-            if not video.expiration_date or video.expiration_date > now
-        ]
-        
-        # Solo incluir playlists con al menos un video activo
-        if active_videos:
-            playlist_data = {
-                "id": playlist.id,
-                "title": playlist.title,
-                "description": playlist.description,
-                "expiration_date": playlist.expiration_date.isoformat() if playlist.expiration_date else None,
-                "videos": [
-                    {
-                        "id": video.id,
-                        "title": video.title,
-                        "file_path": f"/api/client/videos/{video.id}/download",
-                        "duration": video.duration,
-                        "expiration_date": video.expiration_date.isoformat() if video.expiration_date else None
-                    }
-                    for video in active_videos
-                ]
-            }
-            result.append(playlist_data)
-    
-    return result
+    return manifest_response(request, entry)
 
-# Endpoint para descargar una playlist completa
-@router.get("/playlists/{playlist_id}/download")
-async def download_client_playlist(
+# Endpoint de sincronización incremental del manifiesto
+@router.get("/playlists/delta")
+async def get_client_playlists_delta(
     request: Request,
-    playlist_id: int = Path(..., description="ID de la playlist a descargar"),
-    db: Session = Depends(get_db)
+    since: Optional[str] = Query(None, description="Versión del manifiesto que tiene el cliente (ETag sin comillas)"),
+    db: AsyncSession = Depends(get_player_async_db)
 ):
     """
-    Descarga una lista de reproducción específica como archivo JSON.
-    Verifica que el cliente tenga acceso a esta playlist.
+    Devuelve solo los cambios del manifiesto desde la versión indicada.
+    
+    - Si la versión coincide con la actual responde 304 Not Modified.
+    - Si el servidor aún recuerda esa versión devuelve playlists añadidas,
+      eliminadas y actualizadas (videos añadidos, eliminados o modificados).
+    - Si no la recuerda (o no se indica) devuelve el manifiesto completo con full=true.
     """
     # Verificar autenticación
     current_client = await get_current_client(request, db)
     
-    # Buscar la playlist
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
-    if not playlist:
-        raise HTTPException(status_code=404, detail="Lista de reproducción no encontrada")
+    entry = await db.run_sync(get_manifest, current_client.device_id, CLIENT)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
+    
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if since == entry.version:
+        return Response(status_code=304, headers=headers)
+    
+    previous = manifest_cache.summary_for(current_client.device_id, CLIENT, since) if since else None
+    if previous is None:
+        # No se puede calcular el delta: enviar snapshot completo
+        return JSONResponse(
+            content={
+                "version": entry.version,
+                "base_version": since,
+                "full": True,
+                "playlists": entry.payload
+            },
+            headers=headers
+        )
     
-    # Verificar que la playlist esté asignada al dispositivo
-    device_has_playlist = db.query(Playlist).join(
+    return JSONResponse(
+        content={
+            "version": entry.version,
+            "base_version": since,
+            "full": False,
+            "playlists": diff_manifest(previous, entry.payload)
+        },
+        headers=headers
+    )
+
+def get_client_playlist(db: Session, playlist_id: int, current_client: DevicePrincipal) -> Playlist:
+    """
+    Playlist asignada al dispositivo, activa y sin expirar (404/403 en caso contrario)
+    """
+    # Buscar la playlist y su asignación al dispositivo en una consulta; los
+    # videos (que usan la exportación y el tar) en una segunda
+    row = db.query(Playlist, DevicePlaylist.id).outerjoin(
         DevicePlaylist,
-        DevicePlaylist.playlist_id == Playlist.id
-    ).filter(
-        Playlist.id == playlist_id,
-        DevicePlaylist.device_id == current_client.device_id
-    ).first()
+        and_(
+            DevicePlaylist.playlist_id == Playlist.id,
+            DevicePlaylist.device_id == current_client.device_id
+        )
+    ).options(
+        selectinload(Playlist.videos)
+    ).filter(Playlist.id == playlist_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Lista de reproducción no encontrada")
     
-    if not device_has_playlist:
+    # Verificar que la playlist esté asignada al dispositivo
+    playlist, assignment_id = row
+    if assignment_id is None:
         raise HTTPException(
             status_code=403, 
             detail="Este dispositivo no tiene acceso a esta lista de reproducción"
@@ -268,40 +296,54 @@ async def download_client_playlist(
             status_code=403,
             detail="Esta lista de reproducción no está activa o ha expirado"
         )
+    return playlist
+
+# Endpoint para descargar una playlist completa
+@router.get("/playlists/{playlist_id}/download")
+async def download_client_playlist(
+    request: Request,
+    playlist_id: int = Path(..., description="ID de la playlist a descargar"),
+    db: AsyncSession = Depends(get_player_async_db)
+):
+    """
+    Descarga una lista de reproducción específica como archivo JSON.
+    Verifica que el cliente tenga acceso a esta playlist.
+    """
+    # Verificar autenticación
+    current_client = await get_current_client(request, db)
     
-    # Crear archivo JSON con la información
-    playlist_data = {
-        "id": playlist.id,
-        "title": playlist.title,
-        "description": playlist.description,
-        "start_date": playlist.start_date.isoformat() if playlist.start_date else None,
-        "expiration_date": playlist.expiration_date.isoformat() if playlist.expiration_date else None,
-        "videos": [
-            {
-                "id": video.id,
-                "title": video.title,
-                "description": video.description,
-                "file_path": f"/api/client/videos/{video.id}/download",
-                "duration": video.duration,
-                "expiration_date": video.expiration_date.isoformat() if video.expiration_date else None
-            }
-            for video in playlist.videos
-            if not video.expiration_date or video.expiration_date > now
-        ]
-    }
-    
-    # Crear archivo temporal
-    playlist_filename = f"playlist_{playlist.id}_{uuid.uuid4()}.json"
-    playlist_file_path = os.path.join(PLAYLIST_DIR, playlist_filename)
-    
-    with open(playlist_file_path, "w") as f:
-        json.dump(playlist_data, f, indent=4)
+    playlist = await db.run_sync(get_client_playlist, playlist_id, current_client)
     
-    # Retornar archivo para descarga
-    return FileResponse(
-        path=playlist_file_path, 
-        filename=f"playlist_{playlist.title.replace(' ', '_')}.json", 
-        media_type="application/json"
+    # Exportación serializada y comprimida en memoria, válida hasta que se edite la playlist
+    export = await db.run_sync(
+        lambda session: playlist_export_cache.get_or_build(EXPORT_CLIENT, playlist, build_client_export)
+    )
+    return export_response(request, export, export_filename(playlist))
+
+# Endpoint para descargar una playlist con todos sus videos en un tar
+@router.get("/playlists/{playlist_id}/bundle")
+@router.head("/playlists/{playlist_id}/bundle")
+async def download_client_playlist_bundle(
+    request: Request,
+    playlist_id: int = Path(..., description="ID de la playlist a descargar"),
+    member: int = Query(0, ge=0, description="Primer video a incluir (reanudación por miembro)"),
+    db: AsyncSession = Depends(get_player_async_db)
+):
+    """
+    Descarga en un único tar el manifiesto de la playlist y todos sus videos activos,
+    en la versión recodificada para el modelo del dispositivo cuando está lista.
+    Admite Range/If-Range sobre el mismo tar, o reanudar desde un video con ?member=.
+    """
+    current_client = await get_current_client(request, db)
+    playlist = await db.run_sync(get_client_playlist, playlist_id, current_client)
+
+    layout, video_ids = await db.run_sync(
+        build_playlist_bundle, playlist, VIDEO_URL_TEMPLATES[CLIENT],
+        profile=profile_for_model(current_client.model), first_member=member
+    )
+    return bundle_response(
+        request, layout, bundle_filename(playlist), video_ids,
+        tienda=current_client.tienda, device_id=current_client.device_id
     )
 
 # Endpoint para descargar un video
@@ -309,7 +351,8 @@ async def download_client_playlist(
 async def download_client_video(
     request: Request,
     video_id: int = Path(..., description="ID del video a descargar"),
-    db: Session = Depends(get_db)
+    rendition: Optional[str] = Query(None, description="Perfil de versión recodificada"),
+    db: AsyncSession = Depends(get_player_async_db)
 ):
     """
     Descarga un video específico.
@@ -319,7 +362,7 @@ async def download_client_video(
     current_client = await get_current_client(request, db)
     
     # Buscar el video
-    video = db.query(Video).filter(Video.id == video_id).first()
+    video = await db.get(Video, video_id)
     if not video:
         raise HTTPException(status_code=404, detail="Video no encontrado")
     
@@ -328,33 +371,33 @@ async def download_client_video(
     if video.expiration_date and video.expiration_date <= now:
         raise HTTPException(status_code=403, detail="Este video ha expirado")
     
-    # Verificar que el video esté en alguna playlist asignada al dispositivo
-    video_in_device_playlist = db.query(Video).join(
-        "playlists"
-    ).join(
-        DevicePlaylist,
-        DevicePlaylist.playlist_id == Playlist.id
-    ).filter(
-        Video.id == video_id,
-        DevicePlaylist.device_id == current_client.device_id
-    ).first()
-    
-    if not video_in_device_playlist:
+    # Verificar que el video esté en alguna playlist asignada al dispositivo (índice en memoria)
+    if not await db.run_sync(video_access_index.allows, current_client.device_id, video_id):
         raise HTTPException(
             status_code=403, 
             detail="Este dispositivo no tiene acceso a este video"
         )
     
+    # Versión del perfil del dispositivo si está lista; si no, el original
+    file_path = await db.run_sync(resolve_download_path, video, rendition)
+    
     # Comprobar que el archivo existe
-    if not os.path.exists(video.file_path):
+    if not os.path.exists(file_path):
         raise HTTPException(
             status_code=404,
             detail="El archivo de video no se encuentra en el servidor"
         )
     
+    # Cubetas de tokens del despliegue escalonado (global y por tienda)
+    completes = admit_download(request, os.path.getsize(file_path), current_client.tienda)
+    background = None
+    if completes:
+        background = BackgroundTask(record_download_in_background, current_client.device_id, video.id)
+    
     # Retornar archivo para descarga
     return FileResponse(
-        path=video.file_path,
-        filename=os.path.basename(video.file_path),
-        media_type="video/mp4"  # Ajustar según el tipo de archivo
+        path=file_path,
+        filename=os.path.basename(file_path),
+        media_type="video/mp4",  # Ajustar según el tipo de archivo
+        background=background
     )
\ No newline at end of file
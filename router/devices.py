@@ -1,16 +1,22 @@
 # app/routers/devices.py
 from tempfile import template
 from fastapi import APIRouter, HTTPException, Depends, status, Form, Request, Query, Body # type: ignore
-from fastapi.responses import PlainTextResponse, HTMLResponse, JSONResponse  # type: ignore
+from fastapi.responses import PlainTextResponse, HTMLResponse, JSONResponse, Response, StreamingResponse  # type: ignore
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session # type: ignore
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload # type: ignore
 from typing import List, Optional
 from datetime import datetime
 from models import models, schemas
-from models.database import get_db
-from utils.ping_checker import check_device_status, ping_host
+from models.database import get_async_db, get_db, get_player_db
+from services.pagination import keyset_paginate, set_page_headers, sort_column_for, total_count
+from services.search import DEVICE_SEARCH, apply_search, device_search_columns
+from utils.ping_checker import PING_CONCURRENCY, check_device_status, ping_host, stream_device_status
+from utils.query_budget import query_budget
 from utils.hostname_changer import change_hostname, validate_ssh_credentials
 import os
+import json
 import logging
 from fastapi.logger import logger # type: ignore
 import requests
@@ -24,9 +30,18 @@ router = APIRouter(
 
 templates = Jinja2Templates(directory="templates")
 
+# Columnas por las que se puede ordenar el listado (paginación por cursor)
+DEVICE_SORT_COLUMNS = {
+    "id": models.Device.id,
+    "device_id": models.Device.device_id,
+    "name": models.Device.name,
+    "tienda": models.Device.tienda,
+    "last_seen": models.Device.last_seen,
+}
+
 
 @router.post("/register", response_model=schemas.Device, status_code=status.HTTP_201_CREATED)
-def register_device(device: schemas.DeviceCreate, db: Session = Depends(get_db)):
+def register_device(device: schemas.DeviceCreate, db: Session = Depends(get_player_db)):
     try:
         # Debug: Imprimir datos recibidos
         logger.info(f"Datos recibidos para registro: {device.dict()}")
@@ -120,16 +135,37 @@ def register_device(device: schemas.DeviceCreate, db: Session = Depends(get_db))
     
     
 @router.get("/", response_model=List[schemas.Device])
+@query_budget(2)
 def get_devices(
+    request: Request,
+    response: Response,
     skip: int = 0, 
-    limit: int = 1000, 
+    limit: int = Query(1000, ge=1),
     active_only: bool = False,
+    cursor: Optional[str] = Query(None, description="Cursor de la cabecera X-Next-Cursor"),
+    sort: str = Query("id", description="id, device_id, name, tienda o last_seen"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include_total: bool = False,
     db: Session = Depends(get_db)
 ):
+    """
+    Lista de dispositivos paginada por cursor
+
+    La página siguiente se indica en las cabeceras X-Next-Cursor y Link;
+    skip sigue funcionando para los clientes antiguos.
+    """
+    sort_column = sort_column_for(DEVICE_SORT_COLUMNS, sort, "id")
     query = db.query(models.Device)
     if active_only:
         query = query.filter(models.Device.is_active == True)
-    return query.offset(skip).limit(limit).all()
+    # schemas.Device incluye las playlists: cargarlas todas en una consulta
+    page = keyset_paginate(query.options(selectinload(models.Device.playlists)), sort_column,
+                           models.Device.id, limit, cursor=cursor, descending=order == "desc", offset=skip)
+    total = None
+    if include_total:
+        total = total_count(db, query, models.Device.__tablename__, ("active",) if active_only else ())
+    set_page_headers(request, response, page, total)
+    return page.items
 
 @router.get("/{device_id}", response_model=schemas.Device)
 def get_device(device_id: str, db: Session = Depends(get_db)):
@@ -163,7 +199,7 @@ def delete_device(device_id: str, db: Session = Depends(get_db)):
     return {"status": "success"}
 
 @router.post("/status", response_model=schemas.Device)
-def update_device_status(status_update: schemas.DeviceStatus, db: Session = Depends(get_db)):
+def update_device_status(status_update: schemas.DeviceStatus, db: Session = Depends(get_player_db)):
     # Buscar el dispositivo en la base de datos
     device = db.query(models.Device).filter(models.Device.device_id == status_update.device_id).first()
     if device is None:
@@ -216,20 +252,24 @@ def update_device_status(status_update: schemas.DeviceStatus, db: Session = Depe
 
 # Endpoint para verificar el estado de un dispositivo mediante ping
 @router.get("/{device_id}/ping", response_model=dict)
-async def ping_device(device_id: str, db: Session = Depends(get_db)):
+async def ping_device(device_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Verifica el estado de un dispositivo mediante ping a ambas interfaces (LAN y WiFi)
     """
-    device = db.query(models.Device).filter(models.Device.device_id == device_id).first()
+    result = await db.execute(select(models.Device).where(models.Device.device_id == device_id))
+    device = result.scalars().first()
     if device is None:
         raise HTTPException(status_code=404, detail="Device not found")
     
+    # Cerrar la transacción de lectura: la conexión vuelve al pool mientras dura el ping
+    await db.commit()
+    
     # Realizar ping a ambas interfaces y actualizar el estado
     result = await check_device_status(device_id=device_id)
     device_result = result.get(device_id, {})
     
     # Refrescar el dispositivo desde la base de datos después de la actualización
-    db.refresh(device)
+    await db.refresh(device)
     
     # Preparar respuesta detallada
     response = {
@@ -247,11 +287,23 @@ async def ping_device(device_id: str, db: Session = Depends(get_db)):
 
 # Endpoint para verificar el estado de todos los dispositivos
 @router.get("/ping/all", response_model=dict)
-async def ping_all_devices():
+async def ping_all_devices(
+    concurrency: int = Query(PING_CONCURRENCY, ge=1, le=1000, description="Pings simultáneos como máximo"),
+    stream: bool = Query(False, description="Enviar cada resultado en cuanto termina (NDJSON)")
+):
     """
     Verifica el estado de todos los dispositivos mediante ping a ambas interfaces
+    
+    Con stream=true la respuesta es NDJSON: una línea por dispositivo según
+    van respondiendo.
     """
-    results = await check_device_status()
+    if stream:
+        async def lines():
+            async for device_id, result in stream_device_status(concurrency=concurrency):
+                yield json.dumps({"device_id": device_id, **result}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    results = await check_device_status(concurrency=concurrency)
     
     # Contar dispositivos activos e inactivos
     active_count = sum(1 for result in results.values() if result['is_active'])
@@ -272,7 +324,7 @@ async def ping_all_devices():
 
 # Endpoint para manejar servicios de los dispositivos
 @router.post("/{device_id}/service/{service_name}/{action}", response_model=schemas.ServiceActionResponse)
-async def manage_service(
+def manage_service(
     device_id: str, 
     service_name: str,
     action: str,
@@ -311,12 +363,13 @@ async def manage_service(
 async def update_device_hostname(
     device_id: str, 
     new_hostname: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Cambia el hostname de un dispositivo Raspberry Pi
     """
-    device = db.query(models.Device).filter(models.Device.device_id == device_id).first()
+    result = await db.execute(select(models.Device).where(models.Device.device_id == device_id))
+    device = result.scalars().first()
     if device is None:
         raise HTTPException(status_code=404, detail="Device not found")
     
@@ -336,6 +389,9 @@ async def update_device_hostname(
             detail="El dispositivo no está activo. Verifique la conexión antes de cambiar el hostname"
         )
     
+    # Cerrar la transacción de lectura: la conexión vuelve al pool mientras dura el SSH
+    await db.commit()
+
     # Llamar a la función que implementa el cambio de hostname
     from utils.hostname_changer import change_hostname
     result = await change_hostname(device_id, new_hostname)
@@ -348,14 +404,16 @@ async def update_device_hostname(
 
 # Endpoint para validar credenciales SSH
 @router.get("/{device_id}/ssh/validate", response_model=dict)
-async def validate_device_ssh(device_id: str, db: Session = Depends(get_db)):
+async def validate_device_ssh(device_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Verifica que se tienen las credenciales SSH necesarias para un dispositivo
     """
     try:
-        device = db.query(models.Device).filter(models.Device.device_id == device_id).first()
+        result = await db.execute(select(models.Device).where(models.Device.device_id == device_id))
+        device = result.scalars().first()
         if device is None:
             raise HTTPException(status_code=404, detail="Device not found")
+        await db.commit()
         
         # Verificar credenciales SSH
         from utils.hostname_changer import validate_ssh_credentials
@@ -368,7 +426,7 @@ async def validate_device_ssh(device_id: str, db: Session = Depends(get_db)):
         return {"success": False, "message": f"Error interno del servidor: {str(e)}"}
     
 @router.get("/{device_id}/logs", response_class=PlainTextResponse)
-async def get_device_logs(
+def get_device_logs(
     device_id: str, 
     db: Session = Depends(get_db),
     lines: int = 500
@@ -405,7 +463,7 @@ async def get_device_logs(
 
 
 @router.get("/ui/devices", response_class=HTMLResponse)
-async def list_devices(
+def list_devices(
     request: Request,
     active_only: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
@@ -422,32 +480,8 @@ async def list_devices(
     if is_active_only:
         query = query.filter(models.Device.is_active == True)
     
-    # Aplicar filtro de búsqueda si existe un término
-    if search:
-        if search_field == 'name':
-            query = query.filter(models.Device.name.ilike(f'%{search}%'))
-        elif search_field == 'location':
-            query = query.filter(models.Device.location.ilike(f'%{search}%'))
-        elif search_field == 'tienda':
-            query = query.filter(models.Device.tienda.ilike(f'%{search}%'))
-        elif search_field == 'model':
-            query = query.filter(models.Device.model.ilike(f'%{search}%'))
-        elif search_field == 'ip':
-            # Buscar en ambos campos de IP
-            query = query.filter(or_(
-                models.Device.ip_address_lan.ilike(f'%{search}%'),
-                models.Device.ip_address_wifi.ilike(f'%{search}%')
-            ))
-        else:  # 'all' o cualquier otro valor
-            # Buscar en todos los campos relevantes
-            query = query.filter(or_(
-                models.Device.name.ilike(f'%{search}%'),
-                models.Device.location.ilike(f'%{search}%'),
-                models.Device.tienda.ilike(f'%{search}%'),
-                models.Device.model.ilike(f'%{search}%'),
-                models.Device.ip_address_lan.ilike(f'%{search}%'),
-                models.Device.ip_address_wifi.ilike(f'%{search}%')
-            ))
+    # Aplicar filtro de búsqueda si existe un término (índices de trigramas, ordenado por relevancia)
+    query = apply_search(db, query, DEVICE_SEARCH, search, device_search_columns(search_field))
     
     # Ejecutar la consulta
     devices = query.order_by(models.Device.name).all()
@@ -468,26 +502,23 @@ async def list_devices(
 async def get_device_detail(
     request: Request, 
     device_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Página de detalle de un dispositivo específico
     """
-    # Realizar el query con join para cargar las playlists asociadas
-    device = db.query(models.Device).filter(models.Device.device_id == device_id).first()
+    # Cargar el dispositivo con sus playlists asociadas en la misma consulta
+    result = await db.execute(
+        select(models.Device)
+        .options(selectinload(models.Device.playlists))
+        .where(models.Device.device_id == device_id)
+    )
+    device = result.scalars().first()
     if device is None:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     
-    # Cargar explícitamente las playlists del dispositivo
-    device_playlists = db.query(models.Playlist).join(
-        models.DevicePlaylist,
-        models.DevicePlaylist.playlist_id == models.Playlist.id
-    ).filter(
-        models.DevicePlaylist.device_id == device_id
-    ).all()
-    
-    # Asignar las playlists al dispositivo
-    device.playlists = device_playlists
+    # Cerrar la transacción de lectura antes de consultar el estado al dispositivo
+    await db.commit()
     
     # Obtener fecha actual para comparaciones en la plantilla
     from datetime import datetime
@@ -520,12 +551,13 @@ async def get_device_detail(
 @router.post("/{device_id}/system/reboot", response_model=dict)
 async def restart_device(
     device_id: str, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Cambia el hostname de un dispositivo Raspberry Pi
     """
-    device = db.query(models.Device).filter(models.Device.device_id == device_id).first()
+    result = await db.execute(select(models.Device).where(models.Device.device_id == device_id))
+    device = result.scalars().first()
     if device is None:
         raise HTTPException(status_code=404, detail="Device not found")
     
@@ -537,6 +569,9 @@ async def restart_device(
             detail="El dispositivo no está activo. Verifique la conexión antes de cambiar el hostname"
         )
     
+    # Cerrar la transacción de lectura: la conexión vuelve al pool mientras dura el SSH
+    await db.commit()
+
     # Llamar a la función que implementa el cambio de hostname
     from utils.restart_host import restart_host
     result = await restart_host(device_id)
@@ -0,0 +1,56 @@
+# router/metrics.py - Métricas internas del servidor
+
+import logging
+from fastapi import APIRouter
+
+from services.client_auth import client_token_cache
+from services.heartbeat_buffer import heartbeat_buffer
+from services.manifest_cache import manifest_cache
+from services.manifest_watch import watch_hub
+from services.media_probe import media_probe_pool
+from services.playlist_export import playlist_export_cache
+from services.rollout import download_limiter
+from services.thumbnails import thumbnail_pool
+from services.transcoding import transcode_worker
+from services.video_access import video_access_index
+from utils.db_pool import pool_stats
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/metrics",
+    tags=["metrics"]
+)
+
+@router.get("/")
+def get_metrics():
+    """
+    Devuelve las métricas de los subsistemas en memoria
+    """
+    return {
+        "heartbeat": heartbeat_buffer.stats(),
+        "client_tokens": client_token_cache.stats(),
+        "manifest_cache": manifest_cache.stats(),
+        "manifest_watch": watch_hub.stats(),
+        "media_probe": media_probe_pool.stats(),
+        "playlist_export": playlist_export_cache.stats(),
+        "download_limiter": download_limiter.stats(),
+        "thumbnails": thumbnail_pool.stats(),
+        "transcoding": transcode_worker.stats(),
+        "video_access": video_access_index.stats(),
+        "db_pools": pool_stats()
+    }
+
+@router.get("/heartbeat")
+def get_heartbeat_metrics():
+    """
+    Métricas del buffer de latidos: tamaño pendiente y latencia de volcado
+    """
+    return heartbeat_buffer.stats()
+
+@router.get("/db")
+def get_db_pool_metrics():
+    """
+    Métricas de los pools de conexiones: conexiones en uso, overflow y espera por checkout
+    """
+    return pool_stats()
@@ -1,12 +1,8 @@
 # Actualización para router/playlists.py - Solo las funciones modificadas
 
-import os
-import uuid
-import json
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime
 from sqlalchemy.sql import text
 from fastapi.staticfiles import StaticFiles
@@ -15,6 +11,15 @@ from models.database import get_db
 from models.models import Playlist, Video, PlaylistVideo
 from models.schemas import PlaylistCreate, PlaylistResponse, PlaylistUpdate
 from utils.helpers import is_playlist_active
+from services.manifest_cache import VIDEO_URL_TEMPLATES, RASPBERRY
+from services.playlist_export import ADMIN, build_admin_export, export_filename, export_response, playlist_export_cache
+from services.playlist_bundle import build_playlist_bundle, bundle_filename, bundle_response
+from services.rollout import device_for_request
+from services.pagination import keyset_paginate, set_page_headers, sort_column_for, total_count
+from services.search import PLAYLIST_SEARCH, apply_search, clean_term
+from services.stats import playlist_stats
+from services.transcoding import profile_for_model
+from utils.query_budget import query_budget
 
 router = APIRouter(
     prefix="/api/playlists",
@@ -23,8 +28,26 @@ router = APIRouter(
 
 # router.mount("static", StaticFiles(directory="static/"), name="static")
 
-# Directorio para archivos de playlist
-PLAYLIST_DIR = "playlists"
+# Columnas por las que se puede ordenar el listado (paginación por cursor)
+PLAYLIST_SORT_COLUMNS = {
+    "id": Playlist.id,
+    "title": Playlist.title,
+    "creation_date": Playlist.creation_date,
+    "created_at": Playlist.creation_date,
+    "expiration_date": Playlist.expiration_date,
+}
+
+
+def _playlists_query(db: Session, active_only: bool):
+    """Consulta de playlists, opcionalmente solo las vigentes"""
+    query = db.query(Playlist)
+    if active_only:
+        now = datetime.now()
+        query = query.filter(
+            Playlist.is_active == True,
+            (Playlist.expiration_date == None) | (Playlist.expiration_date > now)
+        )
+    return query
 
 @router.post("/", response_model=PlaylistResponse)
 def create_playlist(
@@ -40,24 +63,38 @@ def create_playlist(
 
 @router.get("/", response_model=List[PlaylistResponse])
 def read_playlists(
+    request: Request,
+    response: Response,
     skip: int = 0, 
-    limit: int = 10000,  # Aumentar el límite por defecto
+    limit: int = Query(10000, ge=1),  # Aumentar el límite por defecto
     active_only: bool = False,
+    search: Optional[str] = Query(None, description="Texto a buscar en título y descripción"),
+    cursor: Optional[str] = Query(None, description="Cursor de la cabecera X-Next-Cursor"),
+    sort: str = Query("id", description="id, title, creation_date o expiration_date"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include_total: bool = False,
     db: Session = Depends(get_db)
 ):
-    query = db.query(Playlist)
-    
-    if active_only:
-        now = datetime.now()
-        query = query.filter(
-            Playlist.is_active == True,
-            (Playlist.expiration_date == None) | (Playlist.expiration_date > now)
-        )
-    
-    playlists = query.offset(skip).limit(limit).all()
-    print(f"Devolviendo {len(playlists)} playlists (límite: {limit})")
-    
-    return playlists
+    """
+    Lista de playlists paginada por cursor
+
+    La página siguiente se indica en las cabeceras X-Next-Cursor y Link;
+    skip sigue funcionando para los clientes antiguos.
+    """
+    sort_column = sort_column_for(PLAYLIST_SORT_COLUMNS, sort, "id")
+    query = _playlists_query(db, active_only)
+    # El cursor sigue el orden de `sort`: la búsqueda solo filtra, sin ordenar por relevancia
+    query = apply_search(db, query, PLAYLIST_SEARCH, search, ranked=False)
+    page = keyset_paginate(query, sort_column, Playlist.id, limit, cursor=cursor,
+                           descending=order == "desc", offset=skip)
+    total = None
+    if include_total:
+        filters = ("active" if active_only else "", clean_term(search) or "")
+        total = total_count(db, query, Playlist.__tablename__, filters if any(filters) else ())
+    set_page_headers(request, response, page, total)
+    print(f"Devolviendo {len(page.items)} playlists (límite: {limit})")
+    
+    return page.items
 
 
 @router.get("/count")
@@ -68,86 +105,80 @@ def get_playlists_count(
     """
     Obtener el número total de playlists sin cargar los datos
     """
-    query = db.query(Playlist)
-    
-    if active_only:
-        now = datetime.now()
-        query = query.filter(
-            Playlist.is_active == True,
-            (Playlist.expiration_date == None) | (Playlist.expiration_date > now)
-        )
-    
-    total = query.count()
+    stats = playlist_stats(db)
     
     return {
-        "total": total,
+        "total": stats["active"] if active_only else stats["total"],
         "active_only": active_only
     }
 
 # Y un endpoint para paginación del lado del servidor si lo prefieres
 @router.get("/paginated")
 def get_playlists_paginated(
-    page: int = 1,
-    page_size: int = 100,
+    page: int = Query(1, ge=1, description="Número de página (OFFSET) si no se envía cursor"),
+    page_size: int = Query(100, ge=1, le=1000),
     active_only: bool = False,
     search: str = None,
     sort_by: str = "created_at",
     sort_order: str = "desc",
+    cursor: Optional[str] = Query(None, description="Cursor de next_cursor ('' para la primera página)"),
+    include_total: bool = False,
     db: Session = Depends(get_db)
 ):
     """
     Endpoint con paginación del lado del servidor
+
+    Sin `cursor` se mantiene la paginación por número de página con su total,
+    como hasta ahora. Con `cursor` (vacío para empezar) pagina por cursor:
+    cada respuesta trae next_cursor para pedir la siguiente y el total solo
+    se calcula con include_total.
     """
-    query = db.query(Playlist)
-    
-    # Filtro por estado activo
-    if active_only:
-        now = datetime.now()
-        query = query.filter(
-            Playlist.is_active == True,
-            (Playlist.expiration_date == None) | (Playlist.expiration_date > now)
-        )
+    query = _playlists_query(db, active_only)
     
-    # Búsqueda por texto
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Playlist.title.ilike(search_term)) |
-            (Playlist.description.ilike(search_term))
-        )
-    
-    # Ordenamiento
-    if sort_by == "title":
-        order_column = Playlist.title
-    elif sort_by == "created_at":
-        order_column = Playlist.created_at
-    elif sort_by == "expiration_date":
-        order_column = Playlist.expiration_date
-    else:
-        order_column = Playlist.created_at
+    # Búsqueda por texto (índice de trigramas; el orden lo decide sort_by)
+    query = apply_search(db, query, PLAYLIST_SEARCH, search, ranked=False)
     
-    if sort_order.lower() == "desc":
-        query = query.order_by(order_column.desc())
-    else:
-        query = query.order_by(order_column.asc())
+    # Ordenamiento ("created_at" es el nombre histórico de creation_date)
+    order_column = PLAYLIST_SORT_COLUMNS.get(sort_by, Playlist.creation_date)
+    descending = sort_order.lower() == "desc"
     
-    # Conteo total antes de la paginación
-    total_items = query.count()
-    total_pages = (total_items + page_size - 1) // page_size
-    
-    # Aplicar paginación
-    skip = (page - 1) * page_size
-    playlists = query.offset(skip).limit(page_size).all()
+    if cursor is None:
+        direction = order_column.desc() if descending else order_column.asc()
+        query = query.order_by(direction, Playlist.id.desc() if descending else Playlist.id.asc())
+        
+        # Conteo total antes de la paginación
+        total_items = query.order_by(None).count()
+        total_pages = (total_items + page_size - 1) // page_size
+        
+        # Aplicar paginación
+        skip = (page - 1) * page_size
+        playlists = query.offset(skip).limit(page_size).all()
+        
+        return {
+            "items": playlists,
+            "page": page,
+            "page_size": page_size,
+            "total_items": total_items,
+            "total_pages": total_pages,
+            "has_next": page < total_pages,
+            "has_prev": page > 1
+        }
     
-    return {
-        "items": playlists,
-        "page": page,
+    result = keyset_paginate(query, order_column, Playlist.id, page_size, cursor=cursor or None,
+                             descending=descending)
+    body = {
+        "items": result.items,
         "page_size": page_size,
-        "total_items": total_items,
-        "total_pages": total_pages,
-        "has_next": page < total_pages,
-        "has_prev": page > 1
+        "next_cursor": result.next_cursor,
+        "has_next": result.has_next,
     }
+    if include_total:
+        filters = ("active" if active_only else "", clean_term(search) or "")
+        total_items, estimated = total_count(db, query, Playlist.__tablename__,
+                                             filters if any(filters) else ())
+        body["total_items"] = total_items
+        body["total_is_estimate"] = estimated
+    return body
 
 @router.get("/{playlist_id}", response_model=PlaylistResponse)
 def read_playlist(
@@ -457,8 +488,8 @@ def get_playlist_videos_simple(
                     "title": video.title,
                     "description": video.description or "",
                     "duration": video.duration or 0,
-                    "thumbnail": getattr(video, 'thumbnail', None),
-                    "thumbnail_url": getattr(video, 'thumbnail', None),
+                    "thumbnail": video.thumbnail,
+                    "thumbnail_url": video.thumbnail,
                     "file_path": video.file_path,
                     "filename": getattr(video, 'filename', f"video_{video.id}.mp4"),
                     "tags": getattr(video, 'tags', None),
@@ -487,8 +518,8 @@ def get_playlist_videos_simple(
                     "title": video.title,
                     "description": video.description or "",
                     "duration": video.duration or 0,
-                    "thumbnail": getattr(video, 'thumbnail', None),
-                    "thumbnail_url": getattr(video, 'thumbnail', None),
+                    "thumbnail": video.thumbnail,
+                    "thumbnail_url": video.thumbnail,
                     "file_path": video.file_path,
                     "filename": getattr(video, 'filename', f"video_{video.id}.mp4"),
                     "tags": getattr(video, 'tags', None),
@@ -513,9 +544,10 @@ def get_playlist_videos_simple(
 @router.get("/{playlist_id}/download")
 def download_playlist(
     playlist_id: int, 
+    request: Request,
     db: Session = Depends(get_db)
 ):
-    db_playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+    db_playlist = db.query(Playlist).options(selectinload(Playlist.videos)).filter(Playlist.id == playlist_id).first()
     if db_playlist is None:
         raise HTTPException(status_code=404, detail="Lista de reproducción no encontrada")
     
@@ -526,42 +558,47 @@ def download_playlist(
             detail="Esta lista de reproducción no está activa o no está en su período de actividad"
         )
     
-    # Crear un archivo JSON con la información de la playlist y los videos
-    playlist_data = {
-        "id": db_playlist.id,
-        "title": db_playlist.title,
-        "description": db_playlist.description,
-        "start_date": db_playlist.start_date.isoformat() if db_playlist.start_date else None,
-        "expiration_date": db_playlist.expiration_date.isoformat() if db_playlist.expiration_date else None,
-        "videos": [
-            {
-                "id": video.id,
-                "title": video.title,
-                "description": video.description,
-                "file_path": video.file_path,
-                "duration": video.duration
-            }
-            for video in db_playlist.videos
-        ]
-    }
-    
-    # Crear directorios si no existen
-    os.makedirs(PLAYLIST_DIR, exist_ok=True)
-    
-    # Crear un archivo JSON temporal
-    playlist_filename = f"playlist_{db_playlist.id}_{uuid.uuid4()}.json"
-    playlist_file_path = os.path.join(PLAYLIST_DIR, playlist_filename)
-    
-    with open(playlist_file_path, "w") as f:
-        json.dump(playlist_data, f, indent=4)
-    
-    return FileResponse(
-        path=playlist_file_path, 
-        filename=f"playlist_{db_playlist.title.replace(' ', '_')}.json", 
-        media_type="application/json"
+    # Exportación serializada y comprimida en memoria, válida hasta que se edite la playlist
+    export = playlist_export_cache.get_or_build(ADMIN, db_playlist, build_admin_export)
+    return export_response(request, export, export_filename(db_playlist))
+
+@router.get("/{playlist_id}/bundle")
+@router.head("/{playlist_id}/bundle")
+def download_playlist_bundle(
+    playlist_id: int,
+    request: Request,
+    member: int = Query(0, ge=0, description="Primer video a incluir (reanudación por miembro)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Descarga en un único tar el manifiesto de la playlist y todos sus videos activos.
+    Admite Range/If-Range sobre el mismo tar, o reanudar desde un video con ?member=.
+    """
+    db_playlist = db.query(Playlist).options(selectinload(Playlist.videos)).filter(Playlist.id == playlist_id).first()
+    if db_playlist is None:
+        raise HTTPException(status_code=404, detail="Lista de reproducción no encontrada")
+
+    if not is_playlist_active(db_playlist):
+        raise HTTPException(
+            status_code=403,
+            detail="Esta lista de reproducción no está activa o no está en su período de actividad"
+        )
+
+    # Un reproductor que se identifica recibe las versiones de su modelo
+    device = device_for_request(db, request)
+    profile = profile_for_model(device.model) if device else None
+
+    layout, video_ids = build_playlist_bundle(
+        db, db_playlist, VIDEO_URL_TEMPLATES[RASPBERRY], profile=profile, first_member=member
+    )
+    return bundle_response(
+        request, layout, bundle_filename(db_playlist), video_ids,
+        tienda=device.tienda if device else None,
+        device_id=device.device_id if device else None
     )
 
 @router.get("/{playlist_id}/active_videos")
+@query_budget(2)
 def get_active_videos_in_playlist(
     playlist_id: int, 
     db: Session = Depends(get_db)
@@ -569,7 +606,7 @@ def get_active_videos_in_playlist(
     """
     Devuelve los videos activos en una playlist.
     """
-    db_playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+    db_playlist = db.query(Playlist).options(selectinload(Playlist.videos)).filter(Playlist.id == playlist_id).first()
     if db_playlist is None:
         raise HTTPException(status_code=404, detail="Lista de reproducción no encontrada")
     
@@ -2,12 +2,14 @@
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import func  # ← IMPORTAR func para evitar el error
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, or_  # ← IMPORTAR func para evitar el error
 from typing import List, Optional
 import logging
 
-from models.database import get_db
+from models.database import get_async_db, get_db
 from models.models import Playlist, Video, PlaylistVideo
+from services.search import PLAYLIST_SEARCH, VIDEO_SEARCH, apply_search
 
 logger = logging.getLogger(__name__)
 
@@ -80,15 +82,8 @@ async def get_playlists(
         # Iniciar la consulta base
         query = db.query(Playlist)
         
-        # Aplicar filtros
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Playlist.title.ilike(search_term),
-                    Playlist.description.ilike(search_term)
-                )
-            )
+        # Aplicar filtros (el orden elegido en `sort` prevalece sobre la relevancia)
+        query = apply_search(db, query, PLAYLIST_SEARCH, search, ranked=False)
         
         if status and status != "all":
             if status == "active":
@@ -184,7 +179,7 @@ async def get_playlists(
         )
 
 @router.get("/{playlist_id}")
-async def get_playlist_detail(
+def get_playlist_detail(
     playlist_id: int, 
     db: Session = Depends(get_db)
 ):
@@ -212,7 +207,7 @@ async def get_playlist_detail(
                 "title": video.title,
                 "description": video.description,
                 "duration": video.duration,
-                "thumbnail": getattr(video, 'thumbnail', None),
+                "thumbnail": video.thumbnail,
                 "position": position,  # ← CORREGIDO
                 "order": position  # ← Mantener para compatibilidad con frontend
             }
@@ -231,7 +226,7 @@ async def get_playlist_detail(
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @router.post("/")
-async def create_playlist(
+def create_playlist(
     playlist_data: dict,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user())  # ← USAR función local
@@ -261,7 +256,7 @@ async def create_playlist(
         raise HTTPException(status_code=500, detail="Error al crear la lista")
 
 @router.put("/{playlist_id}")
-async def update_playlist(
+def update_playlist(
     playlist_id: int,
     playlist_data: dict,
     db: Session = Depends(get_db),
@@ -295,7 +290,7 @@ async def update_playlist(
         raise HTTPException(status_code=500, detail="Error al actualizar la lista")
 
 @router.delete("/{playlist_id}")
-async def delete_playlist(
+def delete_playlist(
     playlist_id: int,
     db: Session = Depends(get_db),
     current_user = Depends(require_authenticated_user())  # ← USAR función local
@@ -326,7 +321,7 @@ async def delete_playlist(
 # ========================================
 
 @router.get("/{playlist_id}/edit")
-async def get_playlist_for_edit(
+def get_playlist_for_edit(
     playlist_id: int, 
     db: Session = Depends(get_db)
 ):
@@ -353,7 +348,7 @@ async def get_playlist_for_edit(
                 "title": video.title,
                 "description": video.description,
                 "duration": video.duration,
-                "thumbnail": getattr(video, 'thumbnail', None),
+                "thumbnail": video.thumbnail,
                 "file_path": video.file_path,
                 "tags": getattr(video, 'tags', None),
                 "position": position,  # ← CORREGIDO
@@ -371,7 +366,7 @@ async def get_playlist_for_edit(
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @router.put("/{playlist_id}/reorder")
-async def update_video_order(
+def update_video_order(
     playlist_id: int,
     order_data: dict,
     db: Session = Depends(get_db),
@@ -407,7 +402,7 @@ async def update_video_order(
     
 
 @router.post("/{playlist_id}/videos/{video_id}")
-async def add_video_to_playlist(
+def add_video_to_playlist(
     playlist_id: int,
     video_id: int,
     db: Session = Depends(get_db),
@@ -464,7 +459,7 @@ async def add_video_to_playlist(
         raise HTTPException(status_code=500, detail="Error al añadir el video")
 
 @router.delete("/{playlist_id}/videos/{video_id}")
-async def remove_video_from_playlist(
+def remove_video_from_playlist(
     playlist_id: int,
     video_id: int,
     db: Session = Depends(get_db),
@@ -517,16 +512,16 @@ async def remove_video_from_playlist(
 async def search_videos_for_playlist(
     q: str,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Buscar videos disponibles para añadir a playlists
     """
     try:
-        videos = db.query(Video).filter(
-            (Video.title.ilike(f"%{q}%")) |
-            (Video.description.ilike(f"%{q}%"))
-        ).limit(limit).all()
+        # Índice de trigramas y orden por relevancia (la comprobación de pg_trgm es síncrona)
+        videos = await db.run_sync(
+            lambda session: apply_search(session, session.query(Video), VIDEO_SEARCH, q).limit(limit).all()
+        )
         
         return videos
         
@@ -1,13 +1,20 @@
 # Update to router/raspberry.py to ensure compatibility with authentication system
 
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from datetime import datetime
 from typing import Optional, List
 
-from models.database import get_db
+from models.database import get_player_db
 from models.models import Playlist, Video, Device, DevicePlaylist
+from services.manifest_cache import get_manifest, manifest_response, RASPBERRY
+from services.heartbeat_buffer import heartbeat_buffer
+from utils.query_budget import query_budget
+from services.manifest_watch import (
+    wait_for_manifest_change, version_from_etag,
+    MANIFEST_LONGPOLL_TIMEOUT, MANIFEST_LONGPOLL_MAX_TIMEOUT
+)
 
 
 # Configure logging
@@ -19,97 +26,45 @@ router = APIRouter(
 )
 
 @router.get("/playlists/active")
+@query_budget(6)
 def get_active_playlists_for_raspberry(
+    request: Request,
     device_id: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_player_db)
 ):
     """
     Returns all active playlists.
     If device_id is provided, returns only playlists assigned to that device.
     This is a public endpoint accessible to Raspberry Pi devices without authentication.
+    Responses are served from the manifest cache (see services/manifest_cache.py)
+    with a strong ETag; a matching If-None-Match gets 304 Not Modified.
     """
-    now = datetime.now()
-    
-    # Build base query for active playlists
-    query = db.query(Playlist).filter(
-        Playlist.is_active == True,
-        (Playlist.expiration_date == None) | (Playlist.expiration_date > now)
-    )
+    entry = get_manifest(db, device_id, RASPBERRY)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     
-    # If device_id is provided, filter by playlists assigned to that device
     if device_id:
-        # Check if device exists
-        device = db.query(Device).filter(Device.device_id == device_id).first()
-        if device is None:
-            raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
-        
-        # Update last_seen timestamp
-        device.last_seen = datetime.now()
-        db.commit()
-        
-        # Filter playlists assigned to the device
-        query = query.join(
-            DevicePlaylist,
-            DevicePlaylist.playlist_id == Playlist.id
-        ).filter(DevicePlaylist.device_id == device_id)
+        # last_seen is written behind by the heartbeat buffer
+        heartbeat_buffer.record(device_id)
     
-    # Execute the query
-    active_playlists = query.all()
-    
-    result = []
-    for playlist in active_playlists:
-        # Filter videos that haven't expired
-        active_videos = [
-            video for video in playlist.videos 
-            if not video.expiration_date or video.expiration_date > now
-        ]
-        
-        # Only include playlists with at least one active video
-        if active_videos:
-            playlist_data = {
-                "id": playlist.id,
-                "title": playlist.title,
-                "description": playlist.description,
-                "expiration_date": playlist.expiration_date.isoformat() if playlist.expiration_date else None,
-                "videos": [
-                    {
-                        "id": video.id,
-                        "title": video.title,
-                        "file_path": f"/api/videos/{video.id}/download",
-                        "duration": video.duration,
-                        "expiration_date": video.expiration_date.isoformat() if video.expiration_date else None
-                    }
-                    for video in active_videos
-                ]
-            }
-            result.append(playlist_data)
-    
-    return result
+    return manifest_response(request, entry)
 
 @router.get("/playlists/active/{device_id}")
+@query_budget(6)
 def get_active_playlists_for_device(
     device_id: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_player_db)
 ):
     """
     Returns the active playlists assigned to a specific device.
     This endpoint is for direct access from the client.
     """
     try:
-        # Check if device exists and update last_seen
-        device = db.query(Device).filter(Device.device_id == device_id).first()
-        if device is None:
-            logger.error(f"Device not found: {device_id}")
-            raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
-        
-        # Update last_seen timestamp
-        device.last_seen = datetime.now()
-        db.commit()
-        
         logger.info(f"Active playlists request for device {device_id}")
         
-        # Use the existing function but explicitly pass the device_id
-        return get_active_playlists_for_raspberry(device_id=device_id, db=db)
+        # Device lookup and last_seen are handled by the shared manifest path
+        return get_active_playlists_for_raspberry(request=request, device_id=device_id, db=db)
     
     except HTTPException:
         raise
@@ -117,4 +72,26 @@ def get_active_playlists_for_device(
         logger.error(f"Error getting playlists for device {device_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+@router.get("/playlists/active/{device_id}/watch")
+async def watch_active_playlists_for_device(
+    device_id: str,
+    request: Request,
+    version: Optional[str] = Query(None, description="Manifest version held by the player (defaults to If-None-Match)"),
+    timeout: int = Query(MANIFEST_LONGPOLL_TIMEOUT, ge=1, le=MANIFEST_LONGPOLL_MAX_TIMEOUT)
+):
+    """
+    Long-poll variant of the device manifest endpoint.
+    The request is held until the device's manifest version differs from the one
+    the player holds (200 with the new manifest) or the timeout fires
+    (304 Not Modified). No database session is held while waiting.
+    """
+    known_version = version or version_from_etag(request.headers.get("if-none-match"))
+    
+    entry = await wait_for_manifest_change(device_id, RASPBERRY, known_version, timeout)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
+    
+    heartbeat_buffer.record(device_id)
+    return manifest_response(request, entry, known_version=known_version)
+
 # Keep the rest of your code as is...
\ No newline at end of file
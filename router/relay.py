@@ -0,0 +1,398 @@
+# router/relay.py - Modo relé de tienda: proxy con caché hacia el servidor central
+
+"""
+Rutas del modo relé (se ejecuta con relay_main.py en un equipo de cada tienda).
+
+Los reproductores de la tienda apuntan al relé en lugar del servidor central:
+
+- Las descargas de video se sirven desde una caché LRU en disco; las
+  peticiones simultáneas de un video ausente comparten una sola descarga
+  del servidor central, y los rangos se sirven localmente.
+- Los manifiestos se cachean unos segundos (RELAY_MANIFEST_TTL).
+- Cualquier otra ruta se reenvía sin caché.
+
+El acceso a cada video lo sigue decidiendo el servidor central: antes de
+servir desde la caché se valida la petición con las credenciales del
+reproductor pidiendo un único byte (resultado cacheado RELAY_VALIDATE_TTL
+segundos). El ETag de esa respuesta forma parte de la clave de caché, así que
+si el archivo cambia en el servidor central se descarga de nuevo.
+"""
+
+import os
+import time
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+import aiofiles
+import httpx
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from services.relay_cache import Coalescer, RelayBlobCache
+from utils.etag import etag_matches
+from utils.file_streaming import (
+    RangeFileResponse, RangeNotSatisfiable, parse_byte_range, range_not_satisfiable_response
+)
+
+logger = logging.getLogger(__name__)
+
+RELAY_UPSTREAM_URL = os.getenv("RELAY_UPSTREAM_URL", "").rstrip("/")
+RELAY_CACHE_DIR = os.getenv("RELAY_CACHE_DIR", "relay_cache")
+RELAY_CACHE_MAX_BYTES = int(os.getenv("RELAY_CACHE_MAX_BYTES", str(50 * 1024 ** 3)))
+RELAY_MANIFEST_TTL = float(os.getenv("RELAY_MANIFEST_TTL", "10"))
+RELAY_VALIDATE_TTL = float(os.getenv("RELAY_VALIDATE_TTL", "60"))
+RELAY_TIMEOUT = float(os.getenv("RELAY_TIMEOUT", "30"))
+
+# Encabezados que no se reenvían (salto a salto, o que el relé gestiona por su cuenta)
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+    "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+}
+CONDITIONAL_HEADERS = {"range", "if-range", "if-none-match", "if-modified-since", "accept-encoding"}
+
+router = APIRouter(tags=["relay"])
+
+
+class ValidatedBlob:
+    """Metadatos de un video según el servidor central"""
+
+    __slots__ = ("etag", "size", "media_type", "disposition", "expires_at")
+
+    def __init__(self, etag: str, size: int, media_type: str,
+                 disposition: Optional[str], expires_at: float):
+        self.etag = etag
+        self.size = size
+        self.media_type = media_type
+        self.disposition = disposition
+        self.expires_at = expires_at
+
+
+class CachedManifest:
+    __slots__ = ("status_code", "body", "headers", "etag", "expires_at")
+
+    def __init__(self, status_code: int, body: bytes, headers: Dict[str, str],
+                 etag: Optional[str], expires_at: float):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+class StoreRelay:
+    """Proxy con caché hacia el servidor central"""
+
+    def __init__(self, upstream_url: str, cache: RelayBlobCache, client: httpx.AsyncClient,
+                 manifest_ttl: float = RELAY_MANIFEST_TTL,
+                 validate_ttl: float = RELAY_VALIDATE_TTL):
+        """
+        Args:
+            upstream_url: URL base del servidor central
+            cache: Caché en disco de videos
+            client: Cliente HTTP asíncrono compartido
+            manifest_ttl: Segundos que se sirve un manifiesto sin consultar al central
+            validate_ttl: Segundos que se reutiliza la validación de acceso a un video
+        """
+        self.upstream_url = upstream_url.rstrip("/")
+        self.cache = cache
+        self.client = client
+        self.manifest_ttl = manifest_ttl
+        self.validate_ttl = validate_ttl
+        self.downloads = Coalescer()
+        self.manifest_fetches = Coalescer()
+        self._validations: Dict[str, ValidatedBlob] = {}
+        self._manifests: Dict[str, CachedManifest] = {}
+
+        # Métricas
+        self.upstream_bytes = 0
+        self.served_bytes = 0
+        self.manifest_hits = 0
+        self.manifest_misses = 0
+
+    # ------------------------------------------
+    # Utilidades
+    # ------------------------------------------
+
+    def _url(self, request: Request) -> str:
+        return f"{self.upstream_url}{request.url.path}"
+
+    @staticmethod
+    def _forward_headers(request: Request, drop_conditional: bool = True) -> Dict[str, str]:
+        excluded = HOP_BY_HOP_HEADERS | (CONDITIONAL_HEADERS if drop_conditional else set())
+        return {name: value for name, value in request.headers.items() if name.lower() not in excluded}
+
+    @staticmethod
+    def _request_key(request: Request, *parts: str) -> str:
+        """Clave por ruta, query y credenciales del reproductor"""
+        credentials = "|".join(
+            request.headers.get(name, "") for name in ("authorization", "cookie", "x-api-key")
+        )
+        raw = "\n".join((request.url.path, str(request.url.query), credentials) + parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _response_headers(response: httpx.Response) -> Dict[str, str]:
+        return {
+            name: value for name, value in response.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS | {"content-encoding"}
+        }
+
+    # ------------------------------------------
+    # Videos
+    # ------------------------------------------
+
+    async def _validate(self, request: Request):
+        """
+        Comprueba con el servidor central que el reproductor puede descargar el video
+
+        Returns:
+            ValidatedBlob, o una Response con el error del servidor central
+        """
+        key = self._request_key(request)
+        validated = self._validations.get(key)
+        if validated is not None and validated.expires_at > time.monotonic():
+            return validated
+
+        headers = self._forward_headers(request)
+        headers["Range"] = "bytes=0-0"
+        async with self.client.stream("GET", self._url(request), params=request.query_params,
+                                      headers=headers) as upstream:
+            if upstream.status_code not in (200, 206):
+                body = await upstream.aread()
+                return Response(content=body, status_code=upstream.status_code,
+                                headers=self._response_headers(upstream))
+            # No se lee el cuerpo: si el central ignoró el rango, cerrar corta la transferencia
+            size = _total_size(upstream)
+
+        if size is None:
+            return JSONResponse({"detail": "Respuesta del servidor central sin tamaño"}, status_code=502)
+
+        validated = ValidatedBlob(
+            etag=upstream.headers.get("etag") or upstream.headers.get("last-modified") or str(size),
+            size=size,
+            media_type=upstream.headers.get("content-type", "application/octet-stream"),
+            disposition=upstream.headers.get("content-disposition"),
+            expires_at=time.monotonic() + self.validate_ttl,
+        )
+        self._validations[key] = validated
+        self._prune(self._validations)
+        return validated
+
+    async def _download(self, request: Request, key: str, validated: ValidatedBlob) -> str:
+        """Descarga el video completo del servidor central a la caché"""
+        temp_path = self.cache.temp_path()
+        received = 0
+        try:
+            async with self.client.stream("GET", self._url(request), params=request.query_params,
+                                          headers=self._forward_headers(request)) as upstream:
+                if upstream.status_code != 200:
+                    raise httpx.HTTPStatusError(
+                        f"El servidor central respondió {upstream.status_code}",
+                        request=upstream.request, response=upstream
+                    )
+                async with aiofiles.open(temp_path, "wb") as target:
+                    async for chunk in upstream.aiter_bytes():
+                        await target.write(chunk)
+                        received += len(chunk)
+            if received != validated.size:
+                raise httpx.HTTPError(f"Descarga incompleta: {received} de {validated.size} bytes")
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.upstream_bytes += received
+        logger.info(f"Relé: {request.url.path} descargado del servidor central ({received} bytes)")
+        return self.cache.put(key, temp_path, received)
+
+    async def serve_video(self, request: Request) -> Response:
+        validated = await self._validate(request)
+        if isinstance(validated, Response):
+            return validated
+
+        # El contenido no depende de quién lo pide: la clave es la URL y su versión
+        key = hashlib.sha256(
+            f"{request.url.path}?{request.url.query}|{validated.etag}".encode("utf-8")
+        ).hexdigest()
+
+        headers = {"ETag": validated.etag, "X-Relay-Cache": "HIT"}
+        if validated.disposition:
+            headers["Content-Disposition"] = validated.disposition
+
+        local_path = self.cache.get(key)
+        if local_path is None:
+            if request.method == "HEAD":
+                headers["X-Relay-Cache"] = "MISS"
+                headers["Content-Length"] = str(validated.size)
+                headers["Accept-Ranges"] = "bytes"
+                return Response(headers=headers, media_type=validated.media_type)
+            try:
+                local_path = await self.downloads.run(key, lambda: self._download(request, key, validated))
+            except httpx.HTTPError as e:
+                logger.error(f"Relé: error al descargar {request.url.path}: {str(e)}")
+                return JSONResponse({"detail": "No se pudo obtener el video del servidor central"},
+                                    status_code=502)
+            headers["X-Relay-Cache"] = "MISS"
+
+        try:
+            byte_range = parse_byte_range(request.headers.get("range"), validated.size)
+        except RangeNotSatisfiable:
+            return range_not_satisfiable_response(validated.size)
+
+        response = RangeFileResponse(local_path, validated.size, validated.media_type,
+                                     byte_range=byte_range, headers=headers)
+        self.served_bytes += response.content_length
+        return response
+
+    # ------------------------------------------
+    # Manifiestos
+    # ------------------------------------------
+
+    async def _fetch_manifest(self, request: Request, key: str) -> CachedManifest:
+        upstream = await self.client.get(self._url(request), params=request.query_params,
+                                         headers=self._forward_headers(request))
+        headers = self._response_headers(upstream)
+        headers.pop("content-length", None)
+        manifest = CachedManifest(
+            status_code=upstream.status_code,
+            body=upstream.content,
+            headers=headers,
+            etag=upstream.headers.get("etag"),
+            expires_at=time.monotonic() + (self.manifest_ttl if upstream.status_code == 200 else 0),
+        )
+        if upstream.status_code == 200:
+            self._manifests[key] = manifest
+            self._prune(self._manifests)
+        return manifest
+
+    async def serve_manifest(self, request: Request) -> Response:
+        key = self._request_key(request)
+        manifest = self._manifests.get(key)
+        if manifest is not None and manifest.expires_at > time.monotonic():
+            self.manifest_hits += 1
+        else:
+            self.manifest_misses += 1
+            try:
+                manifest = await self.manifest_fetches.run(key, lambda: self._fetch_manifest(request, key))
+            except httpx.HTTPError as e:
+                logger.error(f"Relé: error al obtener manifiesto {request.url.path}: {str(e)}")
+                if manifest is None:
+                    return JSONResponse({"detail": "Servidor central no disponible"}, status_code=502)
+                # Sin conexión con el central: servir la última copia aunque esté vencida
+                logger.warning(f"Relé: sirviendo manifiesto vencido de {request.url.path}")
+
+        if manifest.etag and etag_matches(request.headers.get("if-none-match"), manifest.etag):
+            return Response(status_code=304, headers={"ETag": manifest.etag})
+        return Response(content=manifest.body, status_code=manifest.status_code, headers=manifest.headers)
+
+    # ------------------------------------------
+    # Resto de rutas
+    # ------------------------------------------
+
+    async def passthrough(self, request: Request) -> Response:
+        """Reenvía la petición tal cual, en streaming en ambos sentidos"""
+        upstream_request = self.client.build_request(
+            request.method,
+            self._url(request),
+            params=request.query_params,
+            headers=self._forward_headers(request, drop_conditional=False),
+            content=request.stream(),
+            # Las esperas largas (long-poll) no deben cortarse por el timeout de lectura
+            timeout=httpx.Timeout(RELAY_TIMEOUT, read=None),
+        )
+        upstream = await self.client.send(upstream_request, stream=True)
+        headers = {
+            name: value for name, value in upstream.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        }
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers=headers,
+            background=BackgroundTask(upstream.aclose),
+        )
+
+    def _prune(self, entries: dict):
+        """Descarta entradas vencidas cuando el diccionario crece"""
+        if len(entries) < 10000:
+            return
+        now = time.monotonic()
+        for key in [key for key, value in entries.items() if value.expires_at <= now]:
+            del entries[key]
+
+    def stats(self) -> dict:
+        return {
+            "upstream": self.upstream_url,
+            "cache": self.cache.stats(),
+            "downloads": self.downloads.stats(),
+            "upstream_bytes": self.upstream_bytes,
+            "served_bytes": self.served_bytes,
+            "manifest_hits": self.manifest_hits,
+            "manifest_misses": self.manifest_misses,
+            "validations_cached": len(self._validations),
+        }
+
+
+def _total_size(response: httpx.Response) -> Optional[int]:
+    """Tamaño total del recurso a partir de Content-Range o Content-Length"""
+    content_range = response.headers.get("content-range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1].strip()
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get("content-length")
+    if response.status_code == 200 and length and length.isdigit():
+        return int(length)
+    return None
+
+
+# Instancia activa del relé (la crea relay_main.py al arrancar)
+store_relay: Optional[StoreRelay] = None
+
+
+def _relay() -> StoreRelay:
+    if store_relay is None:
+        raise RuntimeError("El relé no está inicializado")
+    return store_relay
+
+
+@router.get("/api/relay/stats")
+async def relay_stats():
+    """
+    Métricas del relé: uso de la caché, bytes del servidor central y servidos
+    """
+    return _relay().stats()
+
+
+@router.api_route("/api/videos/{video_id}/download", methods=["GET", "HEAD"])
+@router.api_route("/api/client/videos/{video_id}/download", methods=["GET", "HEAD"])
+async def relay_video_download(video_id: int, request: Request):
+    """
+    Descarga de video servida desde la caché de la tienda
+    """
+    return await _relay().serve_video(request)
+
+
+@router.get("/api/raspberry/playlists/active")
+@router.get("/api/raspberry/playlists/active/{device_id}")
+@router.get("/api/client/playlists")
+@router.get("/api/client/playlists/delta")
+async def relay_manifest(request: Request):
+    """
+    Manifiestos cacheados durante RELAY_MANIFEST_TTL segundos
+    """
+    return await _relay().serve_manifest(request)
+
+
+@router.api_route("/{path:path}", methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+async def relay_passthrough(path: str, request: Request):
+    """
+    Cualquier otra ruta se reenvía al servidor central sin caché
+    """
+    try:
+        return await _relay().passthrough(request)
+    except httpx.HTTPError as e:
+        logger.error(f"Relé: error al reenviar {request.url.path}: {str(e)}")
+        return JSONResponse({"detail": "Servidor central no disponible"}, status_code=502)
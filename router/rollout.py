@@ -0,0 +1,66 @@
+# router/rollout.py - Progreso del despliegue escalonado de contenido
+
+import logging
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from models.database import get_db
+from models.models import Device, Video
+from services import rollout
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/rollout",
+    tags=["rollout"]
+)
+
+@router.get("/progress")
+def get_rollout_progress(
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Cuántos dispositivos destino ya descargaron cada video (más recientes primero)
+    """
+    progress = rollout.rollout_progress(db, limit=limit)
+    return {
+        "enabled": rollout.ROLLOUT_ENABLED,
+        "window": rollout.ROLLOUT_WINDOW,
+        "videos": progress
+    }
+
+@router.get("/progress/{video_id}")
+def get_video_rollout_progress(video_id: int, db: Session = Depends(get_db)):
+    """
+    Progreso de un video desglosado por tienda
+    """
+    video = db.query(Video.id).filter(Video.id == video_id).first()
+    if not video:
+        raise HTTPException(status_code=404, detail="Video no encontrado")
+
+    summary = rollout.rollout_progress(db, video_ids=[video_id])
+    return {
+        "video": summary[0] if summary else {
+            "video_id": video_id, "devices_targeted": 0, "devices_fetched": 0, "percent": 0.0
+        },
+        "tiendas": rollout.rollout_progress_by_tienda(db, video_id)
+    }
+
+@router.get("/devices/{device_id}/window")
+def get_device_window(device_id: str, db: Session = Depends(get_db)):
+    """
+    Próxima ventana de descarga asignada a un dispositivo
+    """
+    device = db.query(Device.device_id, Device.tienda).filter(Device.device_id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
+
+    start, end = rollout.rollout_schedule.window_for(device.device_id, device.tienda, datetime.now())
+    return {
+        "device_id": device.device_id,
+        "tienda": device.tienda,
+        "window_start": start.isoformat(),
+        "window_end": end.isoformat()
+    }
@@ -7,6 +7,7 @@ import logging
 
 from models import models, schemas
 from models.database import get_db
+from services.stats import tienda_stats
 
 # Configuración del logger
 logger = logging.getLogger(__name__)
@@ -69,18 +70,11 @@ def get_tiendas_count(
         dict: Diccionario con el total de tiendas
     """
     try:
-        query = db.query(models.Tienda)
-        
-        if active_only:
-            # Solo tiendas que tienen al menos un dispositivo activo
-            query = query.join(models.Device, models.Device.tienda == models.Tienda.tienda)\
-                        .filter(models.Device.is_active == True)\
-                        .distinct()
-        
-        total = query.count()
+        # Una sola consulta para ambos totales (cacheada unos segundos)
+        stats = tienda_stats(db)
         
         return {
-            "total": total,
+            "total": stats["active"] if active_only else stats["total"],
             "active_only": active_only
         }
         
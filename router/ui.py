@@ -3,13 +3,12 @@ from fastapi import APIRouter, Request, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from typing import Optional
 import httpx
 import sys
 import os
 from datetime import datetime
-from sqlalchemy import or_
 
 # Añadir la ruta del directorio padre al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -17,6 +16,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 # Importaciones absolutas en lugar de relativas
 from models import models, schemas
 from models.database import get_db
+from services.search import DEVICE_SEARCH, clean_term, device_search_columns, devices_matching, rank
+from utils.query_budget import query_budget
 
 router = APIRouter(
     prefix="/ui",
@@ -35,6 +36,7 @@ async def get_dashboard(request: Request):
     return templates.TemplateResponse("dashboard.html", {"request": request, "title": "Raspberry Pi Registry"})
 
 @router.get("/devices", response_class=HTMLResponse)
+@query_budget(2)
 async def get_devices_page(
     request: Request, 
     active_only: bool = False,
@@ -45,67 +47,23 @@ async def get_devices_page(
     """
     Página que muestra la lista de dispositivos registrados
     """
-    # Consulta base con join a las playlists
-    query = db.query(models.Device).outerjoin(
-        models.DevicePlaylist,
-        models.DevicePlaylist.device_id == models.Device.device_id
-    ).outerjoin(
-        models.Playlist,
-        models.Playlist.id == models.DevicePlaylist.playlist_id
-    )
+    # Las playlists de todos los dispositivos en una sola consulta adicional
+    query = db.query(models.Device).options(selectinload(models.Device.playlists))
     
     # Filtros adicionales
     if active_only:
         query = query.filter(models.Device.is_active == True)
     
-    if search and search.strip():
-        search_term = f"%{search.strip()}%"
-        if search_field == 'name':
-            query = query.filter(models.Device.name.ilike(search_term))
-        elif search_field == 'location':
-            query = query.filter(models.Device.location.ilike(search_term))
-        elif search_field == 'tienda':
-            query = query.filter(models.Device.tienda.ilike(search_term))
-        elif search_field == 'model':
-            query = query.filter(models.Device.model.ilike(search_term))
-        elif search_field == 'ip':
-            query = query.filter(
-                or_(
-                    models.Device.ip_address_lan.ilike(search_term),
-                    models.Device.ip_address_wifi.ilike(search_term)
-                )
-            )
-        else:  # 'all'
-            query = query.filter(
-                or_(
-                    models.Device.device_id.ilike(search_term),
-                    models.Device.name.ilike(search_term),
-                    models.Device.location.ilike(search_term),
-                    models.Device.tienda.ilike(search_term),
-                    models.Device.model.ilike(search_term),
-                    models.Device.ip_address_lan.ilike(search_term),
-                    models.Device.ip_address_wifi.ilike(search_term),
-                    models.Playlist.title.ilike(search_term)
-                )
-            )
+    # Búsqueda con índices de trigramas; en "todos" también por título de playlist
+    term = clean_term(search)
+    if term:
+        columns = device_search_columns(search_field)
+        query = query.filter(devices_matching(term, columns, include_playlists=not columns))
+        relevance = rank(db, DEVICE_SEARCH, term)
+        if relevance is not None:
+            query = query.order_by(relevance.desc())
     
-    # Es importante usar distinct() para evitar duplicados si un dispositivo tiene múltiples playlists
-    devices = query.distinct().all()
-    
-    # Cargar explícitamente las playlists para cada dispositivo
-    for device in devices:
-        # SQLAlchemy debería haber cargado las playlists automáticamente,
-        # pero podemos forzar la carga si es necesario
-        if hasattr(device, 'playlists') and device.playlists is None:
-            device_playlists = db.query(models.Playlist).join(
-                models.DevicePlaylist,
-                models.DevicePlaylist.playlist_id == models.Playlist.id
-            ).filter(
-                models.DevicePlaylist.device_id == device.device_id
-            ).all()
-            
-            # Asignar manualmente las playlists al dispositivo
-            device.playlists = device_playlists
+    devices = query.all()
     
     return templates.TemplateResponse(
         "/devices/devices.html", 
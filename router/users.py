@@ -12,6 +12,8 @@ import os
 # Imports del proyecto
 from models.database import get_db
 from models.models import User
+from services.search import USER_SEARCH, apply_search, clean_term
+from services.stats import filtered_user_stats, user_stats
 from utils.auth import create_session, get_current_user  # Solo importar lo que existe
 
 # Import del servicio AD con manejo de errores robusto
@@ -281,12 +283,7 @@ async def handle_local_user_listing(
         
         # APLICAR FILTROS SOLO SI TIENEN VALORES VÁLIDOS
         if search and len(search) > 0:
-            search_term = f"%{search}%"
-            query = query.filter(
-                (User.username.ilike(search_term)) | 
-                (User.email.ilike(search_term)) |
-                (User.fullname.ilike(search_term))
-            )
+            query = apply_search(db, query, USER_SEARCH, search)
             filters_applied.append(f"search LIKE '%{search}%'")
         
         # CRÍTICO: Solo filtrar por is_active si es explícitamente True o False
@@ -651,32 +648,17 @@ async def get_user_stats(request: Request, db: Session = Depends(get_db)):
         return JSONResponse({"success": False, "message": "Acceso denegado"}, status_code=401)
     
     try:
-        total_users = db.query(User).count()
-        active_users = db.query(User).filter(User.is_active == True).count()
-        admin_users = db.query(User).filter(User.is_admin == True).count()
-        
-        # Estadísticas por proveedor de auth (si existe el campo)
-        local_users = 0
-        ad_users = 0
-        
-        # Verificar si el modelo User tiene el campo auth_provider
-        if hasattr(User, 'auth_provider'):
-            local_users = db.query(User).filter(User.auth_provider == 'local').count()
-            ad_users = db.query(User).filter(User.auth_provider == 'active_directory').count()
-        else:
-            # Fallback: usar password_hash para distinguir
-            local_users = db.query(User).filter(User.password_hash != None).count()
-            ad_users = db.query(User).filter(User.password_hash == None).count()
+        stats = user_stats(db)
         
         return JSONResponse({
             "success": True,
             "stats": {
-                "total_users": total_users,
-                "active_users": active_users,
-                "admin_users": admin_users,
-                "local_users": local_users,
-                "ad_users": ad_users,
-                "inactive_users": total_users - active_users
+                "total_users": stats["total"],
+                "active_users": stats["active"],
+                "admin_users": stats["admins"],
+                "local_users": stats["local"],
+                "ad_users": stats["ad"],
+                "inactive_users": stats["inactive"]
             },
             "ad_available": AD_AVAILABLE
         })
@@ -1266,12 +1248,7 @@ async def search_local_users_dynamic(
         
         # Aplicar filtros
         if search and len(search) > 0:
-            search_term = f"%{search}%"
-            query = query.filter(
-                (User.username.ilike(search_term)) | 
-                (User.email.ilike(search_term)) |
-                (User.fullname.ilike(search_term))
-            )
+            query = apply_search(db, query, USER_SEARCH, search)
         
         if is_active is not None:
             query = query.filter(User.is_active == is_active)
@@ -1397,12 +1374,7 @@ async def get_dynamic_user_stats(
             query = db.query(User)
             
             if search_clean:
-                search_term = f"%{search_clean}%"
-                query = query.filter(
-                    (User.username.ilike(search_term)) | 
-                    (User.email.ilike(search_term)) |
-                    (User.fullname.ilike(search_term))
-                )
+                query = apply_search(db, query, USER_SEARCH, search_clean, ranked=False)
             
             if is_active_bool is not None:
                 query = query.filter(User.is_active == is_active_bool)
@@ -1411,26 +1383,25 @@ async def get_dynamic_user_stats(
                 if hasattr(User, 'auth_provider'):
                     query = query.filter(User.auth_provider == auth_provider_clean)
             
-            total_filtered = query.count()
-            active_filtered = query.filter(User.is_active == True).count()
-            admin_filtered = query.filter(User.is_admin == True).count()
+            filtered = filtered_user_stats(
+                db, query, (clean_term(search_clean) or "", is_active_bool, auth_provider_clean)
+            )
             
             # Estadísticas generales (sin filtros)
-            total_general = db.query(User).count()
-            active_general = db.query(User).filter(User.is_active == True).count()
+            general = user_stats(db)
             
             return JSONResponse({
                 "success": True,
                 "filtered_stats": {
-                    "total": total_filtered,
-                    "active": active_filtered,
-                    "admins": admin_filtered,
-                    "inactive": total_filtered - active_filtered
+                    "total": filtered["total"],
+                    "active": filtered["active"],
+                    "admins": filtered["admins"],
+                    "inactive": filtered["inactive"]
                 },
                 "general_stats": {
-                    "total": total_general,
-                    "active": active_general,
-                    "inactive": total_general - active_general
+                    "total": general["total"],
+                    "active": general["active"],
+                    "inactive": general["inactive"]
                 },
                 "has_filters": bool(search_clean or is_active_bool is not None or auth_provider_clean)
             })
@@ -16,6 +16,7 @@ from models.models import User, AuthProvider, ADSyncLog
 from models.schemas import UserCreate, UserUpdate, UserResponse
 from utils.auth_enhanced import admin_required, get_current_user, auth_service
 from services.ad_service import ad_service
+from services.stats import user_stats
 from config.ad_config import ad_settings
 
 # Setup logging
@@ -65,10 +66,7 @@ async def list_users_page(
     users = query.order_by(User.username).all()
     
     # Obtener estadísticas
-    total_users = db.query(User).count()
-    ad_users = db.query(User).filter(User.auth_provider == AuthProvider.ACTIVE_DIRECTORY.value).count()
-    local_users = db.query(User).filter(User.auth_provider == AuthProvider.LOCAL.value).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
+    stats = user_stats(db)
     
     return templates.TemplateResponse(
         "users_enhanced.html",
@@ -82,10 +80,10 @@ async def list_users_page(
             "current_user": admin_user,
             "auth_providers": [p.value for p in AuthProvider],
             "stats": {
-                "total": total_users,
-                "ad_users": ad_users,
-                "local_users": local_users,
-                "active": active_users
+                "total": stats["total"],
+                "ad_users": stats["ad"],
+                "local_users": stats["local"],
+                "active": stats["active"]
             },
             "ad_enabled": ad_settings.AD_SYNC_ENABLED
         }
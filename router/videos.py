@@ -1,20 +1,34 @@
 # router/videos.py - Versión corregida con endpoint de descarga mejorado
 
 import os
-import shutil
-import uuid
 import logging
 from typing import List, Optional
 from datetime import datetime
 from pathlib import Path
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, Query, Request, Response
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, UploadFile, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
+from starlette.background import BackgroundTask
+from starlette.requests import ClientDisconnect
 
-from models.database import get_db
-from models.models import Video
-from models.schemas import VideoResponse, VideoUpdate
+from models.database import get_async_db, get_db, get_player_async_db
+from models.models import Video, VideoUpload
+from models.schemas import VideoResponse, VideoUpdate, VideoUploadCreate, VideoUploadResponse
+from services import chunked_upload, video_storage
+from services.media_probe import media_probe_pool
+from services.pagination import keyset_paginate, set_page_headers, sort_column_for, total_count
+from services.rollout import admit_download, device_for_request, record_download_in_background
+from services.transcoding import enqueue_video_id, orphaned_rendition_files, resolve_download_path
+from services.thumbnails import (
+    DEFAULT_SIZE, THUMBNAIL_SIZES, remove_thumbnails, thumbnail_key, thumbnail_path, thumbnail_pool
+)
+from utils.file_streaming import (
+    RangeFileResponse, RangeNotSatisfiable, parse_byte_range, range_not_satisfiable_response
+)
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -24,10 +38,39 @@ router = APIRouter(
     tags=["videos"]
 )
 
+# Columnas por las que se puede ordenar el listado (paginación por cursor)
+VIDEO_SORT_COLUMNS = {
+    "id": Video.id,
+    "title": Video.title,
+    "upload_date": Video.upload_date,
+    "expiration_date": Video.expiration_date,
+}
+
 # Directorio para almacenar videos
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Imagen mostrada mientras la miniatura real se genera
+THUMBNAIL_PLACEHOLDER = os.path.join("static", "img", "video-placeholder.jpg")
+
+def schedule_media_jobs(video: Video):
+    """
+    Encola el análisis con ffprobe y, al terminar, las miniaturas (el poster
+    se toma en función de la duración detectada) y las versiones para los
+    reproductores (que dependen del códec y la resolución)
+    """
+    key = thumbnail_key(video)
+    video_id = video.id
+    file_path = video.file_path
+
+    def after_probe(future):
+        info = future.result() or {}
+        if key is not None:
+            thumbnail_pool.submit(file_path, key, info.get("duration"))
+        enqueue_video_id(video_id)
+
+    media_probe_pool.submit(video_id, file_path).add_done_callback(after_probe)
+
 @router.post("/", response_model=VideoResponse)
 async def create_video(
     title: str = Form(...),
@@ -43,17 +86,16 @@ async def create_video(
         if not file.content_type or not file.content_type.startswith("video/"):
             raise HTTPException(status_code=400, detail="El archivo debe ser un video")
         
-        # Crear un nombre único para el archivo
+        # Guardar el archivo calculando su SHA-256 en la misma pasada (fuera del event loop)
         file_extension = os.path.splitext(file.filename)[1] if file.filename else ".mp4"
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # Guardar el archivo
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Obtener el tamaño del archivo
-        file_size = os.path.getsize(file_path)
+        temp_path = video_storage.new_temp_path(file_extension)
+        try:
+            content_hash, file_size = await run_in_threadpool(
+                video_storage.write_and_hash, file.file, temp_path
+            )
+        except Exception:
+            video_storage.remove_file(temp_path)
+            raise
         
         # Convertir la fecha de expiración si se proporcionó
         expiration_date_obj = None
@@ -63,40 +105,189 @@ async def create_video(
             except ValueError:
                 raise HTTPException(status_code=400, detail="Formato de fecha de expiración inválido")
         
-        # Crear el registro en la base de datos
-        video_db = Video(
-            title=title,
-            description=description,
-            file_path=file_path,
-            file_size=file_size,
-            upload_date=datetime.now(),
-            expiration_date=expiration_date_obj
-        )
+        def save_video() -> Video:
+            # Reutilizar el archivo si ya existe el mismo contenido
+            blob = video_storage.acquire_blob(db, content_hash, temp_path, file_size, file_extension)
+
+            # Crear el registro en la base de datos
+            video = Video(
+                title=title,
+                description=description,
+                file_path=blob.file_path,
+                file_size=file_size,
+                content_hash=content_hash,
+                upload_date=datetime.now(),
+                expiration_date=expiration_date_obj
+            )
+            db.add(video)
+            db.commit()
+            db.refresh(video)
+            return video
+
+        # Renombrado del archivo y sesión síncrona: fuera del event loop
+        video_db = await run_in_threadpool(save_video)
         
-        db.add(video_db)
-        db.commit()
-        db.refresh(video_db)
+        # Duración, códecs y miniaturas se obtienen en segundo plano; la respuesta no espera
+        schedule_media_jobs(video_db)
         
-        logger.info(f"Video creado exitosamente: ID {video_db.id}")
+        logger.info(f"Video creado exitosamente: ID {video_db.id} (sha256 {content_hash[:12]})")
         return video_db
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"Error al crear video: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al crear video: {str(e)}")
 
+# ==========================================
+# SUBIDAS POR PARTES (REANUDABLES)
+# ==========================================
+
+def _upload_headers(upload_offset: int, upload_length: int) -> dict:
+    return {
+        "Upload-Offset": str(upload_offset),
+        "Upload-Length": str(upload_length),
+        "Cache-Control": "no-store"
+    }
+
+def _get_upload_or_404(db: Session, upload_id: str) -> VideoUpload:
+    upload = db.query(VideoUpload).filter(VideoUpload.id == upload_id).first()
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    return upload
+
+def _upload_error(e: chunked_upload.UploadError) -> HTTPException:
+    headers = {"Upload-Offset": str(e.offset)} if e.offset is not None else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+@router.post("/uploads", response_model=VideoUploadResponse, status_code=201)
+async def create_video_upload(
+    data: VideoUploadCreate,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Inicia una subida reanudable. El cliente envía luego las partes con PATCH.
+    """
+    try:
+        upload = await chunked_upload.create_upload(
+            db,
+            title=data.title,
+            upload_length=data.upload_length,
+            description=data.description,
+            expiration_date=data.expiration_date,
+            filename=data.filename
+        )
+    except chunked_upload.UploadError as e:
+        raise _upload_error(e)
+
+    response.headers["Location"] = f"{router.prefix}/uploads/{upload.id}"
+    response.headers.update(_upload_headers(upload.upload_offset, upload.upload_length))
+    return upload
+
+@router.get("/uploads/{upload_id}", response_model=VideoUploadResponse)
+@router.head("/uploads/{upload_id}")
+def get_video_upload(
+    upload_id: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Estado de una subida. HEAD devuelve solo Upload-Offset para reanudar tras un corte.
+    """
+    upload = _get_upload_or_404(db, upload_id)
+    headers = _upload_headers(upload.upload_offset, upload.upload_length)
+    if request.method == "HEAD":
+        return Response(headers=headers)
+    return JSONResponse(
+        content=jsonable_encoder(VideoUploadResponse.from_orm(upload)),
+        headers=headers
+    )
+
+@router.patch("/uploads/{upload_id}", status_code=204)
+async def patch_video_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset", ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Recibe una parte de la subida. Debe empezar exactamente en el offset confirmado.
+    """
+    upload = await run_in_threadpool(_get_upload_or_404, db, upload_id)
+    upload_length = upload.upload_length
+    try:
+        new_offset = await chunked_upload.append_chunk(db, upload, upload_offset, request.stream())
+    except chunked_upload.UploadError as e:
+        raise _upload_error(e)
+    except ClientDisconnect:
+        logger.warning(f"Conexión cortada durante la subida {upload_id}; se podrá reanudar")
+        return Response(status_code=400)
+
+    return Response(status_code=204, headers=_upload_headers(new_offset, upload_length))
+
+@router.post("/uploads/{upload_id}/finalize", response_model=VideoResponse)
+async def finalize_video_upload(
+    upload_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Crea el video a partir de una subida completa.
+    """
+    upload = await run_in_threadpool(_get_upload_or_404, db, upload_id)
+    try:
+        video = await chunked_upload.finalize_upload(db, upload)
+        schedule_media_jobs(video)
+        return video
+    except chunked_upload.UploadError as e:
+        raise _upload_error(e)
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        logger.error(f"Error al finalizar la subida {upload_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error al finalizar la subida: {str(e)}")
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+def delete_video_upload(
+    upload_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Cancela una subida y libera su archivo parcial.
+    """
+    upload = _get_upload_or_404(db, upload_id)
+    chunked_upload.abort_upload(db, upload)
+    return Response(status_code=204)
+
 @router.get("/", response_model=List[VideoResponse])
 def get_videos(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(1000, ge=1, le=1001),
+    cursor: Optional[str] = Query(None, description="Cursor de la cabecera X-Next-Cursor"),
+    sort: str = Query("id", description="id, title, upload_date o expiration_date"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include_total: bool = False,
     db: Session = Depends(get_db)
 ):
+    """
+    Lista de videos paginada por cursor
+
+    La página siguiente se indica en las cabeceras X-Next-Cursor y Link;
+    skip sigue funcionando para los clientes antiguos.
+    """
+    sort_column = sort_column_for(VIDEO_SORT_COLUMNS, sort, "id")
     try:
-        videos = db.query(Video).offset(skip).limit(limit).all()
-        logger.info(f"Retornando {len(videos)} videos (skip={skip}, limit={limit})")
-        return videos
+        query = db.query(Video)
+        page = keyset_paginate(query, sort_column, Video.id, limit, cursor=cursor,
+                               descending=order == "desc", offset=skip)
+        total = total_count(db, query, Video.__tablename__) if include_total else None
+        set_page_headers(request, response, page, total)
+        logger.info(f"Retornando {len(page.items)} videos (skip={skip}, limit={limit}, cursor={bool(cursor)})")
+        return page.items
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error al obtener videos: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al obtener videos: {str(e)}")
@@ -106,14 +297,14 @@ def get_videos(
 @router.get("/{video_id}", response_model=VideoResponse)
 async def get_video(
     video_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obtener información detallada de un video específico.
     """
     try:
         # Buscar el video en la base de datos
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = await db.get(Video, video_id)
         if not video:
             raise HTTPException(status_code=404, detail="Video no encontrado")
         
@@ -134,6 +325,15 @@ async def get_video(
             "upload_date": video.upload_date,
             "duration": video.duration,
             "expiration_date": video.expiration_date,
+            "content_hash": video.content_hash,
+            "width": video.width,
+            "height": video.height,
+            "video_codec": video.video_codec,
+            "audio_codec": video.audio_codec,
+            "bitrate": video.bitrate,
+            "container": video.container,
+            "thumbnail": video.thumbnail,
+            "poster": video.poster,
             # Añadir propiedades adicionales que puedan ser útiles para el frontend
             "file_exists": file_exists,
             # No incluir 'filename' como atributo directo, sino extraerlo de file_path
@@ -190,7 +390,8 @@ def update_video(
 async def download_video(
     video_id: int,
     request: Request,  # Añadir Request para verificar el método
-    db: Session = Depends(get_db)
+    rendition: Optional[str] = Query(None, description="Perfil de versión recodificada (p. ej. 1080p30)"),
+    db: AsyncSession = Depends(get_player_async_db)
 ):
     """
     Endpoint para descargar un video completo.
@@ -198,14 +399,17 @@ async def download_video(
     """
     try:
         # Buscar el video en la base de datos
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = await db.get(Video, video_id)
         if not video:
             raise HTTPException(status_code=404, detail="Video no encontrado")
         
+        # Versión del perfil del reproductor si está lista; si no, el original
+        file_path = await db.run_sync(resolve_download_path, video, rendition)
+        
         # Verificar que el archivo existe
-        video_path = Path(video.file_path)
+        video_path = Path(file_path)
         if not video_path.exists() or not video_path.is_file():
-            logger.error(f"Archivo de video no encontrado: {video.file_path}")
+            logger.error(f"Archivo de video no encontrado: {file_path}")
             raise HTTPException(status_code=404, detail="Archivo de video no encontrado")
         
         # Generar un nombre de archivo para la descarga
@@ -213,6 +417,10 @@ async def download_video(
         # Sanitizar el nombre de archivo para evitar caracteres inválidos
         download_filename = "".join(c for c in download_filename if c.isalnum() or c in "._- ")
         
+        # Cubetas de tokens del despliegue escalonado (global y por tienda)
+        device = await db.run_sync(device_for_request, request)
+        completes = admit_download(request, video_path.stat().st_size, device.tienda if device else None)
+        
         # Para solicitudes HEAD, solo devolver los headers sin el cuerpo
         if request.method == "HEAD":
             # Obtener tamaño del archivo
@@ -226,16 +434,21 @@ async def download_video(
                 "Accept-Ranges": "bytes"
             }
             
-            logger.info(f"Verificación HEAD para video ID {video_id}: {video.file_path}")
+            logger.info(f"Verificación HEAD para video ID {video_id}: {file_path}")
             return Response(headers=headers)
         
         # Para solicitudes GET, devolver el archivo completo
-        logger.info(f"Descargando video ID {video_id}: {video.file_path} como {download_filename}")
+        logger.info(f"Descargando video ID {video_id}: {file_path} como {download_filename}")
+        
+        background = None
+        if device is not None and completes:
+            background = BackgroundTask(record_download_in_background, device.device_id, video.id)
         
         return FileResponse(
-            path=video.file_path,
+            path=file_path,
             filename=download_filename,
-            media_type="application/octet-stream"  # Forzar descarga en lugar de reproducción
+            media_type="application/octet-stream",  # Forzar descarga en lugar de reproducción
+            background=background
         )
         
     except HTTPException:
@@ -244,6 +457,43 @@ async def download_video(
         logger.error(f"Error al procesar video {video_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al procesar el video: {str(e)}")
 
+@router.get("/{video_id}/thumbnail")
+def get_video_thumbnail(
+    video_id: int,
+    size: str = Query(DEFAULT_SIZE),
+    v: Optional[str] = Query(None, description="Versión del contenido (prefijo del hash)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Miniatura o poster de un video. Si aún no existe se encola su generación
+    y se devuelve la imagen genérica sin cachear.
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tamaño no válido. Opciones: {', '.join(THUMBNAIL_SIZES)}"
+        )
+    
+    video = db.query(Video).filter(Video.id == video_id).first()
+    if not video:
+        raise HTTPException(status_code=404, detail="Video no encontrado")
+    
+    key = thumbnail_key(video)
+    if key is not None:
+        path = thumbnail_path(key, size)
+        if os.path.exists(path):
+            # Con la versión en la URL el contenido no puede cambiar: caché de un año
+            versioned = bool(v and video.content_hash and video.content_hash.startswith(v))
+            cache_control = "public, max-age=31536000, immutable" if versioned else "public, max-age=86400"
+            return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": cache_control})
+        thumbnail_pool.submit_video(video)
+    
+    return FileResponse(
+        THUMBNAIL_PLACEHOLDER,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "no-store"}
+    )
+
 @router.delete("/{video_id}")
 def delete_video(
     video_id: int, 
@@ -256,18 +506,25 @@ def delete_video(
         if video is None:
             raise HTTPException(status_code=404, detail="Video no encontrado")
         
-        # Eliminar el archivo físico si existe
-        if video.file_path and os.path.exists(video.file_path):
-            try:
-                os.remove(video.file_path)
-                logger.info(f"Archivo físico eliminado: {video.file_path}")
-            except OSError as e:
-                logger.warning(f"No se pudo eliminar el archivo físico: {e}")
+        # Los videos direccionados por contenido comparten archivo: solo se borra
+        # cuando ningún otro video lo referencia
+        if video.content_hash:
+            orphan_path = video_storage.release_blob(db, video.content_hash)
+        else:
+            orphan_path = video.file_path
+        orphan_thumbnails = thumbnail_key(video) if orphan_path else None
+        orphan_renditions = orphaned_rendition_files(db, video)
         
         # Eliminar de la base de datos
         db.delete(video)
         db.commit()
         
+        # Eliminar el archivo físico y sus miniaturas tras confirmar el borrado
+        video_storage.remove_file(orphan_path)
+        remove_thumbnails(orphan_thumbnails)
+        for rendition_path in orphan_renditions:
+            video_storage.remove_file(rendition_path)
+        
         logger.info(f"Video {video_id} eliminado exitosamente")
         return {"message": "Video eliminado correctamente"}
         
@@ -350,14 +607,14 @@ def list_upload_files():
 async def stream_video(
     video_id: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_player_async_db)
 ):
     """
     Endpoint para streaming de videos con soporte para rangos de bytes.
     Permite la reproducción directa en el navegador con seeking.
     """
     # Buscar el video en la base de datos
-    video = db.query(Video).filter(Video.id == video_id).first()
+    video = await db.get(Video, video_id)
     if not video:
         raise HTTPException(status_code=404, detail="Video no encontrado")
     
@@ -373,73 +630,26 @@ async def stream_video(
     # Determinar el tipo de contenido basado en la extensión del archivo
     content_type = get_content_type(video_path)
     
-    # Implementar soporte para rangos de bytes (byte ranges)
+    # Implementar soporte para rangos de bytes (byte ranges), incluidos sufijos (bytes=-N)
     # Esto permite la búsqueda (seeking) en el reproductor de video
-    range_header = request.headers.get("Range", "").strip()
-    
-    start_byte = 0
-    end_byte = file_size - 1
-    
-    # Procesar el header Range si existe
-    if range_header and range_header.startswith("bytes="):
-        range_data = range_header.replace("bytes=", "").split("-")
-        
-        if len(range_data) == 2:
-            if range_data[0]:
-                start_byte = int(range_data[0])
-            if range_data[1]:
-                end_byte = min(int(range_data[1]), file_size - 1)
-    
-    # Calcular el tamaño del contenido a enviar
-    content_length = end_byte - start_byte + 1
-    
-    # Definir la función para leer el archivo por partes
-    async def video_stream_generator():
-        """
-        Generador asíncrono para transmitir el archivo por partes.
-        """
-        with open(video.file_path, "rb") as video_file:
-            # Mover el puntero al byte inicial
-            video_file.seek(start_byte)
-            
-            # Tamaño del fragmento a leer cada vez
-            chunk_size = 1024 * 1024  # 1MB
-            bytes_sent = 0
-            
-            # Leer y enviar fragmentos hasta completar el rango solicitado
-            while bytes_sent < content_length:
-                # Leer el siguiente fragmento
-                remaining = content_length - bytes_sent
-                chunk = video_file.read(min(chunk_size, remaining))
-                
-                if not chunk:
-                    break
-                
-                bytes_sent += len(chunk)
-                yield chunk
-    
-    # Headers HTTP para la respuesta
-    headers = {
-        "Content-Type": content_type,
-        "Content-Length": str(content_length),
-        "Accept-Ranges": "bytes",
-    }
+    try:
+        byte_range = parse_byte_range(request.headers.get("Range"), file_size)
+    except RangeNotSatisfiable:
+        logger.info(f"Rango no satisfacible para video ID {video_id}: {request.headers.get('Range')}")
+        return range_not_satisfiable_response(file_size)
     
-    # Si es una solicitud de rango, agregar el header Content-Range
-    if range_header:
-        headers["Content-Range"] = f"bytes {start_byte}-{end_byte}/{file_size}"
-        status_code = 206  # Partial Content
-    else:
-        status_code = 200  # OK
+    start_byte, end_byte = byte_range if byte_range else (0, file_size - 1)
     
     # Registrar en el log el streaming
     logger.info(f"Streaming video ID {video_id}: {start_byte}-{end_byte}/{file_size} ({content_type})")
     
-    # Devolver la respuesta de streaming
-    return StreamingResponse(
-        video_stream_generator(),
-        status_code=status_code,
-        headers=headers
+    # El envío se hace con sendfile si el servidor lo soporta o con lecturas en hilos,
+    # nunca con lecturas bloqueantes en el event loop
+    return RangeFileResponse(
+        path=str(video_path),
+        file_size=file_size,
+        media_type=content_type,
+        byte_range=byte_range
     )
 
 def get_content_type(file_path: Path) -> str:
@@ -470,7 +680,7 @@ def get_content_type(file_path: Path) -> str:
     # Añade o modifica este endpoint en router/videos.py
 
 @router.get("/{video_id}/info", response_model=dict)
-async def get_video_info(
+def get_video_info(
     video_id: int,
     db: Session = Depends(get_db)
 ):
@@ -500,9 +710,19 @@ async def get_video_info(
             "upload_date": video.upload_date,
             "duration": video.duration,
             "expiration_date": video.expiration_date,
+            "content_hash": video.content_hash,
+            "width": video.width,
+            "height": video.height,
+            "video_codec": video.video_codec,
+            "audio_codec": video.audio_codec,
+            "bitrate": video.bitrate,
+            "container": video.container,
             # Añadir propiedades derivadas
             "file_exists": file_exists,
             "file_name": file_name,  # Usar file_name en lugar de filename
+            "resolution": video.resolution,
+            "thumbnail": video.thumbnail,
+            "poster": video.poster,
             # Propiedades formateadas para el frontend
             "formatted_duration": video.formatted_duration if hasattr(video, 'formatted_duration') else formatDuration(video.duration),
             "formatted_file_size": video.formatted_file_size if hasattr(video, 'formatted_file_size') else formatFileSize(video.file_size)
@@ -0,0 +1,374 @@
+# services/chunked_upload.py - Subidas de video por partes y reanudables
+
+"""
+Protocolo de subida reanudable al estilo tus:
+
+    1. POST   /api/videos/uploads                 crea la subida (tamaño total y metadatos)
+    2. PATCH  /api/videos/uploads/{id}            envía bytes a partir de Upload-Offset
+       HEAD   /api/videos/uploads/{id}            consulta el offset confirmado tras un corte
+    3. POST   /api/videos/uploads/{id}/finalize   crea el Video cuando el offset llega al total
+
+Los bytes se escriben con E/S asíncrona directamente en un archivo dentro de
+uploads/ (el mismo sistema de archivos que los blobs), así que al finalizar el
+archivo se renombra a su dirección de contenido sin copiarlo. El SHA-256 se
+calcula mientras llegan las partes; si el proceso se reinició a mitad de la
+subida, se recalcula una vez al finalizar.
+
+La sesión es la síncrona de get_db: cada paso de base de datos (y el
+renombrado del blob) se ejecuta en el threadpool para no bloquear el event
+loop mientras se atienden otras subidas.
+
+Una subida que no recibe partes durante UPLOAD_EXPIRY_HOURS caduca: la tarea
+periódica de start_upload_sweeper() borra su fila, su archivo parcial y su
+estado en memoria.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from models.database import SessionLocal
+from models.models import Video, VideoUpload
+from services import video_storage
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo aceptado para una subida (por defecto 20 GB)
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(20 * 1024 ** 3)))
+
+# Horas sin recibir partes tras las que una subida se abandona
+UPLOAD_EXPIRY_HOURS = float(os.getenv("UPLOAD_EXPIRY_HOURS", "24"))
+
+# Segundos entre barridos de subidas caducadas
+UPLOAD_SWEEP_INTERVAL = float(os.getenv("UPLOAD_SWEEP_INTERVAL", "3600"))
+
+
+class UploadError(Exception):
+    """Error de protocolo en una subida por partes"""
+
+    status_code = 400
+
+    def __init__(self, message: str, offset: Optional[int] = None):
+        self.offset = offset
+        super().__init__(message)
+
+
+class UploadConflict(UploadError):
+    """El offset enviado no coincide con el confirmado, o hay otra parte en curso"""
+
+    status_code = 409
+
+
+class UploadTooLarge(UploadError):
+    """Se enviaron más bytes de los declarados al crear la subida"""
+
+    status_code = 413
+
+
+class UploadGone(UploadError):
+    """El archivo parcial ya no existe en disco"""
+
+    status_code = 410
+
+
+# Estado en memoria por subida: SHA-256 incremental con el offset hasta el que
+# es válido, y un candado para no aceptar dos PATCH a la vez en el mismo proceso
+_hash_states: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _lock_for(upload_id: str) -> asyncio.Lock:
+    lock = _locks.get(upload_id)
+    if lock is None:
+        lock = _locks[upload_id] = asyncio.Lock()
+    return lock
+
+
+def _forget(upload_id: str):
+    _hash_states.pop(upload_id, None)
+    _locks.pop(upload_id, None)
+
+
+def upload_expires_at(upload: VideoUpload) -> datetime:
+    """Momento en que caduca la subida si no recibe más partes"""
+    return (upload.updated_at or upload.created_at) + timedelta(hours=UPLOAD_EXPIRY_HOURS)
+
+
+async def create_upload(db: Session, title: str, upload_length: int,
+                        description: Optional[str] = None,
+                        expiration_date: Optional[datetime] = None,
+                        filename: Optional[str] = None) -> VideoUpload:
+    """Registra una subida nueva y crea su archivo parcial vacío"""
+    if upload_length > UPLOAD_MAX_SIZE:
+        raise UploadTooLarge(f"El archivo supera el máximo permitido de {UPLOAD_MAX_SIZE} bytes")
+
+    extension = os.path.splitext(filename)[1] if filename else ".mp4"
+    temp_path = video_storage.new_temp_path(extension)
+    async with aiofiles.open(temp_path, "wb"):
+        pass
+
+    def insert() -> VideoUpload:
+        upload = VideoUpload(
+            title=title,
+            description=description,
+            expiration_date=expiration_date,
+            filename=filename,
+            upload_length=upload_length,
+            upload_offset=0,
+            temp_path=temp_path
+        )
+        db.add(upload)
+        db.commit()
+        db.refresh(upload)
+        return upload
+
+    upload = await run_in_threadpool(insert)
+
+    _hash_states[upload.id] = (0, hashlib.sha256())
+    logger.info(f"Subida {upload.id} creada: {title} ({upload_length} bytes)")
+    return upload
+
+
+async def append_chunk(db: Session, upload: VideoUpload, offset: int,
+                       chunks: AsyncIterator[bytes]) -> int:
+    """
+    Escribe una parte de la subida a partir de offset
+
+    Lo recibido se confirma aunque la conexión se corte a mitad de la parte,
+    de modo que el cliente puede reanudar desde el offset devuelto por HEAD.
+
+    Args:
+        db: Sesión de base de datos
+        upload: Subida en curso
+        offset: Valor de Upload-Offset enviado por el cliente
+        chunks: Cuerpo de la petición como iterador asíncrono
+
+    Returns:
+        Nuevo offset confirmado
+    """
+    upload_id = upload.id
+    current = upload.upload_offset
+    length = upload.upload_length
+    temp_path = upload.temp_path
+
+    if offset != current:
+        raise UploadConflict("Upload-Offset no coincide con el offset actual", offset=current)
+    if upload_expires_at(upload) <= datetime.now():
+        raise UploadGone("La subida ha caducado")
+    if not os.path.exists(temp_path):
+        raise UploadGone("El archivo parcial de la subida ya no existe")
+
+    lock = _lock_for(upload_id)
+    if lock.locked():
+        raise UploadConflict("Ya hay otra parte de esta subida en curso", offset=current)
+
+    async with lock:
+        # Terminar la transacción para no retener una conexión del pool mientras llegan bytes
+        await run_in_threadpool(db.commit)
+
+        state = _hash_states.get(upload_id)
+        hasher = state[1] if state is not None and state[0] == offset else None
+        if hasher is None:
+            _hash_states.pop(upload_id, None)
+
+        written = 0
+        overflow = False
+        try:
+            async with aiofiles.open(temp_path, "r+b") as target:
+                await target.seek(offset)
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    room = length - offset - written
+                    if len(chunk) > room:
+                        chunk = chunk[:room]
+                        overflow = True
+                    await target.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    written += len(chunk)
+                    if overflow:
+                        break
+                # Descartar restos de un intento anterior que no llegó a confirmarse
+                await target.truncate(offset + written)
+        finally:
+            new_offset = offset + written
+            if hasher is not None:
+                _hash_states[upload_id] = (new_offset, hasher)
+            updated = await run_in_threadpool(_confirm_offset, db, upload_id, offset, new_offset)
+
+        if not updated:
+            # Otro proceso avanzó la subida a la vez: el hash incremental ya no es fiable
+            _hash_states.pop(upload_id, None)
+            raise UploadConflict("La subida fue modificada por otra petición")
+        if overflow:
+            raise UploadTooLarge("Se enviaron más bytes que el tamaño declarado", offset=new_offset)
+
+        return new_offset
+
+
+def _confirm_offset(db: Session, upload_id: str, offset: int, new_offset: int) -> int:
+    """Avanza el offset confirmado si nadie lo cambió desde `offset`; devuelve las filas actualizadas"""
+    updated = db.query(VideoUpload).filter(
+        VideoUpload.id == upload_id,
+        VideoUpload.upload_offset == offset
+    ).update(
+        {VideoUpload.upload_offset: new_offset, VideoUpload.updated_at: datetime.now()},
+        synchronize_session=False
+    )
+    db.commit()
+    return updated
+
+
+def _create_video(db: Session, upload: VideoUpload, content_hash: str) -> Video:
+    """Mueve el archivo parcial a su blob y sustituye la subida por el Video"""
+    file_size = upload.upload_offset
+    extension = os.path.splitext(upload.temp_path)[1]
+    blob = video_storage.acquire_blob(db, content_hash, upload.temp_path, file_size, extension)
+
+    video = Video(
+        title=upload.title,
+        description=upload.description,
+        file_path=blob.file_path,
+        file_size=file_size,
+        content_hash=content_hash,
+        upload_date=datetime.now(),
+        expiration_date=upload.expiration_date
+    )
+    db.add(video)
+    db.delete(upload)
+    db.commit()
+    db.refresh(video)
+    return video
+
+
+async def finalize_upload(db: Session, upload: VideoUpload) -> Video:
+    """
+    Convierte una subida completa en un Video
+
+    El archivo parcial pasa a su dirección de contenido con un renombrado y el
+    tamaño se toma del offset confirmado, sin volver a consultar el disco.
+    """
+    if upload.upload_offset != upload.upload_length:
+        raise UploadConflict(
+            f"Subida incompleta: {upload.upload_offset} de {upload.upload_length} bytes",
+            offset=upload.upload_offset
+        )
+    if not os.path.exists(upload.temp_path):
+        raise UploadGone("El archivo parcial de la subida ya no existe")
+
+    upload_id = upload.id
+    lock = _lock_for(upload_id)
+    if lock.locked():
+        raise UploadConflict("Ya hay otra parte de esta subida en curso", offset=upload.upload_offset)
+
+    async with lock:
+        state = _hash_states.get(upload_id)
+        if state is not None and state[0] == upload.upload_length:
+            content_hash = state[1].hexdigest()
+        else:
+            logger.info(f"Recalculando hash de la subida {upload_id} tras un reinicio")
+            content_hash, _ = await run_in_threadpool(video_storage.hash_file, upload.temp_path)
+
+        video = await run_in_threadpool(_create_video, db, upload, content_hash)
+
+    _forget(upload_id)
+    logger.info(f"Subida {upload_id} finalizada como video ID {video.id} (sha256 {content_hash[:12]})")
+    return video
+
+
+def abort_upload(db: Session, upload: VideoUpload):
+    """Cancela una subida y elimina su archivo parcial"""
+    temp_path = upload.temp_path
+    upload_id = upload.id
+    db.delete(upload)
+    db.commit()
+    video_storage.remove_file(temp_path)
+    _forget(upload_id)
+    logger.info(f"Subida {upload_id} cancelada")
+
+
+def expire_uploads(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    Elimina las subidas caducadas con sus archivos parciales
+
+    Las subidas con una parte en curso en este proceso se respetan, y la fila
+    solo se borra si nadie la ha actualizado desde la consulta. También se
+    descarta el estado en memoria de subidas que ya no existen.
+
+    Returns:
+        Número de subidas eliminadas
+    """
+    cutoff = (now or datetime.now()) - timedelta(hours=UPLOAD_EXPIRY_HOURS)
+    expired = db.query(VideoUpload.id, VideoUpload.temp_path).filter(VideoUpload.updated_at < cutoff).all()
+
+    removed = 0
+    for upload_id, temp_path in expired:
+        lock = _locks.get(upload_id)
+        if lock is not None and lock.locked():
+            continue
+        deleted = db.query(VideoUpload).filter(
+            VideoUpload.id == upload_id,
+            VideoUpload.updated_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            video_storage.remove_file(temp_path)
+            _forget(upload_id)
+            removed += 1
+
+    tracked = set(_hash_states) | set(_locks)
+    if tracked:
+        alive = {upload_id for upload_id, in db.query(VideoUpload.id).filter(VideoUpload.id.in_(tracked))}
+        for upload_id in tracked - alive:
+            lock = _locks.get(upload_id)
+            if lock is None or not lock.locked():
+                _forget(upload_id)
+
+    if removed:
+        logger.info(f"{removed} subidas caducadas eliminadas")
+    return removed
+
+
+def _sweep_expired_uploads() -> int:
+    db = SessionLocal()
+    try:
+        return expire_uploads(db)
+    finally:
+        db.close()
+
+
+async def _sweep_loop():
+    while True:
+        await asyncio.sleep(UPLOAD_SWEEP_INTERVAL)
+        try:
+            await run_in_threadpool(_sweep_expired_uploads)
+        except Exception as e:
+            logger.error(f"Error al eliminar subidas caducadas: {e}")
+
+
+def start_upload_sweeper(app):
+    """
+    Registra el barrido periódico de subidas caducadas en el ciclo de vida de la app
+
+    Args:
+        app: Instancia de FastAPI
+    """
+    state = {}
+
+    @app.on_event("startup")
+    async def start_sweeper():
+        state["task"] = asyncio.create_task(_sweep_loop())
+
+    @app.on_event("shutdown")
+    async def stop_sweeper():
+        task = state.get("task")
+        if task is not None:
+            task.cancel()
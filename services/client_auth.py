@@ -0,0 +1,170 @@
+# services/client_auth.py - Caché de tokens verificados de la API de clientes
+
+"""
+Caché LRU de tokens JWT ya verificados de /api/client, asociados a un
+principal ligero del dispositivo (sin sesión ORM). Con un acierto, la
+autenticación no decodifica el JWT ni consulta la base de datos.
+
+Una entrada vive hasta la expiración del token (claim `exp`) y, como red de
+seguridad frente a cambios hechos por otros procesos, no más de
+CLIENT_TOKEN_CACHE_TTL segundos. Las entradas de un dispositivo se descartan
+al desactivarlo, borrarlo o cambiar su tienda o modelo (mismos eventos de
+sesión que los manifiestos, ver manifest_cache.add_change_listener).
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from services.manifest_cache import add_change_listener
+
+logger = logging.getLogger(__name__)
+
+CLIENT_TOKEN_CACHE_SIZE = int(os.getenv("CLIENT_TOKEN_CACHE_SIZE", "10000"))
+CLIENT_TOKEN_CACHE_TTL = float(os.getenv("CLIENT_TOKEN_CACHE_TTL", "300"))
+
+
+class DevicePrincipal:
+    """Datos del dispositivo autenticado que necesitan los endpoints de clientes"""
+
+    __slots__ = ("device_id", "is_active", "tienda", "model")
+
+    def __init__(self, device_id: str, is_active: bool, tienda: Optional[str], model: Optional[str]):
+        self.device_id = device_id
+        self.is_active = is_active
+        self.tienda = tienda
+        self.model = model
+
+    @classmethod
+    def from_device(cls, device) -> "DevicePrincipal":
+        return cls(device.device_id, bool(device.is_active), device.tienda, device.model)
+
+
+class _CachedToken:
+    __slots__ = ("principal", "expires_at")
+
+    def __init__(self, principal: DevicePrincipal, expires_at: float):
+        self.principal = principal
+        self.expires_at = expires_at
+
+
+def _token_key(token: str) -> str:
+    # No se guardan los tokens en claro
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class ClientTokenCache:
+    """Tokens verificados -> DevicePrincipal, acotada y con expiración por token"""
+
+    def __init__(self, max_entries: int = CLIENT_TOKEN_CACHE_SIZE, ttl: float = CLIENT_TOKEN_CACHE_TTL):
+        """
+        Args:
+            max_entries: Tokens en memoria (se descartan los menos usados)
+            ttl: Segundos máximos de vida de una entrada aunque el token siga vigente
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _CachedToken]" = OrderedDict()
+        # Claves de cada dispositivo, para invalidar sin recorrer toda la caché
+        self._by_device: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        # Evita guardar principales leídos antes de una invalidación concurrente
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, token: str) -> Optional[DevicePrincipal]:
+        key = _token_key(token)
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached.expires_at <= now:
+                self._remove(key)
+                cached = None
+            if cached is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached.principal
+
+    def put(self, token: str, principal: DevicePrincipal, token_expires_at: Optional[float],
+            generation: int):
+        """
+        Guarda un token verificado
+
+        Args:
+            token: JWT tal como llegó en Authorization
+            principal: Dispositivo autenticado
+            token_expires_at: Claim `exp` (segundos epoch), o None si no tiene
+            generation: Valor de `generation` leído antes de consultar la BD
+        """
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        key = _token_key(token)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = _CachedToken(principal, expires_at)
+            self._by_device.setdefault(principal.device_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        cached = self._entries.pop(key, None)
+        if cached is None:
+            return
+        keys = self._by_device.get(cached.principal.device_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_device[cached.principal.device_id]
+
+    def invalidate_devices(self, device_ids):
+        with self._lock:
+            self._generation += 1
+            for device_id in device_ids:
+                for key in list(self._by_device.get(device_id, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._by_device.clear()
+
+    def apply_changes(self, changes: dict):
+        """Callback de manifest_cache.add_change_listener"""
+        if changes["all"]:
+            self.invalidate_all()
+        elif changes["devices"]:
+            self.invalidate_devices(changes["devices"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "devices": len(self._by_device),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "ttl_seconds": self.ttl,
+            }
+
+
+# Instancia global de la caché
+client_token_cache = ClientTokenCache()
+add_change_listener(client_token_cache.apply_changes)
@@ -0,0 +1,225 @@
+# services/heartbeat_buffer.py - Buffer de escritura diferida para last_seen
+
+"""
+Buffer en memoria para los latidos (last_seen) de los dispositivos.
+
+Los endpoints de reproductores registran aquí el momento de cada sondeo en
+lugar de hacer un commit por petición. Un flusher periódico vuelca el último
+valor de cada dispositivo con un único UPDATE ... FROM (VALUES ...).
+
+Configuración por variables de entorno:
+    HEARTBEAT_FLUSH_INTERVAL: segundos entre volcados (por defecto 15)
+    HEARTBEAT_MAX_PENDING: dispositivos pendientes que fuerzan un volcado anticipado (por defecto 5000)
+    HEARTBEAT_BATCH_SIZE: filas por sentencia UPDATE (por defecto 1000)
+"""
+
+import os
+import time
+import asyncio
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from models.database import PlayerSessionLocal
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FLUSH_INTERVAL = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL", "15"))
+HEARTBEAT_MAX_PENDING = int(os.getenv("HEARTBEAT_MAX_PENDING", "5000"))
+HEARTBEAT_BATCH_SIZE = int(os.getenv("HEARTBEAT_BATCH_SIZE", "1000"))
+
+
+class HeartbeatBuffer:
+    """
+    Acumula el último last_seen por dispositivo y lo vuelca en bloque
+    """
+
+    def __init__(self, session_factory=PlayerSessionLocal,
+                 flush_interval: float = HEARTBEAT_FLUSH_INTERVAL,
+                 max_pending: int = HEARTBEAT_MAX_PENDING,
+                 batch_size: int = HEARTBEAT_BATCH_SIZE):
+        """
+        Args:
+            session_factory: Fábrica de sesiones usada para el volcado
+            flush_interval: Segundos entre volcados periódicos
+            max_pending: Tamaño del buffer que dispara un volcado anticipado
+            batch_size: Número máximo de filas por sentencia UPDATE
+        """
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.running = False
+
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        # Serializa los volcados (periódico, anticipado y de apagado)
+        self._flush_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Métricas
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.last_flush_at: Optional[datetime] = None
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def record(self, device_id: str, seen_at: Optional[datetime] = None):
+        """Registra un latido del dispositivo (solo memoria, sin SQL)"""
+        if not device_id:
+            return
+        seen_at = seen_at or datetime.now()
+        with self._lock:
+            previous = self._pending.get(device_id)
+            if previous is None or seen_at > previous:
+                self._pending[device_id] = seen_at
+            self.recorded += 1
+            pending = len(self._pending)
+
+        if pending >= self.max_pending and self._wakeup is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Vuelca el buffer a la base de datos
+
+        Returns:
+            Número de dispositivos actualizados en este volcado
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            db = self.session_factory()
+            try:
+                items = list(batch.items())
+                for offset in range(0, len(items), self.batch_size):
+                    self._execute_update(db, items[offset:offset + self.batch_size])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self.flush_errors += 1
+                self._restore(batch)
+                logger.error(f"Error al volcar latidos de {len(batch)} dispositivos: {str(e)}")
+                return 0
+            finally:
+                db.close()
+
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self.last_flush_at = datetime.now()
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            logger.debug(f"Latidos volcados: {len(batch)} dispositivos en {elapsed * 1000:.1f} ms")
+            return len(batch)
+
+    def _execute_update(self, db, items):
+        params = {}
+        for index, (device_id, seen_at) in enumerate(items):
+            params[f"d{index}"] = device_id
+            params[f"t{index}"] = seen_at
+
+        if db.get_bind().dialect.name == "postgresql":
+            values = ", ".join(
+                f"(:d{index}, CAST(:t{index} AS TIMESTAMP))" for index in range(len(items))
+            )
+            db.execute(text(
+                "UPDATE devices SET last_seen = v.last_seen "
+                f"FROM (VALUES {values}) AS v(device_id, last_seen) "
+                "WHERE devices.device_id = v.device_id"
+            ), params)
+        else:
+            # Otros motores (SQLite en tests) no soportan UPDATE ... FROM (VALUES)
+            db.execute(
+                text("UPDATE devices SET last_seen = :last_seen WHERE device_id = :device_id"),
+                [{"device_id": device_id, "last_seen": seen_at} for device_id, seen_at in items]
+            )
+
+    def _restore(self, batch: Dict[str, datetime]):
+        """Devuelve al buffer un lote que no se pudo volcar, sin pisar latidos más recientes"""
+        with self._lock:
+            for device_id, seen_at in batch.items():
+                current = self._pending.get(device_id)
+                if current is None or seen_at > current:
+                    self._pending[device_id] = seen_at
+
+    async def start(self):
+        """Ejecuta el volcado periódico hasta que se llame a stop()"""
+        if self.running:
+            logger.warning("El volcador de latidos ya está en ejecución")
+            return
+
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        logger.info(f"Iniciando volcador de latidos cada {self.flush_interval} segundos")
+
+        try:
+            while self.running:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await asyncio.to_thread(self.flush)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.running = False
+
+    async def stop(self):
+        """Detiene el volcador y vuelca lo pendiente"""
+        logger.info("Deteniendo volcador de latidos")
+        self.running = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> dict:
+        """Métricas del buffer y de los volcados"""
+        return {
+            "pending": self.pending_count(),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+            "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 2),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+            "flush_interval_seconds": self.flush_interval,
+            "max_pending": self.max_pending,
+        }
+
+
+# Instancia global del buffer
+heartbeat_buffer = HeartbeatBuffer()
+
+
+def start_heartbeat_flusher(app):
+    """
+    Registra el volcado periódico de latidos en el ciclo de vida de la app
+
+    Args:
+        app: Instancia de FastAPI
+    """
+    @app.on_event("startup")
+    async def start_flusher():
+        asyncio.create_task(heartbeat_buffer.start())
+
+    @app.on_event("shutdown")
+    async def stop_flusher():
+        await heartbeat_buffer.stop()
@@ -0,0 +1,530 @@
+# services/manifest_cache.py - Caché de manifiestos de playlists por dispositivo
+
+"""
+Caché en memoria de los manifiestos que consultan los reproductores.
+
+Cada entrada guarda la respuesta ya construida para un dispositivo (o para la
+consulta global sin dispositivo) junto con los IDs de playlists y videos de los
+que depende. Las entradas se invalidan:
+
+- Al confirmar (commit) cambios ORM sobre Playlist, PlaylistVideo,
+  DevicePlaylist o Video que afecten a la entrada, o al eliminar el Device.
+- Al alcanzar la siguiente fecha de expiración de una playlist o video incluido.
+- Al alcanzar la siguiente start_date de una playlist asignada (o de cualquier
+  playlist en la consulta global), por si el PlaylistChecker no está en marcha
+  para activarla y disparar la invalidación con su commit.
+- Al cumplirse MANIFEST_CACHE_TTL, como red de seguridad frente a escrituras
+  hechas fuera de este proceso (SQL manual, otros workers).
+"""
+
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session, selectinload
+
+from models.models import Playlist, Video, PlaylistVideo, DevicePlaylist, Device, VideoRendition
+from services.manifest_delta import ManifestSummary, summarize_manifest
+from services.rollout import manifest_hints
+from services.transcoding import READY, profile_for_model, ready_renditions
+from utils.etag import etag_matches
+
+logger = logging.getLogger(__name__)
+
+# Segundos máximos que una entrada puede vivir sin ser reconstruida
+MANIFEST_CACHE_TTL = int(os.getenv("MANIFEST_CACHE_TTL", "300"))
+
+# Versiones anteriores recordadas por dispositivo para servir deltas
+MANIFEST_HISTORY_DEPTH = int(os.getenv("MANIFEST_HISTORY_DEPTH", "16"))
+
+# Variantes de manifiesto según la API que lo sirve
+RASPBERRY = "raspberry"
+CLIENT = "client"
+
+VIDEO_URL_TEMPLATES = {
+    RASPBERRY: "/api/videos/{video_id}/download",
+    CLIENT: "/api/client/videos/{video_id}/download",
+}
+
+# Clave reservada en session.info para los cambios pendientes de aplicar
+_PENDING_KEY = "manifest_cache_pending"
+
+
+class ManifestEntry:
+    """Manifiesto construido para un dispositivo y sus dependencias"""
+
+    __slots__ = ("device_id", "flavor", "payload", "body", "version", "playlist_ids",
+                 "video_ids", "valid_until", "built_at")
+
+    def __init__(self, device_id: Optional[str], flavor: str, payload: list,
+                 playlist_ids: Iterable[int], video_ids: Iterable[int],
+                 valid_until: datetime, built_at: datetime):
+        self.device_id = device_id
+        self.flavor = flavor
+        self.payload = payload
+        # Cuerpo JSON serializado una sola vez y su hash como versión del manifiesto
+        self.body = serialize_manifest(payload)
+        self.version = hashlib.sha256(self.body).hexdigest()
+        self.playlist_ids = frozenset(playlist_ids)
+        self.video_ids = frozenset(video_ids)
+        self.valid_until = valid_until
+        self.built_at = built_at
+
+    @property
+    def etag(self) -> str:
+        """ETag fuerte derivado de la versión"""
+        return f'"{self.version}"'
+
+    def is_fresh(self, now: datetime) -> bool:
+        """Indica si la entrada sigue vigente en el instante dado"""
+        return now < self.valid_until
+
+
+class ManifestCache:
+    """
+    Almacén de manifiestos con invalidación por dependencias.
+
+    Las entradas se indexan por (device_id, variante). device_id None
+    representa la consulta global de playlists activas, que depende de todas
+    las playlists y videos.
+    """
+
+    def __init__(self, ttl: int = MANIFEST_CACHE_TTL,
+                 history_depth: int = MANIFEST_HISTORY_DEPTH):
+        self.ttl = ttl
+        self.history_depth = history_depth
+        self._entries: Dict[Tuple[Optional[str], str], ManifestEntry] = {}
+        # Resúmenes de versiones servidas: (device_id, variante) -> {versión: resumen}
+        self._history: Dict[Tuple[Optional[str], str], "OrderedDict[str, ManifestSummary]"] = {}
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación; evita guardar manifiestos
+        # construidos con datos que cambiaron mientras se construían
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Callbacks invocados con los device_id de las entradas invalidadas
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registra un callback(device_ids) que se llama tras cada invalidación"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, device_id: Optional[str], flavor: str,
+            now: Optional[datetime] = None) -> Optional[ManifestEntry]:
+        """Devuelve la entrada vigente o None si hay que reconstruirla"""
+        now = now or datetime.now()
+        key = (device_id, flavor)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry.is_fresh(now):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, entry: ManifestEntry, generation: int) -> bool:
+        """
+        Guarda una entrada si no hubo invalidaciones desde que se empezó a construir
+
+        Args:
+            entry: Manifiesto construido
+            generation: Valor de `generation` leído antes de consultar la BD
+
+        Returns:
+            True si la entrada quedó almacenada
+        """
+        key = (entry.device_id, entry.flavor)
+        summary = summarize_manifest(entry.payload)
+        with self._lock:
+            # La versión se recuerda aunque no se almacene: ya pudo servirse
+            self._remember(key, entry.version, summary)
+            if generation != self._generation:
+                return False
+            self._entries[key] = entry
+            return True
+
+    def _remember(self, key, version: str, summary: ManifestSummary):
+        history = self._history.setdefault(key, OrderedDict())
+        history[version] = summary
+        history.move_to_end(version)
+        while len(history) > self.history_depth:
+            history.popitem(last=False)
+
+    def summary_for(self, device_id: Optional[str], flavor: str,
+                    version: str) -> Optional[ManifestSummary]:
+        """Resumen de una versión servida anteriormente, o None si ya no se recuerda"""
+        with self._lock:
+            history = self._history.get((device_id, flavor))
+            return history.get(version) if history else None
+
+    def invalidate_devices(self, device_ids: Iterable[str]):
+        """Elimina las entradas de los dispositivos indicados"""
+        device_ids = set(device_ids)
+        if device_ids:
+            self._drop(lambda entry: entry.device_id in device_ids)
+
+    def invalidate_playlists(self, playlist_ids: Iterable[int]):
+        """Elimina las entradas que dependen de alguna de las playlists"""
+        playlist_ids = set(playlist_ids)
+        if playlist_ids:
+            self._drop(lambda entry: entry.device_id is None
+                       or not entry.playlist_ids.isdisjoint(playlist_ids))
+
+    def invalidate_videos(self, video_ids: Iterable[int]):
+        """Elimina las entradas que incluyen alguno de los videos"""
+        video_ids = set(video_ids)
+        if video_ids:
+            self._drop(lambda entry: entry.device_id is None
+                       or not entry.video_ids.isdisjoint(video_ids))
+
+    def invalidate_all(self):
+        """Vacía la caché completa"""
+        self._drop(lambda entry: True)
+
+    def _drop(self, predicate):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items() if predicate(entry)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        if stale:
+            logger.debug(f"Manifiestos invalidados: {len(stale)}")
+            device_ids = {device_id for device_id, _flavor in stale}
+            for callback in self._listeners:
+                try:
+                    callback(device_ids)
+                except Exception as e:
+                    logger.error(f"Error notificando invalidación de manifiestos: {str(e)}")
+
+    def peek(self, device_id: Optional[str], flavor: str) -> Optional[ManifestEntry]:
+        """Entrada almacenada (vigente o no) sin contar aciertos ni fallos"""
+        with self._lock:
+            return self._entries.get((device_id, flavor))
+
+    def stats(self) -> dict:
+        """Métricas básicas de uso de la caché"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "generation": self._generation,
+                "ttl_seconds": self.ttl,
+                "history_keys": len(self._history),
+                "history_depth": self.history_depth,
+            }
+
+
+# Instancia global de la caché
+manifest_cache = ManifestCache()
+
+
+def serialize_manifest(payload: list) -> bytes:
+    """Serializa el manifiesto igual que JSONResponse para que el hash sea estable"""
+    return json.dumps(
+        payload,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def manifest_response(request: Request, entry: ManifestEntry,
+                      known_version: Optional[str] = None) -> Response:
+    """
+    Respuesta HTTP para un manifiesto con soporte de peticiones condicionales
+
+    Devuelve 304 sin cuerpo si el cliente ya tiene la versión actual, ya sea
+    por If-None-Match o por la versión indicada en known_version.
+    """
+    headers = {
+        "ETag": entry.etag,
+        # Permite guardar el manifiesto pero obliga a revalidarlo en cada sondeo
+        "Cache-Control": "no-cache",
+    }
+    if known_version == entry.version or etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _video_entry(video: Video, url_template: str, rendition: Optional[VideoRendition],
+                 not_before: Optional[str] = None) -> dict:
+    file_path = url_template.format(video_id=video.id)
+    content_hash = video.content_hash
+    if rendition is not None:
+        file_path += f"?rendition={rendition.profile}"
+        content_hash = rendition.content_hash
+    entry = {
+        "id": video.id,
+        "title": video.title,
+        "file_path": file_path,
+        "duration": video.duration,
+        "content_hash": content_hash,
+        "expiration_date": _isoformat(video.expiration_date)
+    }
+    if not_before:
+        # Inicio de la ventana de descarga escalonada del dispositivo
+        entry["not_before"] = not_before
+    return entry
+
+
+def build_manifest(db: Session, device_id: Optional[str], flavor: str,
+                   now: Optional[datetime] = None,
+                   ttl: int = MANIFEST_CACHE_TTL) -> Optional[ManifestEntry]:
+    """
+    Construye el manifiesto de playlists activas desde la base de datos
+
+    Args:
+        db: Sesión de base de datos
+        device_id: Dispositivo para el que se construye (None para todas las playlists)
+        flavor: Variante de API (RASPBERRY o CLIENT), determina las URLs de descarga
+        now: Momento de referencia (por defecto ahora)
+        ttl: Vida máxima de la entrada en segundos
+
+    Returns:
+        ManifestEntry o None si el dispositivo no existe
+    """
+    now = now or datetime.now()
+    url_template = VIDEO_URL_TEMPLATES[flavor]
+
+    query = db.query(Playlist).options(selectinload(Playlist.videos)).filter(
+        Playlist.is_active == True,
+        (Playlist.expiration_date == None) | (Playlist.expiration_date > now)
+    )
+
+    assigned_ids = set()
+    profile = None
+    if device_id:
+        device = db.query(Device.id, Device.model, Device.tienda).filter(Device.device_id == device_id).first()
+        if device is None:
+            return None
+        profile = profile_for_model(device.model)
+
+        # Todas las playlists asignadas, activas o no: si una inactiva se activa,
+        # el cambio en Playlist debe invalidar esta entrada
+        assigned_ids = {
+            playlist_id for (playlist_id,) in db.query(DevicePlaylist.playlist_id).filter(
+                DevicePlaylist.device_id == device_id
+            )
+        }
+
+        query = query.join(
+            DevicePlaylist,
+            DevicePlaylist.playlist_id == Playlist.id
+        ).filter(DevicePlaylist.device_id == device_id)
+
+    valid_until = now + timedelta(seconds=ttl)
+
+    # Próxima start_date de las playlists de las que depende la entrada
+    next_start = db.query(func.min(Playlist.start_date)).filter(Playlist.start_date > now)
+    if device_id:
+        next_start = next_start.filter(Playlist.id.in_(assigned_ids))
+    next_start = next_start.scalar()
+    if next_start:
+        valid_until = min(valid_until, next_start)
+
+    video_ids = set()
+    payload = []
+    playlists = query.all()
+
+    # Versiones recodificadas para el modelo del dispositivo (si existen)
+    renditions = {}
+    not_before = {}
+    if profile is not None:
+        renditions = ready_renditions(
+            db, {video.id for playlist in playlists for video in playlist.videos}, profile
+        )
+        not_before = manifest_hints(db, device_id, device.tienda, [playlist.id for playlist in playlists])
+
+    for playlist in playlists:
+        if playlist.expiration_date:
+            valid_until = min(valid_until, playlist.expiration_date)
+
+        active_videos = []
+        for video in playlist.videos:
+            video_ids.add(video.id)
+            if not video.expiration_date or video.expiration_date > now:
+                active_videos.append(video)
+                if video.expiration_date:
+                    valid_until = min(valid_until, video.expiration_date)
+
+        # Solo incluir playlists con al menos un video activo
+        if active_videos:
+            payload.append({
+                "id": playlist.id,
+                "title": playlist.title,
+                "description": playlist.description,
+                "expiration_date": _isoformat(playlist.expiration_date),
+                "videos": [
+                    _video_entry(video, url_template, renditions.get(video.id), not_before.get(video.id))
+                    for video in active_videos
+                ]
+            })
+
+    return ManifestEntry(
+        device_id=device_id,
+        flavor=flavor,
+        payload=payload,
+        playlist_ids=assigned_ids,
+        video_ids=video_ids,
+        valid_until=valid_until,
+        built_at=now
+    )
+
+
+def get_manifest(db: Session, device_id: Optional[str], flavor: str,
+                 cache: Optional[ManifestCache] = None) -> Optional[ManifestEntry]:
+    """
+    Devuelve el manifiesto desde la caché, construyéndolo si es necesario
+
+    Returns:
+        ManifestEntry o None si el dispositivo no existe
+    """
+    cache = cache or manifest_cache
+    now = datetime.now()
+
+    entry = cache.get(device_id, flavor, now)
+    if entry is not None:
+        return entry
+
+    generation = cache.generation
+    entry = build_manifest(db, device_id, flavor, now=now, ttl=cache.ttl)
+    if entry is not None:
+        cache.put(entry, generation)
+    return entry
+
+
+# ==========================================
+# INVALIDACIÓN POR EVENTOS DE SESIÓN
+# ==========================================
+
+def _pending(session: Session) -> dict:
+    return session.info.setdefault(_PENDING_KEY, {
+        "all": False,
+        "devices": set(),
+        "playlists": set(),
+        "videos": set(),
+    })
+
+
+def _attribute_values(obj, name: str) -> set:
+    """Valor actual y anterior (si cambió) de un atributo"""
+    history = inspect(obj).attrs[name].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    values.discard(None)
+    return values
+
+
+def _collect_changes(session: Session, flush_context):
+    pending = _pending(session)
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Playlist):
+            pending["playlists"].add(obj.id)
+        elif isinstance(obj, PlaylistVideo):
+            pending["playlists"].update(_attribute_values(obj, "playlist_id"))
+        elif isinstance(obj, DevicePlaylist):
+            pending["devices"].update(_attribute_values(obj, "device_id"))
+        elif isinstance(obj, Video):
+            pending["videos"].add(obj.id)
+        elif isinstance(obj, Device):
+            # Las actualizaciones de métricas y last_seen no afectan al manifiesto;
+            # el modelo sí, porque decide la versión recodificada, y la tienda,
+            # porque decide la ventana de descarga. is_active no cambia el
+            # manifiesto, pero sí las credenciales cacheadas (services/client_auth.py)
+            state = inspect(obj)
+            if obj in session.deleted or any(
+                state.attrs[name].history.has_changes()
+                for name in ("device_id", "model", "tienda", "is_active")
+            ):
+                pending["devices"].update(_attribute_values(obj, "device_id"))
+        elif isinstance(obj, VideoRendition):
+            # Solo importan las versiones que entran o salen del estado "ready"
+            if obj in session.deleted or READY in _attribute_values(obj, "status"):
+                pending["videos"].update(_attribute_values(obj, "video_id"))
+
+
+def _collect_bulk_changes(orm_execute_state):
+    """Las actualizaciones/borrados masivos no exponen filas: invalidar todo"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    if mapper.class_ in (Playlist, PlaylistVideo, DevicePlaylist, Video, Device):
+        _pending(orm_execute_state.session)["all"] = True
+
+
+# Otras cachés que dependen de los mismos cambios (ver add_change_listener)
+_change_listeners = []
+
+
+def add_change_listener(callback):
+    """
+    Registra un callback(cambios) que se llama tras cada commit relevante
+
+    `cambios` es un diccionario con "all" (bool) y los conjuntos "devices",
+    "playlists" y "videos" de IDs modificados.
+    """
+    if callback not in _change_listeners:
+        _change_listeners.append(callback)
+
+
+def _apply_changes(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for callback in _change_listeners:
+        try:
+            callback(pending)
+        except Exception as e:
+            logger.error(f"Error notificando cambios a una caché dependiente: {str(e)}")
+    if pending["all"]:
+        manifest_cache.invalidate_all()
+        return
+    manifest_cache.invalidate_devices(pending["devices"])
+    manifest_cache.invalidate_playlists(pending["playlists"])
+    manifest_cache.invalidate_videos(pending["videos"])
+
+
+def _discard_changes(session: Session, previous_transaction=None):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_manifest_listeners():
+    """Registra los eventos de sesión que mantienen la caché coherente"""
+    listeners = (
+        ("after_flush", _collect_changes),
+        ("do_orm_execute", _collect_bulk_changes),
+        ("after_commit", _apply_changes),
+        ("after_rollback", _discard_changes),
+    )
+    for identifier, fn in listeners:
+        if not event.contains(Session, identifier, fn):
+            event.listen(Session, identifier, fn)
+
+
+register_manifest_listeners()
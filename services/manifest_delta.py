@@ -0,0 +1,98 @@
+# services/manifest_delta.py - Diferencias entre versiones de manifiesto
+
+"""
+Cálculo de deltas entre un manifiesto anterior y el actual.
+
+Para no retener manifiestos completos en memoria, de cada versión anterior
+solo se guarda un resumen compacto: por playlist, un hash de sus metadatos y
+la lista ordenada de (video_id, hash del video). El delta se calcula contra el
+manifiesto actual, del que sí se tiene el contenido completo.
+"""
+
+import json
+import hashlib
+from typing import Dict, List, Tuple
+
+# Campos de playlist que no son la lista de videos
+PLAYLIST_FIELDS = ("title", "description", "expiration_date")
+
+# Resumen: {playlist_id: (hash_metadatos, ((video_id, hash_video), ...))}
+ManifestSummary = Dict[int, Tuple[str, Tuple[Tuple[int, str], ...]]]
+
+
+def _digest(value) -> str:
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def summarize_manifest(payload: list) -> ManifestSummary:
+    """Resumen compacto de un manifiesto para compararlo más adelante"""
+    return {
+        playlist["id"]: (
+            _digest({field: playlist.get(field) for field in PLAYLIST_FIELDS}),
+            tuple((video["id"], _digest(video)) for video in playlist["videos"])
+        )
+        for playlist in payload
+    }
+
+
+def diff_manifest(previous: ManifestSummary, payload: list) -> dict:
+    """
+    Diferencias entre un manifiesto anterior (resumido) y el actual
+
+    Args:
+        previous: Resumen de la versión que tiene el reproductor
+        payload: Manifiesto actual completo
+
+    Returns:
+        Diccionario con playlists añadidas (completas), eliminadas (IDs) y
+        actualizadas (solo los metadatos y videos que cambiaron)
+    """
+    added: List[dict] = []
+    updated: List[dict] = []
+    current_ids = set()
+
+    for playlist in payload:
+        playlist_id = playlist["id"]
+        current_ids.add(playlist_id)
+
+        if playlist_id not in previous:
+            added.append(playlist)
+            continue
+
+        old_meta, old_videos = previous[playlist_id]
+        old_hashes = dict(old_videos)
+        changes = {"id": playlist_id}
+
+        if _digest({field: playlist.get(field) for field in PLAYLIST_FIELDS}) != old_meta:
+            changes.update({field: playlist.get(field) for field in PLAYLIST_FIELDS})
+
+        new_ids = [video["id"] for video in playlist["videos"]]
+        videos_added = [video for video in playlist["videos"] if video["id"] not in old_hashes]
+        videos_updated = [
+            video for video in playlist["videos"]
+            if video["id"] in old_hashes and _digest(video) != old_hashes[video["id"]]
+        ]
+        new_id_set = set(new_ids)
+        videos_removed = [video_id for video_id, _ in old_videos if video_id not in new_id_set]
+
+        if videos_added:
+            changes["videos_added"] = videos_added
+        if videos_updated:
+            changes["videos_updated"] = videos_updated
+        if videos_removed:
+            changes["videos_removed"] = videos_removed
+        if new_ids != [video_id for video_id, _ in old_videos]:
+            # Orden completo para que el reproductor reconstruya la secuencia
+            changes["video_order"] = new_ids
+
+        if len(changes) > 1:
+            updated.append(changes)
+
+    removed = [playlist_id for playlist_id in previous if playlist_id not in current_ids]
+
+    return {
+        "added": added,
+        "removed": removed,
+        "updated": updated,
+    }
@@ -0,0 +1,178 @@
+# services/manifest_watch.py - Espera de cambios de manifiesto (long-poll)
+
+"""
+Permite que un reproductor espere a que cambie su manifiesto en lugar de
+sondear con un intervalo fijo.
+
+Cada petición en espera es un único Future en el bucle de asyncio, sin tarea
+ni conexión a la base de datos asociada, así que decenas de miles de esperas
+ociosas cuestan poco más que sus sockets. La caché de manifiestos notifica al
+hub los device_id cuyas entradas invalida; los límites de fecha (expiraciones)
+se cubren acotando cada espera hasta `valid_until` de la entrada.
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+
+from models.database import PlayerSessionLocal
+from services.manifest_cache import ManifestCache, ManifestEntry, build_manifest, manifest_cache
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_LONGPOLL_TIMEOUT = int(os.getenv("MANIFEST_LONGPOLL_TIMEOUT", "60"))
+MANIFEST_LONGPOLL_MAX_TIMEOUT = int(os.getenv("MANIFEST_LONGPOLL_MAX_TIMEOUT", "300"))
+
+
+class ManifestWatchHub:
+    """Registro de esperas por dispositivo, despertadas al invalidar su manifiesto"""
+
+    def __init__(self):
+        self._waiters: Dict[Optional[str], Set[asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.notifications = 0
+
+    def notify(self, device_ids):
+        """
+        Despierta las esperas de los dispositivos indicados
+
+        Puede llamarse desde cualquier hilo (los commits de endpoints síncronos
+        se ejecutan en el threadpool).
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._waiters:
+            return
+        loop.call_soon_threadsafe(self._wake, set(device_ids))
+
+    def _wake(self, device_ids: Set[Optional[str]]):
+        for device_id in device_ids:
+            for future in self._waiters.pop(device_id, ()):
+                if not future.done():
+                    future.set_result(True)
+                    self.notifications += 1
+
+    async def wait(self, device_id: Optional[str], timeout: float,
+                   still_current: Callable[[], bool] = lambda: True) -> bool:
+        """
+        Espera una notificación para el dispositivo
+
+        Args:
+            device_id: Dispositivo a vigilar
+            timeout: Segundos máximos de espera
+            still_current: Se evalúa tras registrar la espera; si devuelve False
+                el cambio ya ocurrió y no se espera
+
+        Returns:
+            True si hubo notificación, False si venció el tiempo
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        future = loop.create_future()
+        waiters = self._waiters.setdefault(device_id, set())
+        waiters.add(future)
+        try:
+            if not still_current():
+                return True
+            if timeout <= 0:
+                return False
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(device_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[device_id]
+
+    def stats(self) -> dict:
+        return {
+            "waiting_requests": sum(len(waiters) for waiters in self._waiters.values()),
+            "waiting_devices": len(self._waiters),
+            "notifications": self.notifications,
+        }
+
+
+# Instancia global del hub, conectada a la caché de manifiestos
+watch_hub = ManifestWatchHub()
+manifest_cache.add_listener(watch_hub.notify)
+
+
+def version_from_etag(etag: Optional[str]) -> Optional[str]:
+    """Extrae la versión de un ETag (acepta W/ y comillas)"""
+    if not etag:
+        return None
+    etag = etag.split(",")[0].strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"') or None
+
+
+def _build_with_new_session(device_id: Optional[str], flavor: str,
+                            cache: ManifestCache, session_factory) -> Optional[ManifestEntry]:
+    # Sesión propia y de vida corta: la espera no debe retener conexiones del pool
+    db = session_factory()
+    try:
+        generation = cache.generation
+        entry = build_manifest(db, device_id, flavor, ttl=cache.ttl)
+        if entry is not None:
+            cache.put(entry, generation)
+        return entry
+    finally:
+        db.close()
+
+
+async def load_manifest(device_id: Optional[str], flavor: str,
+                        cache: Optional[ManifestCache] = None,
+                        session_factory=PlayerSessionLocal) -> Optional[ManifestEntry]:
+    """Manifiesto desde la caché; si falta, se construye fuera del event loop"""
+    cache = cache or manifest_cache
+    entry = cache.get(device_id, flavor)
+    if entry is not None:
+        return entry
+    return await run_in_threadpool(_build_with_new_session, device_id, flavor, cache, session_factory)
+
+
+async def wait_for_manifest_change(device_id: Optional[str], flavor: str,
+                                   known_version: Optional[str], timeout: float,
+                                   cache: Optional[ManifestCache] = None,
+                                   hub: Optional[ManifestWatchHub] = None,
+                                   session_factory=PlayerSessionLocal) -> Optional[ManifestEntry]:
+    """
+    Espera hasta que la versión del manifiesto difiera de known_version
+
+    Args:
+        device_id: Dispositivo a vigilar
+        flavor: Variante de manifiesto (RASPBERRY o CLIENT)
+        known_version: Versión que ya tiene el reproductor (None devuelve de inmediato)
+        timeout: Segundos máximos de espera
+
+    Returns:
+        El manifiesto actual (nuevo o el mismo si venció el tiempo),
+        o None si el dispositivo no existe
+    """
+    cache = cache or manifest_cache
+    hub = hub or watch_hub
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while True:
+        entry = await load_manifest(device_id, flavor, cache, session_factory)
+        if entry is None or entry.version != known_version:
+            return entry
+
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return entry
+
+        # Despertar también al llegar la próxima expiración incluida en el manifiesto
+        until_boundary = (entry.valid_until - datetime.now()).total_seconds()
+        await hub.wait(
+            device_id,
+            min(remaining, max(until_boundary, 0)),
+            still_current=lambda: cache.peek(device_id, flavor) is entry
+        )
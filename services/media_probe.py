@@ -0,0 +1,318 @@
+# services/media_probe.py - Análisis de metadatos de video en segundo plano
+
+"""
+Obtiene duración, resolución, códecs, bitrate y contenedor de los videos con
+ffprobe y los guarda en la tabla videos.
+
+Las subidas no esperan al análisis: encolan el video en un pool acotado de
+hilos, y cada hilo lanza un proceso ffprobe, así que nunca hay más de
+MEDIA_PROBE_WORKERS procesos ffprobe en paralelo. Los videos que comparten
+contenido (mismo content_hash) reciben el resultado de un único análisis.
+
+Relleno de la biblioteca existente:
+
+    python -m services.media_probe            # videos sin analizar
+    python -m services.media_probe --all      # volver a analizar todos
+"""
+
+import os
+import json
+import shutil
+import logging
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import or_
+
+from models.database import SessionLocal
+from models.models import Video
+
+logger = logging.getLogger(__name__)
+
+FFPROBE_PATH = os.getenv("FFPROBE_PATH", "ffprobe")
+MEDIA_PROBE_WORKERS = int(os.getenv("MEDIA_PROBE_WORKERS", "2"))
+MEDIA_PROBE_TIMEOUT = float(os.getenv("MEDIA_PROBE_TIMEOUT", "60"))
+
+
+class MediaProbeError(Exception):
+    """ffprobe no está disponible o no pudo leer el archivo"""
+
+
+def probe_file(file_path: str) -> dict:
+    """
+    Ejecuta ffprobe sobre un archivo y devuelve sus metadatos normalizados
+
+    Returns:
+        Diccionario con duration, width, height, video_codec, audio_codec,
+        bitrate y container (los que no se puedan determinar quedan en None)
+
+    Raises:
+        MediaProbeError: Si ffprobe no existe, falla o excede el tiempo límite
+    """
+    if shutil.which(FFPROBE_PATH) is None:
+        raise MediaProbeError(f"No se encontró ffprobe ({FFPROBE_PATH})")
+
+    try:
+        result = subprocess.run(
+            [FFPROBE_PATH, "-v", "error", "-print_format", "json",
+             "-show_format", "-show_streams", file_path],
+            capture_output=True, timeout=MEDIA_PROBE_TIMEOUT, check=False
+        )
+    except subprocess.TimeoutExpired:
+        raise MediaProbeError(f"ffprobe excedió {MEDIA_PROBE_TIMEOUT} segundos con {file_path}")
+
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip()
+        raise MediaProbeError(f"ffprobe falló con {file_path}: {message}")
+
+    try:
+        data = json.loads(result.stdout or b"{}")
+    except ValueError as e:
+        raise MediaProbeError(f"Salida de ffprobe no válida: {e}")
+
+    return parse_ffprobe_output(data, file_path)
+
+
+def parse_ffprobe_output(data: dict, file_path: str = "") -> dict:
+    """Normaliza la salida JSON de ffprobe (-show_format -show_streams)"""
+    fmt = data.get("format") or {}
+    streams = data.get("streams") or []
+
+    # La carátula de un MP4/MKV también es un stream de video: ignorarla
+    video = next((
+        stream for stream in streams
+        if stream.get("codec_type") == "video"
+        and not (stream.get("disposition") or {}).get("attached_pic")
+    ), None)
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+
+    duration = _to_float(fmt.get("duration"))
+    if duration is None and video is not None:
+        duration = _to_float(video.get("duration"))
+
+    bitrate = _to_int(fmt.get("bit_rate"))
+    if bitrate is None and video is not None:
+        bitrate = _to_int(video.get("bit_rate"))
+
+    return {
+        "duration": int(round(duration)) if duration is not None else None,
+        "width": _to_int(video.get("width")) if video else None,
+        "height": _to_int(video.get("height")) if video else None,
+        "video_codec": video.get("codec_name") if video else None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "bitrate": bitrate,
+        "container": _container_name(fmt.get("format_name"), file_path),
+    }
+
+
+def _container_name(format_name: Optional[str], file_path: str) -> Optional[str]:
+    # ffprobe agrupa formatos afines ("mov,mp4,m4a,3gp,3g2,mj2"); preferir el que
+    # coincide con la extensión del archivo
+    if not format_name:
+        return None
+    names = format_name.split(",")
+    extension = os.path.splitext(file_path)[1].lstrip(".").lower()
+    if extension in names:
+        return extension
+    return names[0]
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value) -> Optional[int]:
+    number = _to_float(value)
+    return int(number) if number is not None else None
+
+
+def save_probe_result(db, video_id: int, info: dict) -> int:
+    """
+    Guarda los metadatos en el video y en los que comparten su contenido
+
+    Returns:
+        Número de videos actualizados
+    """
+    video = db.query(Video).filter(Video.id == video_id).first()
+    if video is None:
+        return 0
+
+    targets = [video]
+    if video.content_hash:
+        targets += db.query(Video).filter(
+            Video.content_hash == video.content_hash,
+            Video.id != video.id
+        ).all()
+
+    now = datetime.now()
+    for target in targets:
+        for field, value in info.items():
+            setattr(target, field, value)
+        target.probed_at = now
+    db.commit()
+    return len(targets)
+
+
+class MediaProbePool:
+    """Pool acotado que analiza videos fuera de las peticiones"""
+
+    def __init__(self, max_workers: int = MEDIA_PROBE_WORKERS,
+                 session_factory=SessionLocal,
+                 probe: Callable[[str], dict] = probe_file):
+        """
+        Args:
+            max_workers: Número máximo de ffprobe simultáneos
+            session_factory: Fábrica de sesiones para guardar resultados
+            probe: Función que analiza un archivo (inyectable en tests)
+        """
+        self.max_workers = max_workers
+        self.session_factory = session_factory
+        self.probe = probe
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.probed = 0
+        self.failed = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="media-probe"
+            )
+        return self._executor
+
+    def submit(self, video_id: int, file_path: str) -> Future:
+        """Encola el análisis de un video; no bloquea al llamador"""
+        with self._lock:
+            future = self._pending.get(video_id)
+            if future is not None and not future.done():
+                return future
+            future = self._get_executor().submit(self._run, video_id, file_path)
+            self._pending[video_id] = future
+        future.add_done_callback(lambda _f: self._discard(video_id, _f))
+        return future
+
+    def _discard(self, video_id: int, future: Future):
+        with self._lock:
+            if self._pending.get(video_id) is future:
+                del self._pending[video_id]
+
+    def _run(self, video_id: int, file_path: str) -> Optional[dict]:
+        try:
+            info = self.probe(file_path)
+        except MediaProbeError as e:
+            self.failed += 1
+            logger.warning(f"No se pudo analizar el video {video_id}: {str(e)}")
+            return None
+
+        db = self.session_factory()
+        try:
+            updated = save_probe_result(db, video_id, info)
+        except Exception as e:
+            db.rollback()
+            self.failed += 1
+            logger.error(f"Error al guardar metadatos del video {video_id}: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+        self.probed += 1
+        logger.info(
+            f"Video {video_id} analizado: {info.get('duration')}s, "
+            f"{info.get('width')}x{info.get('height')} {info.get('video_codec')} "
+            f"({updated} videos actualizados)"
+        )
+        return info
+
+    def backfill(self, only_missing: bool = True) -> int:
+        """
+        Encola los videos existentes y espera a que terminen
+
+        Args:
+            only_missing: Si es True, solo los que nunca se analizaron
+
+        Returns:
+            Número de videos encolados
+        """
+        db = self.session_factory()
+        try:
+            query = db.query(Video.id, Video.file_path, Video.content_hash)
+            if only_missing:
+                query = query.filter(or_(Video.probed_at.is_(None), Video.duration.is_(None)))
+            rows = query.order_by(Video.id).all()
+        finally:
+            db.close()
+
+        # Un solo análisis por contenido; el resultado se copia a los duplicados
+        seen_hashes = set()
+        futures = []
+        for video_id, file_path, content_hash in rows:
+            if content_hash:
+                if content_hash in seen_hashes:
+                    continue
+                seen_hashes.add(content_hash)
+            if not file_path or not os.path.exists(file_path):
+                logger.warning(f"Video {video_id}: archivo no encontrado ({file_path}), se omite")
+                continue
+            futures.append(self.submit(video_id, file_path))
+
+        wait(futures)
+        return len(futures)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(1 for future in self._pending.values() if not future.done())
+        return {
+            "pending": pending,
+            "probed": self.probed,
+            "failed": self.failed,
+            "max_workers": self.max_workers,
+        }
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+
+# Instancia global del pool
+media_probe_pool = MediaProbePool()
+
+
+def start_media_probe_pool(app):
+    """
+    Registra el cierre del pool de análisis en el ciclo de vida de la app
+
+    Args:
+        app: Instancia de FastAPI
+    """
+    @app.on_event("shutdown")
+    async def stop_media_probe():
+        media_probe_pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Analizar con ffprobe los videos existentes")
+    parser.add_argument("--all", action="store_true", help="Volver a analizar también los ya analizados")
+    parser.add_argument("--workers", type=int, default=MEDIA_PROBE_WORKERS, help="ffprobe simultáneos")
+    args = parser.parse_args()
+
+    pool = MediaProbePool(max_workers=args.workers)
+    try:
+        queued = pool.backfill(only_missing=not args.all)
+    finally:
+        pool.shutdown(wait=True)
+    logger.info(f"Relleno terminado: {queued} encolados, {pool.probed} analizados, {pool.failed} fallidos")
@@ -0,0 +1,370 @@
+# services/pagination.py - Paginación por cursor (keyset) y recuentos cacheados
+
+"""
+Paginación de listados grandes sin OFFSET.
+
+Las páginas se ordenan por (columna de orden, id) y el cursor codifica los
+valores de la última fila devuelta; la página siguiente se pide con
+`WHERE (columna, id) > (valor, id)`, que cuesta lo mismo en la página 1 que
+en la 1000. El cursor es opaco para el cliente (base64 de JSON).
+
+Las columnas de orden que admiten NULL los colocan al final en ambas
+direcciones, igual en PostgreSQL y SQLite.
+
+El total es opcional (`include_total`): se toma de una caché con TTL que los
+commits que escriben en la tabla invalidan y, en PostgreSQL, para tablas
+grandes sin filtros se usa la estimación del planificador
+(pg_class.reltuples) en lugar de COUNT(*).
+"""
+
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import and_, event, inspect, or_, text
+from sqlalchemy.orm import Query, Session
+
+from utils.query_budget import outside_budget
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se reutiliza un recuento exacto
+PAGINATION_COUNT_TTL = float(os.getenv("PAGINATION_COUNT_TTL", "30"))
+# Tablas sin filtros con más filas que esto usan la estimación del planificador
+PAGINATION_ESTIMATE_MIN_ROWS = int(os.getenv("PAGINATION_ESTIMATE_MIN_ROWS", "100000"))
+# Recuentos distintos (tabla + filtros) en memoria
+PAGINATION_COUNT_CACHE_SIZE = int(os.getenv("PAGINATION_COUNT_CACHE_SIZE", "1000"))
+
+
+# ==========================================
+# CURSORES
+# ==========================================
+
+def encode_cursor(values: List[Any]) -> str:
+    """Cursor opaco con la columna de orden y los valores de la última fila"""
+    payload = [{"$dt": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Valores de un cursor; 400 si está mal formado"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError("longitud inesperada")
+        return [
+            datetime.fromisoformat(value["$dt"]) if isinstance(value, dict) else value
+            for value in payload
+        ]
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Cursor inválido: {str(e)}")
+
+
+# ==========================================
+# KEYSET
+# ==========================================
+
+class KeysetPage:
+    """Una página de resultados y el cursor de la siguiente"""
+
+    __slots__ = ("items", "next_cursor")
+
+    def __init__(self, items: list, next_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+def _after(sort_column, id_column, descending: bool, cursor_values: List[Any]):
+    """Condición "fila posterior al cursor" para el orden (sort [NULLS LAST], id)"""
+    greater = (lambda column, value: column < value) if descending else (lambda column, value: column > value)
+
+    if len(cursor_values) == 2:
+        # Columna NOT NULL: [valor, id]
+        value, last_id = cursor_values
+        return or_(greater(sort_column, value), and_(sort_column == value, greater(id_column, last_id)))
+
+    # Columna con NULL: [es_null, valor, id]
+    is_null, value, last_id = cursor_values
+    if is_null:
+        return and_(sort_column.is_(None), greater(id_column, last_id))
+    return or_(
+        sort_column.is_(None),
+        greater(sort_column, value),
+        and_(sort_column == value, greater(id_column, last_id)),
+    )
+
+
+def _is_nullable(column) -> bool:
+    prop = getattr(column, "property", None)
+    columns = getattr(prop, "columns", None)
+    return columns[0].nullable if columns else True
+
+
+def keyset_paginate(query: Query, sort_column, id_column, limit: int,
+                    cursor: Optional[str] = None, descending: bool = False,
+                    offset: int = 0) -> KeysetPage:
+    """
+    Página de la consulta ordenada por (sort_column, id_column)
+
+    Args:
+        query: Consulta ya filtrada y sin ORDER BY
+        sort_column: Columna de orden (puede ser la misma que id_column)
+        id_column: Clave única de desempate
+        limit: Filas por página
+        cursor: Cursor devuelto por la página anterior
+        descending: Orden descendente
+        offset: Solo para clientes antiguos (skip) cuando no hay cursor
+    """
+    nullable = sort_column is not id_column and _is_nullable(sort_column)
+    direction = (lambda column: column.desc()) if descending else (lambda column: column.asc())
+
+    if cursor:
+        # El primer valor es la columna de orden: un cursor de otro orden no vale
+        values = decode_cursor(cursor, 4 if nullable else 3)
+        if values[0] != sort_column.key:
+            raise HTTPException(status_code=400, detail="Cursor inválido: pertenece a otro orden")
+        query = query.filter(_after(sort_column, id_column, descending, values[1:]))
+
+    if sort_column is id_column:
+        query = query.order_by(direction(id_column))
+    elif nullable:
+        query = query.order_by(sort_column.is_(None), direction(sort_column), direction(id_column))
+    else:
+        query = query.order_by(direction(sort_column), direction(id_column))
+
+    if offset and not cursor:
+        query = query.offset(offset)
+
+    # Una fila de más indica si hay página siguiente
+    rows = query.limit(limit + 1).all()
+    items, has_next = rows[:limit], len(rows) > limit
+    if not has_next or not items:
+        return KeysetPage(items, None)
+
+    last = items[-1]
+    last_id = getattr(last, id_column.key)
+    if sort_column is id_column:
+        values = [last_id, last_id]
+    else:
+        value = getattr(last, sort_column.key)
+        values = [value is None, value, last_id] if nullable else [value, last_id]
+    return KeysetPage(items, encode_cursor([sort_column.key] + values))
+
+
+def sort_column_for(columns: Dict[str, Any], sort: Optional[str], default: str):
+    """Columna de un parámetro de orden, 400 si no está permitida"""
+    name = sort or default
+    if name not in columns:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Orden no soportado: {name}. Valores: {', '.join(sorted(columns))}"
+        )
+    return columns[name]
+
+
+def set_page_headers(request: Request, response: Response, page: KeysetPage,
+                     total: Optional[Tuple[int, bool]] = None):
+    """
+    Cabeceras de paginación para los endpoints que devuelven una lista
+
+    X-Next-Cursor y Link rel="next" con la página siguiente; X-Total-Count
+    (y X-Total-Count-Estimated) si se pidió el total.
+    """
+    if page.next_cursor:
+        next_url = request.url.remove_query_params(["skip"]).include_query_params(cursor=page.next_cursor)
+        response.headers["X-Next-Cursor"] = page.next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    if total is not None:
+        count, estimated = total
+        response.headers["X-Total-Count"] = str(count)
+        response.headers["X-Total-Count-Estimated"] = "true" if estimated else "false"
+
+
+# ==========================================
+# RECUENTOS
+# ==========================================
+
+class CountCache:
+    """
+    Recuentos por (tabla, filtros) reutilizados durante un TTL
+
+    El primer elemento de la clave es la tabla, o una tupla de tablas si el
+    valor depende de varias; invalidate(tabla) descarta todas las entradas
+    que dependen de ella.
+    """
+
+    def __init__(self, ttl: float = PAGINATION_COUNT_TTL, max_entries: int = PAGINATION_COUNT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_count(self, key: Hashable, count: Callable[[], int]) -> int:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        value = count()
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (value, now + self.ttl)
+        return value
+
+    def invalidate(self, table: Optional[str] = None):
+        """Descarta los recuentos de una tabla (o todos)"""
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if table in _key_tables(key)]:
+                    del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl,
+            }
+
+
+def _key_tables(key: Hashable) -> Tuple[str, ...]:
+    tables = key[0]
+    return tables if isinstance(tables, tuple) else (tables,)
+
+
+# Cachés que se invalidan con las escrituras (ver register_count_listeners)
+_tracked_caches: List[CountCache] = []
+
+
+def invalidate_on_writes(cache: CountCache) -> CountCache:
+    """Registra una caché para que los commits que escriben en una tabla la invaliden"""
+    if cache not in _tracked_caches:
+        _tracked_caches.append(cache)
+    return cache
+
+
+# Instancia global de la caché
+count_cache = invalidate_on_writes(CountCache())
+
+
+def _estimated_rows(db: Session, table: str) -> Optional[int]:
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    ).scalar()
+    # -1 si la tabla nunca se analizó
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
+def total_count(db: Session, query: Query, table: str, filters: Tuple = ()) -> Tuple[int, bool]:
+    """
+    Total de filas de la consulta
+
+    Args:
+        db: Sesión de base de datos
+        query: Consulta filtrada (sin ORDER BY ni LIMIT)
+        table: Tabla principal (clave de la caché y de la estimación)
+        filters: Valores de los filtros aplicados (parte de la clave de la caché)
+
+    Returns:
+        (total, es_estimación)
+    """
+    # El total es opcional y de coste fijo: no cuenta para el presupuesto del endpoint
+    with outside_budget():
+        if not filters:
+            estimate = _estimated_rows(db, table)
+            if estimate is not None and estimate >= PAGINATION_ESTIMATE_MIN_ROWS:
+                return estimate, True
+        return count_cache.get_or_count((table,) + tuple(filters), query.count), False
+
+
+# ==========================================
+# INVALIDACIÓN POR EVENTOS DE SESIÓN
+# ==========================================
+
+_PENDING_KEY = "count_cache_pending_tables"
+
+# Columnas que cambian continuamente y no afectan a ningún recuento: sus
+# actualizaciones (métricas de los reproductores, último acceso) no invalidan
+_VOLATILE_COLUMNS = {
+    "devices": {"last_seen", "cpu_temp", "memory_usage", "disk_usage",
+                "videoloop_status", "kiosk_status", "service_logs"},
+    "users": {"last_login"},
+}
+
+
+def _changed_columns(obj) -> set:
+    state = inspect(obj)
+    return {attr.key for attr in state.attrs if attr.history.has_changes()}
+
+
+def _collect_tables(session: Session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.new) + list(session.deleted):
+        pending.add(obj.__table__.name)
+    for obj in session.dirty:
+        table = obj.__table__.name
+        if _changed_columns(obj) - _VOLATILE_COLUMNS.get(table, set()):
+            pending.add(table)
+
+
+def _collect_bulk_tables(orm_execute_state):
+    """UPDATE/DELETE masivos del ORM; el SQL textual (p. ej. latidos) no se detecta"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        orm_execute_state.session.info.setdefault(_PENDING_KEY, set()).add(mapper.local_table.name)
+
+
+def _apply_tables(session: Session):
+    tables = session.info.pop(_PENDING_KEY, None)
+    if not tables:
+        return
+    for cache in _tracked_caches:
+        for table in tables:
+            cache.invalidate(table)
+
+
+def _discard_tables(session: Session, previous_transaction=None):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_count_listeners():
+    """Registra los eventos de sesión que invalidan los recuentos tras cada commit"""
+    listeners = (
+        ("after_flush", _collect_tables),
+        ("do_orm_execute", _collect_bulk_tables),
+        ("after_commit", _apply_tables),
+        ("after_rollback", _discard_tables),
+    )
+    for identifier, fn in listeners:
+        if not event.contains(Session, identifier, fn):
+            event.listen(Session, identifier, fn)
+
+
+register_count_listeners()
@@ -0,0 +1,158 @@
+# services/playlist_bundle.py - Playlist completa (manifiesto y videos) en un único tar
+
+"""
+Un reproductor recién instalado descarga con una sola conexión el manifiesto
+de la playlist y todos sus videos activos:
+
+    playlist.json
+    videos/<id><extensión>
+    ...
+
+El tar se genera al vuelo (ver utils/tar_stream.py). Para reanudar una
+descarga interrumpida hay dos opciones:
+
+- `Range: bytes=N-` con `If-Range: <ETag>`, sobre el mismo tar.
+- `?member=K`, un tar nuevo con playlist.json y los videos a partir del
+  K-ésimo (en el orden de `videos` del manifiesto).
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
+
+from models.database import PlayerSessionLocal
+from models.models import Playlist, Video
+from services.rollout import admit_download, record_download
+from services.transcoding import resolve_download_paths
+from utils.file_streaming import RangeNotSatisfiable, parse_byte_range, range_not_satisfiable_response
+from utils.tar_stream import TarLayout, TarMember, TarStreamResponse
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_MEMBER = "playlist.json"
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def member_name(video: Video, file_path: str) -> str:
+    return f"videos/{video.id}{os.path.splitext(file_path)[1].lower()}"
+
+
+def build_playlist_bundle(db: Session, playlist: Playlist, url_template: str,
+                          profile: Optional[str] = None, first_member: int = 0,
+                          now: Optional[datetime] = None) -> Tuple[TarLayout, List[int]]:
+    """
+    Disposición del tar de una playlist
+
+    Args:
+        db: Sesión de base de datos
+        playlist: Playlist a empaquetar
+        url_template: URL de descarga individual de cada video (con {video_id})
+        profile: Perfil de versión recodificada del reproductor, si se conoce
+        first_member: Índice del primer video a incluir (reanudación)
+        now: Momento de referencia para la expiración de los videos
+
+    Returns:
+        (disposición del tar, IDs de los videos incluidos)
+    """
+    now = now or datetime.now()
+    active = [video for video in playlist.videos
+              if not video.expiration_date or video.expiration_date > now]
+    paths = resolve_download_paths(db, active, profile)
+    entries = []
+    for video in active:
+        file_path = paths[video.id]
+        if not file_path or not os.path.isfile(file_path):
+            logger.warning(f"Bundle de playlist {playlist.id}: falta el archivo del video {video.id} ({file_path})")
+            continue
+        entries.append((video, file_path))
+
+    if first_member < 0 or first_member > len(entries):
+        raise HTTPException(status_code=416, detail=f"member debe estar entre 0 y {len(entries)}")
+
+    manifest = {
+        "id": playlist.id,
+        "title": playlist.title,
+        "description": playlist.description,
+        "start_date": _isoformat(playlist.start_date),
+        "expiration_date": _isoformat(playlist.expiration_date),
+        "first_member": first_member,
+        "videos": [
+            {
+                "id": video.id,
+                "title": video.title,
+                "description": video.description,
+                "file": member_name(video, file_path),
+                "file_path": url_template.format(video_id=video.id),
+                "file_size": os.path.getsize(file_path),
+                "content_hash": video.content_hash,
+                "duration": video.duration,
+                "expiration_date": _isoformat(video.expiration_date)
+            }
+            for video, file_path in entries
+        ]
+    }
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+
+    # El mtime del manifiesto es fijo para que el ETag no cambie entre peticiones
+    members = [TarMember(MANIFEST_MEMBER, data=manifest_bytes, mtime=0)]
+    included = entries[first_member:]
+    members += [TarMember(member_name(video, file_path), path=file_path) for video, file_path in included]
+    return TarLayout(members), [video.id for video, _ in included]
+
+
+def _record_bundle_download(device_id: str, video_ids: List[int]):
+    db = PlayerSessionLocal()
+    try:
+        for video_id in video_ids:
+            record_download(db, device_id, video_id)
+    finally:
+        db.close()
+
+
+def bundle_response(request: Request, layout: TarLayout, filename: str,
+                    video_ids: List[int], tienda: Optional[str] = None,
+                    device_id: Optional[str] = None) -> Response:
+    """
+    Respuesta del tar con soporte de Range/If-Range y las cubetas de descarga
+
+    Si el dispositivo es conocido y la respuesta llega al final del tar, sus
+    videos se registran como descargados.
+    """
+    if_range = request.headers.get("if-range")
+    # Si el tar cambió desde la descarga interrumpida se envía completo
+    stale_range = bool(if_range) and if_range != layout.etag
+    byte_range_header = None if stale_range else request.headers.get("range")
+
+    try:
+        byte_range = parse_byte_range(byte_range_header, layout.size)
+    except RangeNotSatisfiable:
+        return range_not_satisfiable_response(layout.size)
+
+    # El coste y la descarga completa se calculan sobre el rango que se envía
+    completes = admit_download(request, layout.size, tienda, ignore_range=stale_range)
+
+    background = None
+    if device_id and video_ids and completes:
+        background = BackgroundTask(_record_bundle_download, device_id, video_ids)
+
+    return TarStreamResponse(
+        layout,
+        byte_range=byte_range,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=background
+    )
+
+
+def bundle_filename(playlist: Playlist) -> str:
+    safe_title = "".join(c for c in (playlist.title or "playlist") if c.isalnum() or c in "._-")
+    return f"playlist_{playlist.id}_{safe_title}.tar"
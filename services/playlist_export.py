@@ -0,0 +1,258 @@
+# services/playlist_export.py - Exportación JSON de playlists servida desde memoria
+
+"""
+Caché de las exportaciones JSON de playlists (`/api/playlists/{id}/download`
+y `/api/client/playlists/{id}/download`).
+
+Cada entrada guarda el JSON ya serializado y su versión comprimida con gzip,
+indexada por variante y playlist y validada con `Playlist.updated_at`. Se
+invalida con los mismos eventos de sesión que los manifiestos (cambios en la
+playlist, sus videos o los videos incluidos) y al llegar la expiración de
+alguno de sus videos. Nada se escribe en disco.
+"""
+
+import os
+import json
+import gzip
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request, Response
+
+from models.models import Playlist
+from services.manifest_cache import add_change_listener
+from utils.etag import etag_matches
+
+logger = logging.getLogger(__name__)
+
+# Número máximo de exportaciones en memoria
+PLAYLIST_EXPORT_CACHE_SIZE = int(os.getenv("PLAYLIST_EXPORT_CACHE_SIZE", "1000"))
+
+# Variantes de exportación según la API que la sirve
+ADMIN = "admin"
+CLIENT = "client"
+
+
+class PlaylistExport:
+    """Exportación serializada de una playlist"""
+
+    __slots__ = ("flavor", "playlist_id", "updated_at", "body", "gzipped", "version",
+                 "video_ids", "valid_until")
+
+    def __init__(self, flavor: str, playlist_id: int, updated_at: Optional[datetime],
+                 data: dict, video_ids: FrozenSet[int], valid_until: Optional[datetime] = None):
+        self.flavor = flavor
+        self.playlist_id = playlist_id
+        self.updated_at = updated_at
+        # Mismo formato que el json.dump(..., indent=4) de los archivos que reemplaza
+        self.body = json.dumps(data, indent=4).encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        self.version = hashlib.sha256(self.body).hexdigest()
+        self.video_ids = video_ids
+        self.valid_until = valid_until
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    @property
+    def gzip_etag(self) -> str:
+        # El cuerpo comprimido es otra representación: su ETag fuerte es distinto
+        return f'"{self.version}-gzip"'
+
+    def is_fresh(self, playlist: Playlist, now: datetime) -> bool:
+        if self.updated_at != playlist.updated_at:
+            return False
+        return self.valid_until is None or now < self.valid_until
+
+
+class PlaylistExportCache:
+    """Exportaciones por (variante, playlist) con invalidación por dependencias"""
+
+    def __init__(self, max_entries: int = PLAYLIST_EXPORT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, int], PlaylistExport] = {}
+        self._lock = threading.Lock()
+        # Evita guardar exportaciones construidas con datos que cambiaron mientras tanto
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_build(self, flavor: str, playlist: Playlist,
+                     build: Callable[[Playlist, datetime], PlaylistExport],
+                     now: Optional[datetime] = None) -> PlaylistExport:
+        """
+        Devuelve la exportación vigente o la construye con build(playlist, now)
+        """
+        now = now or datetime.now()
+        key = (flavor, playlist.id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.is_fresh(playlist, now):
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+
+        entry = build(playlist, now)
+        with self._lock:
+            if generation == self._generation:
+                if len(self._entries) >= self.max_entries and key not in self._entries:
+                    # Sin orden de uso: descartar la entrada más antigua insertada
+                    self._entries.pop(next(iter(self._entries)))
+                self._entries[key] = entry
+        return entry
+
+    def apply_changes(self, changes: dict):
+        """Callback de manifest_cache.add_change_listener"""
+        if changes["all"]:
+            self._drop(lambda entry: True)
+            return
+        playlist_ids = set(changes["playlists"])
+        video_ids = set(changes["videos"])
+        if playlist_ids or video_ids:
+            self._drop(lambda entry: entry.playlist_id in playlist_ids
+                       or not entry.video_ids.isdisjoint(video_ids))
+
+    def invalidate_all(self):
+        self._drop(lambda entry: True)
+
+    def _drop(self, predicate):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items() if predicate(entry)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(len(entry.body) + len(entry.gzipped) for entry in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+# Instancia global de la caché
+playlist_export_cache = PlaylistExportCache()
+add_change_listener(playlist_export_cache.apply_changes)
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def build_admin_export(playlist: Playlist, now: datetime) -> PlaylistExport:
+    """Exportación de /api/playlists/{id}/download: todos los videos con su ruta local"""
+    data = {
+        "id": playlist.id,
+        "title": playlist.title,
+        "description": playlist.description,
+        "start_date": _isoformat(playlist.start_date),
+        "expiration_date": _isoformat(playlist.expiration_date),
+        "videos": [
+            {
+                "id": video.id,
+                "title": video.title,
+                "description": video.description,
+                "file_path": video.file_path,
+                "duration": video.duration
+            }
+            for video in playlist.videos
+        ]
+    }
+    return PlaylistExport(ADMIN, playlist.id, playlist.updated_at, data,
+                          frozenset(video.id for video in playlist.videos))
+
+
+def build_client_export(playlist: Playlist, now: datetime) -> PlaylistExport:
+    """Exportación de /api/client/playlists/{id}/download: videos vigentes con su URL"""
+    active = [video for video in playlist.videos
+              if not video.expiration_date or video.expiration_date > now]
+    data = {
+        "id": playlist.id,
+        "title": playlist.title,
+        "description": playlist.description,
+        "start_date": _isoformat(playlist.start_date),
+        "expiration_date": _isoformat(playlist.expiration_date),
+        "videos": [
+            {
+                "id": video.id,
+                "title": video.title,
+                "description": video.description,
+                "file_path": f"/api/client/videos/{video.id}/download",
+                "duration": video.duration,
+                "expiration_date": _isoformat(video.expiration_date)
+            }
+            for video in active
+        ]
+    }
+    # La entrada caduca cuando expira el primero de sus videos
+    expirations = [video.expiration_date for video in active if video.expiration_date]
+    return PlaylistExport(CLIENT, playlist.id, playlist.updated_at, data,
+                          frozenset(video.id for video in playlist.videos),
+                          valid_until=min(expirations) if expirations else None)
+
+
+def content_disposition(filename: str) -> str:
+    """Mismo formato que FileResponse(filename=...)"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def export_filename(playlist: Playlist) -> str:
+    return f"playlist_{playlist.title.replace(' ', '_')}.json"
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Indica si Accept-Encoding admite gzip (q > 0, explícito o por `*`)"""
+    if not accept_encoding:
+        return False
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def export_response(request: Request, export: PlaylistExport, filename: str) -> Response:
+    """JSON de la exportación, comprimido si el cliente lo acepta, con ETag/304"""
+    compressed = _accepts_gzip(request.headers.get("accept-encoding"))
+    etag = export.gzip_etag if compressed else export.etag
+    headers = {
+        "Content-Disposition": content_disposition(filename),
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=export.gzipped, media_type="application/json", headers=headers)
+    return Response(content=export.body, media_type="application/json", headers=headers)
@@ -0,0 +1,167 @@
+# services/relay_cache.py - Caché en disco del modo relé de tienda
+
+"""
+Caché LRU en disco de videos para el modo relé (ver relay_main.py).
+
+Cada archivo se guarda como `<clave>.bin` en RELAY_CACHE_DIR. El índice LRU se
+mantiene en memoria y se reconstruye al arrancar a partir de la fecha de
+último acceso de los archivos. Al superar el tamaño máximo se eliminan los
+menos usados recientemente.
+
+Las descargas simultáneas de un mismo archivo ausente se unen en una sola
+petición al servidor central (ver `Coalescer`).
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class RelayBlobCache:
+    """Archivos en disco con política LRU y tamaño total acotado"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Args:
+            directory: Directorio de la caché
+            max_bytes: Tamaño total máximo en bytes
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Reconstruye el índice LRU desde el disco (los temporales huérfanos se eliminan)"""
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            if not name.endswith(".bin"):
+                continue
+            stat = os.stat(path)
+            found.append((stat.st_atime, name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        logger.info(f"Caché del relé: {len(self._entries)} archivos, {self._total} bytes")
+        self._evict()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def temp_path(self) -> str:
+        """Ruta temporal en el mismo directorio (el renombrado final es atómico)"""
+        return os.path.join(self.directory, f"{uuid.uuid4()}.part")
+
+    def get(self, key: str) -> Optional[str]:
+        """Ruta del archivo si está en caché, marcándolo como usado"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            # Borrado externo: olvidar la entrada
+            with self._lock:
+                self._total -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key: str, temp_path: str, size: int) -> str:
+        """Incorpora un archivo ya descargado y aplica el límite de tamaño"""
+        path = self.path_for(key)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._total -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total += size
+        self._evict(keep=key)
+        return path
+
+    def _evict(self, keep: Optional[str] = None):
+        while True:
+            with self._lock:
+                if self._total <= self.max_bytes or not self._entries:
+                    return
+                key = next(iter(self._entries))
+                if key == keep:
+                    if len(self._entries) == 1:
+                        return
+                    self._entries.move_to_end(key)
+                    key = next(iter(self._entries))
+                size = self._entries.pop(key)
+                self._total -= size
+                self.evictions += 1
+            # Un envío en curso conserva su descriptor abierto aunque se borre el archivo
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+            logger.info(f"Caché del relé: expulsado {key} ({size} bytes)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class Coalescer:
+    """Une llamadas simultáneas con la misma clave en una sola ejecución"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Ejecuta fn una sola vez por clave mientras esté en curso
+
+        La ejecución es una tarea propia: si el cliente que la inició se
+        desconecta, la descarga continúa para los demás que esperan.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Recuperar la excepción aunque ya no quede nadie esperando
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"inflight": len(self._inflight), "coalesced": self.coalesced}
@@ -0,0 +1,463 @@
+# services/rollout.py - Despliegue escalonado de contenido nuevo a la flota
+
+"""
+Evita que cientos de reproductores descarguen a la vez un video recién
+asignado y saturen el enlace del servidor (o el de una tienda).
+
+Dos mecanismos complementarios:
+
+1. Ventana de descarga por dispositivo (ROLLOUT_ENABLED=true). Dentro del
+   horario valle ROLLOUT_WINDOW cada tienda recibe un desplazamiento estable
+   y, dentro de él, cada dispositivo otro de hasta ROLLOUT_TIENDA_SPREAD
+   segundos. Los manifiestos incluyen en cada video `not_before`: la primera
+   ventana del dispositivo posterior a la asignación del video. Es una
+   indicación para el reproductor; no se impone en la descarga.
+
+2. Cubetas de tokens en bytes en los endpoints de descarga: una global
+   (ROLLOUT_GLOBAL_BYTES_PER_SEC) y una por tienda
+   (ROLLOUT_TIENDA_BYTES_PER_SEC). Una descarga se admite mientras la cubeta
+   tenga saldo positivo y descuenta su tamaño (el saldo puede quedar en
+   negativo); si no, se responde 429 con Retry-After. Con tasa 0 no hay límite.
+
+Las descargas completas con dispositivo identificado se registran en
+video_downloads para la vista de progreso (/api/rollout/progress).
+"""
+
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.database import PlayerSessionLocal
+from models.models import Device, DevicePlaylist, Playlist, PlaylistVideo, Video, VideoDownload
+from utils.file_streaming import RangeNotSatisfiable, parse_byte_range
+
+logger = logging.getLogger(__name__)
+
+ROLLOUT_ENABLED = os.getenv("ROLLOUT_ENABLED", "false").lower() in ("1", "true", "yes")
+# Horario valle (hora local del servidor); puede cruzar la medianoche
+ROLLOUT_WINDOW = os.getenv("ROLLOUT_WINDOW", "01:00-05:00")
+# Segundos sobre los que se reparten los dispositivos de una misma tienda
+ROLLOUT_TIENDA_SPREAD = int(os.getenv("ROLLOUT_TIENDA_SPREAD", "1800"))
+# Duración de la ventana de cada dispositivo
+ROLLOUT_DEVICE_WINDOW = int(os.getenv("ROLLOUT_DEVICE_WINDOW", "1800"))
+
+ROLLOUT_GLOBAL_BYTES_PER_SEC = float(os.getenv("ROLLOUT_GLOBAL_BYTES_PER_SEC", "0"))
+ROLLOUT_TIENDA_BYTES_PER_SEC = float(os.getenv("ROLLOUT_TIENDA_BYTES_PER_SEC", "0"))
+# Segundos de tasa acumulables como ráfaga
+ROLLOUT_BURST_SECONDS = float(os.getenv("ROLLOUT_BURST_SECONDS", "10"))
+
+# Encabezado con el que los reproductores Raspberry se identifican al descargar
+DEVICE_ID_HEADER = "X-Device-ID"
+
+
+# ==========================================
+# VENTANAS DE DESCARGA
+# ==========================================
+
+def parse_window(spec: str) -> Tuple[int, int]:
+    """
+    Interpreta "HH:MM-HH:MM"
+
+    Returns:
+        (segundos desde medianoche del inicio, duración en segundos)
+    """
+    try:
+        start_text, end_text = spec.split("-")
+        start_h, start_m = (int(part) for part in start_text.strip().split(":"))
+        end_h, end_m = (int(part) for part in end_text.strip().split(":"))
+    except ValueError:
+        raise ValueError(f"Ventana de despliegue no válida: {spec!r} (formato HH:MM-HH:MM)")
+    start = start_h * 3600 + start_m * 60
+    end = end_h * 3600 + end_m * 60
+    length = (end - start) % 86400 or 86400
+    return start, length
+
+
+def _fraction(value: str) -> float:
+    """Número estable en [0, 1) derivado de un texto"""
+    digest = hashlib.sha256(value.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+class RolloutSchedule:
+    """Asigna a cada dispositivo una ventana diaria estable dentro del horario valle"""
+
+    def __init__(self, window: str = ROLLOUT_WINDOW,
+                 tienda_spread: int = ROLLOUT_TIENDA_SPREAD,
+                 device_window: int = ROLLOUT_DEVICE_WINDOW):
+        """
+        Args:
+            window: Horario valle "HH:MM-HH:MM"
+            tienda_spread: Segundos sobre los que se reparten los dispositivos de una tienda
+            device_window: Duración de la ventana de cada dispositivo
+        """
+        self.window_start, self.window_length = parse_window(window)
+        self.device_window = min(device_window, self.window_length)
+        self.tienda_spread = max(0, min(tienda_spread, self.window_length - self.device_window))
+
+    def offset(self, device_id: str, tienda: Optional[str]) -> int:
+        """Segundos desde el inicio del horario valle hasta la ventana del dispositivo"""
+        # Las tiendas se reparten por todo el horario; sus dispositivos, dentro de su tramo
+        tienda_room = self.window_length - self.device_window - self.tienda_spread
+        tienda_offset = _fraction(f"tienda:{tienda or ''}") * tienda_room
+        device_offset = _fraction(f"device:{device_id}") * self.tienda_spread
+        return int(tienda_offset + device_offset)
+
+    def window_for(self, device_id: str, tienda: Optional[str],
+                   after: datetime) -> Tuple[datetime, datetime]:
+        """
+        Primera ventana del dispositivo que termina después de `after`
+
+        Returns:
+            (inicio, fin); si `after` cae dentro de la ventana, el inicio es `after`
+        """
+        offset = self.offset(device_id, tienda)
+        midnight = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        # La ventana del día anterior puede seguir abierta si el horario cruza la medianoche
+        for days in (-1, 0, 1):
+            start = midnight + timedelta(days=days, seconds=self.window_start + offset)
+            end = start + timedelta(seconds=self.device_window)
+            if end > after:
+                break
+        return max(start, after), end
+
+    def not_before(self, device_id: str, tienda: Optional[str], released_at: datetime) -> datetime:
+        """Momento a partir del cual el dispositivo debería descargar contenido publicado en released_at"""
+        return self.window_for(device_id, tienda, released_at)[0]
+
+
+rollout_schedule = RolloutSchedule()
+
+
+def release_times(db: Session, device_id: str, playlist_ids: Iterable[int]) -> Dict[int, datetime]:
+    """
+    Momento en que cada video pasó a estar disponible para el dispositivo
+
+    Es el más reciente entre la subida del video, su incorporación a la
+    playlist y la asignación de la playlist al dispositivo; si el video está
+    en varias playlists, cuenta la primera en que estuvo disponible.
+    """
+    playlist_ids = list(playlist_ids)
+    if not playlist_ids:
+        return {}
+    rows = db.query(
+        PlaylistVideo.video_id, Video.upload_date, PlaylistVideo.created_at, DevicePlaylist.assigned_at
+    ).join(
+        Video, Video.id == PlaylistVideo.video_id
+    ).join(
+        DevicePlaylist, DevicePlaylist.playlist_id == PlaylistVideo.playlist_id
+    ).filter(
+        DevicePlaylist.device_id == device_id,
+        PlaylistVideo.playlist_id.in_(playlist_ids)
+    ).all()
+
+    released = {}
+    for video_id, *moments in rows:
+        moments = [moment for moment in moments if moment is not None]
+        if not moments:
+            continue
+        moment = max(moments)
+        if video_id not in released or moment < released[video_id]:
+            released[video_id] = moment
+    return released
+
+
+def manifest_hints(db: Session, device_id: str, tienda: Optional[str],
+                   playlist_ids: Iterable[int]) -> Dict[int, str]:
+    """`not_before` (ISO 8601) por video para el manifiesto de un dispositivo"""
+    if not ROLLOUT_ENABLED:
+        return {}
+    return {
+        video_id: rollout_schedule.not_before(device_id, tienda, released_at).isoformat()
+        for video_id, released_at in release_times(db, device_id, playlist_ids).items()
+    }
+
+
+# ==========================================
+# CUBETAS DE TOKENS
+# ==========================================
+
+class TokenBucket:
+    """Cubeta de tokens en bytes; admite mientras el saldo sea positivo"""
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: Bytes por segundo que se reponen
+            burst: Saldo máximo acumulable
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self, now: float) -> float:
+        """Segundos hasta que el saldo vuelva a ser positivo (0 si ya lo es)"""
+        self._refill(now)
+        if self.tokens > 0:
+            return 0.0
+        return max(-self.tokens, 1.0) / self.rate
+
+    def consume(self, cost: int):
+        self.tokens -= cost
+
+
+class DownloadLimiter:
+    """Cubeta global y cubetas por tienda para los endpoints de descarga"""
+
+    def __init__(self, global_rate: float = ROLLOUT_GLOBAL_BYTES_PER_SEC,
+                 tienda_rate: float = ROLLOUT_TIENDA_BYTES_PER_SEC,
+                 burst_seconds: float = ROLLOUT_BURST_SECONDS):
+        """
+        Args:
+            global_rate: Bytes por segundo para todo el servidor (0 sin límite)
+            tienda_rate: Bytes por segundo por tienda (0 sin límite)
+            burst_seconds: Segundos de tasa acumulables como ráfaga
+        """
+        self.global_rate = global_rate
+        self.tienda_rate = tienda_rate
+        self.burst_seconds = burst_seconds
+        self._global = TokenBucket(global_rate, global_rate * burst_seconds) if global_rate > 0 else None
+        self._tiendas: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.admitted = 0
+        self.admitted_bytes = 0
+        self.rejected = 0
+
+    def _tienda_bucket(self, tienda: Optional[str]) -> Optional[TokenBucket]:
+        if self.tienda_rate <= 0 or not tienda:
+            return None
+        bucket = self._tiendas.get(tienda)
+        if bucket is None:
+            bucket = TokenBucket(self.tienda_rate, self.tienda_rate * self.burst_seconds)
+            self._tiendas[tienda] = bucket
+        return bucket
+
+    def acquire(self, cost: int, tienda: Optional[str] = None) -> float:
+        """
+        Intenta admitir una descarga de `cost` bytes
+
+        Returns:
+            0 si se admite; si no, segundos que el cliente debería esperar
+        """
+        with self._lock:
+            buckets = [bucket for bucket in (self._global, self._tienda_bucket(tienda)) if bucket]
+            now = time.monotonic()
+            wait = max((bucket.retry_after(now) for bucket in buckets), default=0.0)
+            if wait > 0:
+                self.rejected += 1
+                return wait
+            for bucket in buckets:
+                bucket.consume(cost)
+            self.admitted += 1
+            self.admitted_bytes += cost
+            return 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "global_bytes_per_sec": self.global_rate,
+                "tienda_bytes_per_sec": self.tienda_rate,
+                "global_tokens": int(self._global.tokens) if self._global else None,
+                "tiendas_throttled": sum(1 for bucket in self._tiendas.values() if bucket.tokens <= 0),
+                "admitted": self.admitted,
+                "admitted_bytes": self.admitted_bytes,
+                "rejected": self.rejected,
+            }
+
+
+# Instancia global del limitador
+download_limiter = DownloadLimiter()
+
+
+def requested_bytes(request: Request, file_size: int, ignore_range: bool = False) -> Tuple[int, bool]:
+    """
+    Bytes que enviará una descarga
+
+    Args:
+        ignore_range: La respuesta se envía completa aunque haya Range
+            (If-Range que no coincide)
+
+    Returns:
+        (bytes, si la respuesta llega hasta el final del archivo)
+    """
+    if request.method == "HEAD":
+        return 0, False
+    try:
+        byte_range = None if ignore_range else parse_byte_range(request.headers.get("range"), file_size)
+    except RangeNotSatisfiable:
+        return 0, False
+    if byte_range is None:
+        return file_size, True
+    start, end = byte_range
+    return end - start + 1, end == file_size - 1
+
+
+def admit_download(request: Request, file_size: int, tienda: Optional[str] = None,
+                   limiter: Optional[DownloadLimiter] = None, ignore_range: bool = False) -> bool:
+    """
+    Aplica las cubetas de tokens a una descarga
+
+    Args:
+        ignore_range: La respuesta se envía completa aunque haya Range
+
+    Returns:
+        True si la respuesta llega hasta el final del archivo (descarga completada)
+
+    Raises:
+        HTTPException: 429 con Retry-After si se supera la tasa
+    """
+    limiter = limiter or download_limiter
+    cost, reaches_end = requested_bytes(request, file_size, ignore_range)
+    if cost == 0:
+        return reaches_end
+    wait = limiter.acquire(cost, tienda)
+    if wait > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiadas descargas simultáneas, reintente más tarde",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))}
+        )
+    return reaches_end
+
+
+def device_for_request(db: Session, request: Request) -> Optional[Device]:
+    """Dispositivo que se identifica con X-Device-ID (reproductores Raspberry)"""
+    device_id = request.headers.get(DEVICE_ID_HEADER)
+    if not device_id:
+        return None
+    return db.query(Device).filter(Device.device_id == device_id).first()
+
+
+# ==========================================
+# PROGRESO
+# ==========================================
+
+def record_download(db: Session, device_id: str, video_id: int):
+    """Registra que un dispositivo descargó un video (no interrumpe la descarga si falla)"""
+    now = datetime.now()
+    try:
+        download = db.query(VideoDownload).filter(
+            VideoDownload.device_id == device_id,
+            VideoDownload.video_id == video_id
+        ).first()
+        if download is None:
+            db.add(VideoDownload(device_id=device_id, video_id=video_id,
+                                 first_fetched_at=now, last_fetched_at=now, fetch_count=1))
+        else:
+            download.last_fetched_at = now
+            download.fetch_count += 1
+        db.commit()
+    except IntegrityError:
+        # Otra petición del mismo dispositivo insertó la fila a la vez
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"No se pudo registrar la descarga del video {video_id} por {device_id}: {str(e)}")
+
+
+def record_download_in_background(device_id: str, video_id: int, session_factory=PlayerSessionLocal):
+    """Tarea de fondo para después de enviar el archivo (la sesión de la petición ya se cerró)"""
+    db = session_factory()
+    try:
+        record_download(db, device_id, video_id)
+    finally:
+        db.close()
+
+
+def _targets(db: Session):
+    """Pares (video, dispositivo) que deberían tener el video: playlists activas asignadas"""
+    return db.query(
+        PlaylistVideo.video_id.label("video_id"),
+        DevicePlaylist.device_id.label("device_id")
+    ).join(
+        DevicePlaylist, DevicePlaylist.playlist_id == PlaylistVideo.playlist_id
+    ).join(
+        Playlist, Playlist.id == PlaylistVideo.playlist_id
+    ).filter(
+        Playlist.is_active == True
+    ).distinct().subquery()
+
+
+def rollout_progress(db: Session, video_ids: Optional[Iterable[int]] = None,
+                     limit: Optional[int] = None) -> list:
+    """
+    Dispositivos destino y dispositivos que ya descargaron cada video
+
+    Returns:
+        Lista ordenada por video (más recientes primero)
+    """
+    targets = _targets(db)
+    query = db.query(
+        Video.id,
+        Video.title,
+        Video.upload_date,
+        func.count(targets.c.device_id),
+        func.count(VideoDownload.id),
+    ).join(
+        targets, targets.c.video_id == Video.id
+    ).outerjoin(
+        VideoDownload,
+        (VideoDownload.video_id == targets.c.video_id) & (VideoDownload.device_id == targets.c.device_id)
+    ).group_by(Video.id, Video.title, Video.upload_date).order_by(Video.id.desc())
+    if video_ids is not None:
+        query = query.filter(Video.id.in_(list(video_ids)))
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [
+        {
+            "video_id": video_id,
+            "title": title,
+            "upload_date": upload_date.isoformat() if upload_date else None,
+            "devices_targeted": targeted,
+            "devices_fetched": fetched,
+            "percent": round(100.0 * fetched / targeted, 1) if targeted else 0.0,
+        }
+        for video_id, title, upload_date, targeted, fetched in query.all()
+    ]
+
+
+def rollout_progress_by_tienda(db: Session, video_id: int) -> list:
+    """Progreso de un video desglosado por tienda"""
+    targets = _targets(db)
+    rows = db.query(
+        Device.tienda,
+        func.count(targets.c.device_id),
+        func.count(VideoDownload.id),
+        func.max(VideoDownload.last_fetched_at),
+    ).select_from(targets).join(
+        Device, Device.device_id == targets.c.device_id
+    ).outerjoin(
+        VideoDownload,
+        (VideoDownload.video_id == targets.c.video_id) & (VideoDownload.device_id == targets.c.device_id)
+    ).filter(
+        targets.c.video_id == video_id
+    ).group_by(Device.tienda).order_by(Device.tienda).all()
+
+    return [
+        {
+            "tienda": tienda,
+            "devices_targeted": targeted,
+            "devices_fetched": fetched,
+            "percent": round(100.0 * fetched / targeted, 1) if targeted else 0.0,
+            "last_fetched_at": last.isoformat() if last else None,
+        }
+        for tienda, targeted, fetched, last in rows
+    ]
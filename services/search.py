@@ -0,0 +1,226 @@
+# services/search.py - Búsqueda de texto con índices de trigramas (pg_trgm)
+
+"""
+Búsqueda por subcadena en dispositivos, playlists, videos y usuarios.
+
+Cada entidad tiene un "documento" de búsqueda: sus columnas de texto
+concatenadas y en minúsculas. En PostgreSQL ese mismo documento tiene un
+índice GIN gin_trgm_ops (migrations/add_search_trigram_indexes.py), de modo
+que `documento ILIKE '%término%'` usa el índice en lugar de recorrer la tabla.
+Los resultados se ordenan por word_similarity(término, documento).
+
+La búsqueda en una sola columna (p. ej. solo el nombre) filtra por el
+documento, que es lo que usa el índice, y después por la columna.
+
+Sin pg_trgm (SQLite en los tests, o la migración aún no aplicada) el filtro es
+el mismo ILIKE y el orden es el que indique el endpoint.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, literal_column, or_, select, text, union
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query, Session, aliased
+
+from models.models import Device, DevicePlaylist, Playlist, User, Video
+from utils.query_budget import outside_budget
+
+logger = logging.getLogger(__name__)
+
+# Carácter de escape para los comodines de LIKE escritos por el usuario
+LIKE_ESCAPE = "\\"
+
+# Segundos tras los que se vuelve a comprobar pg_trgm si no estaba instalada
+SEARCH_TRIGRAM_RECHECK = float(os.getenv("SEARCH_TRIGRAM_RECHECK", "300"))
+
+
+class SearchSpec:
+    """Columnas de texto que forman el documento de búsqueda de una tabla"""
+
+    def __init__(self, table: str, columns: Sequence):
+        self.table = table
+        self.columns = list(columns)
+
+    @property
+    def index_name(self) -> str:
+        return f"ix_{self.table}_search_trgm"
+
+    def _column(self, column, entity, qualified: bool):
+        if not qualified:
+            return literal_column(column.name)
+        return getattr(entity, column.key) if entity is not None else column
+
+    def document(self, entity=None, qualified: bool = True):
+        """
+        lower(coalesce(c1, '') || ' ' || coalesce(c2, '') ...)
+
+        Las constantes van como literales (no parámetros) para que la
+        expresión coincida con la del índice también con sentencias preparadas.
+
+        Args:
+            entity: Alias del modelo (aliased) si la tabla aparece más de una vez
+            qualified: False para el CREATE INDEX (columnas sin tabla)
+        """
+        empty, separator = literal_column("''"), literal_column("' '")
+        parts = [func.coalesce(self._column(column, entity, qualified), empty) for column in self.columns]
+        expression = parts[0]
+        for part in parts[1:]:
+            expression = expression.op("||")(separator).op("||")(part)
+        return func.lower(expression)
+
+    def index_ddl(self, concurrently: bool = True) -> str:
+        """CREATE INDEX del documento (usado por la migración)"""
+        document = self.document(qualified=False).compile(dialect=postgresql.dialect())
+        mode = "CONCURRENTLY " if concurrently else ""
+        return (f"CREATE INDEX {mode}IF NOT EXISTS {self.index_name} "
+                f"ON {self.table} USING gin (({document}) gin_trgm_ops)")
+
+
+DEVICE_SEARCH = SearchSpec("devices", [
+    Device.device_id, Device.name, Device.location, Device.tienda, Device.model,
+    Device.ip_address_lan, Device.ip_address_wifi,
+])
+PLAYLIST_SEARCH = SearchSpec("playlists", [Playlist.title, Playlist.description])
+VIDEO_SEARCH = SearchSpec("videos", [Video.title, Video.description])
+USER_SEARCH = SearchSpec("users", [User.username, User.email, User.fullname])
+
+SEARCH_SPECS = [DEVICE_SEARCH, PLAYLIST_SEARCH, VIDEO_SEARCH, USER_SEARCH]
+
+
+def clean_term(term: Optional[str]) -> Optional[str]:
+    """Término normalizado, o None si no hay nada que buscar"""
+    if term is None:
+        return None
+    term = term.strip().lower()
+    return term or None
+
+
+def like_pattern(term: str) -> str:
+    """'%término%' con %, _ y \\ del usuario escapados"""
+    escaped = (term.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+               .replace("%", f"{LIKE_ESCAPE}%")
+               .replace("_", f"{LIKE_ESCAPE}_"))
+    return f"%{escaped}%"
+
+
+def matches(spec: SearchSpec, term: str, columns: Optional[Sequence] = None, entity=None):
+    """
+    Condición de búsqueda
+
+    Args:
+        spec: Entidad buscada
+        term: Término ya normalizado (clean_term)
+        columns: Restringir a estas columnas (deben ser del documento)
+        entity: Alias del modelo, si se busca sobre un alias
+    """
+    pattern = like_pattern(term)
+    condition = spec.document(entity).ilike(pattern, escape=LIKE_ESCAPE)
+    if columns:
+        condition = condition & or_(*[
+            spec._column(column, entity, True).ilike(pattern, escape=LIKE_ESCAPE) for column in columns
+        ])
+    return condition
+
+
+# Resultado de la comprobación de pg_trgm por motor: (disponible, momento de la comprobación)
+_trigram_support: Dict[int, Tuple[bool, float]] = {}
+_trigram_lock = threading.Lock()
+
+
+def trigram_ranking_available(db: Session) -> bool:
+    """
+    Indica si la base de datos tiene pg_trgm
+
+    Una respuesta positiva se guarda para siempre; una negativa solo durante
+    SEARCH_TRIGRAM_RECHECK segundos, para detectar la migración aplicada
+    sin reiniciar el servidor.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+    engine = getattr(bind, "engine", bind)
+    key = id(engine)
+    now = time.monotonic()
+    with _trigram_lock:
+        cached = _trigram_support.get(key)
+    if cached is not None:
+        available, checked_at = cached
+        if available or now - checked_at < SEARCH_TRIGRAM_RECHECK:
+            return available
+    try:
+        # Comprobación de coste fijo: no cuenta para el presupuesto de la petición
+        with outside_budget():
+            available = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+    except Exception as e:
+        logger.warning(f"No se pudo comprobar pg_trgm: {str(e)}")
+        available = False
+    if not available and cached is None:
+        logger.info("pg_trgm no disponible: búsquedas sin ordenar por similitud")
+    elif available and cached is not None:
+        logger.info("pg_trgm disponible: búsquedas ordenadas por similitud")
+    with _trigram_lock:
+        _trigram_support[key] = (available, now)
+    return available
+
+
+def rank(db: Session, spec: SearchSpec, term: str):
+    """Expresión de relevancia (mayor es mejor), o None sin pg_trgm"""
+    if not trigram_ranking_available(db):
+        return None
+    return func.word_similarity(term, spec.document())
+
+
+def apply_search(db: Session, query: Query, spec: SearchSpec, term: Optional[str],
+                 columns: Optional[Sequence] = None, ranked: bool = True) -> Query:
+    """
+    Filtra la consulta por el término y, si ranked, ordena por relevancia
+
+    El orden que añada después el endpoint se aplica como desempate.
+    """
+    term = clean_term(term)
+    if term is None:
+        return query
+    query = query.filter(matches(spec, term, columns))
+    if ranked:
+        relevance = rank(db, spec, term)
+        if relevance is not None:
+            query = query.order_by(relevance.desc())
+    return query
+
+
+def device_search_columns(search_field: Optional[str]) -> List:
+    """Columnas de los selectores de campo de las páginas de dispositivos ([] = todas)"""
+    fields = {
+        "name": [Device.name],
+        "location": [Device.location],
+        "tienda": [Device.tienda],
+        "model": [Device.model],
+        "ip": [Device.ip_address_lan, Device.ip_address_wifi],
+    }
+    return fields.get(search_field or "all", [])
+
+
+def devices_matching(term: str, columns: Optional[Sequence] = None, include_playlists: bool = False):
+    """
+    Condición de búsqueda de dispositivos
+
+    Con include_playlists también coinciden los dispositivos que tienen asignada
+    una playlist cuyo título o descripción contiene el término. Las dos
+    búsquedas se unen con UNION para que cada una use su índice (un OR entre
+    ambas obligaría a recorrer todos los dispositivos).
+    """
+    condition = matches(DEVICE_SEARCH, term, columns)
+    if not include_playlists:
+        return condition
+    device = aliased(Device)
+    by_device = select(device.id).where(matches(DEVICE_SEARCH, term, columns, entity=device))
+    by_playlist = select(device.id).join(
+        DevicePlaylist, DevicePlaylist.device_id == device.device_id
+    ).join(
+        Playlist, Playlist.id == DevicePlaylist.playlist_id
+    ).where(matches(PLAYLIST_SEARCH, term))
+    return Device.id.in_(union(by_device, by_playlist))
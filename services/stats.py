@@ -0,0 +1,91 @@
+# services/stats.py - Estadísticas agregadas en una sola consulta
+
+"""
+Recuentos de los paneles (usuarios, playlists, tiendas).
+
+Cada panel se resuelve con una sola consulta `COUNT(*) FILTER (WHERE ...)`
+en lugar de un COUNT por cifra, y el resultado se guarda unos segundos
+(STATS_CACHE_TTL) en una caché que los commits que escriben en las tablas
+implicadas invalidan (services/pagination.py).
+"""
+
+import os
+import logging
+from datetime import datetime
+
+from sqlalchemy import exists, func
+from sqlalchemy.orm import Query, Session
+
+from models.models import AuthProvider, Device, Playlist, Tienda, User
+from services.pagination import CountCache, invalidate_on_writes
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se reutilizan las estadísticas de los paneles
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "15"))
+
+# Instancia global de la caché
+stats_cache = invalidate_on_writes(CountCache(ttl=STATS_CACHE_TTL))
+
+
+def _user_counts(query: Query) -> dict:
+    total, active, admins, local, ad = query.with_entities(
+        func.count(),
+        func.count().filter(User.is_active == True),
+        func.count().filter(User.is_admin == True),
+        func.count().filter(User.auth_provider == AuthProvider.LOCAL.value),
+        func.count().filter(User.auth_provider == AuthProvider.ACTIVE_DIRECTORY.value),
+    ).order_by(None).one()
+    return {
+        "total": total,
+        "active": active,
+        "inactive": total - active,
+        "admins": admins,
+        "local": local,
+        "ad": ad,
+    }
+
+
+def user_stats(db: Session) -> dict:
+    """Totales de usuarios: total, active, inactive, admins, local y ad"""
+    return stats_cache.get_or_count(("users", "stats"), lambda: _user_counts(db.query(User)))
+
+
+def filtered_user_stats(db: Session, query: Query, filters: tuple) -> dict:
+    """
+    Totales de una consulta de usuarios ya filtrada
+
+    Args:
+        query: Consulta de User con los filtros aplicados
+        filters: Valores de los filtros (clave de la caché)
+    """
+    return stats_cache.get_or_count(("users", "filtered") + tuple(filters), lambda: _user_counts(query))
+
+
+def playlist_stats(db: Session) -> dict:
+    """Playlists totales y vigentes (activas y sin expirar)"""
+    def count():
+        now = datetime.now()
+        total, active = db.query(
+            func.count(Playlist.id),
+            func.count(Playlist.id).filter(
+                Playlist.is_active == True,
+                (Playlist.expiration_date == None) | (Playlist.expiration_date > now)
+            ),
+        ).one()
+        return {"total": total, "active": active}
+
+    return stats_cache.get_or_count(("playlists", "stats"), count)
+
+
+def tienda_stats(db: Session) -> dict:
+    """Tiendas totales y con al menos un dispositivo activo"""
+    def count():
+        has_active_device = exists().where(Device.tienda == Tienda.tienda, Device.is_active == True)
+        total, active = db.query(
+            func.count(Tienda.id),
+            func.count(Tienda.id).filter(has_active_device),
+        ).one()
+        return {"total": total, "active": active}
+
+    return stats_cache.get_or_count((("tiendas", "devices"), "stats"), count)
@@ -0,0 +1,295 @@
+# services/thumbnails.py - Miniaturas y fotogramas de portada de los videos
+
+"""
+Genera con ffmpeg un fotograma de portada (poster) y miniaturas de varios
+tamaños por video, en un pool acotado de hilos fuera de las peticiones.
+
+Los archivos se guardan en THUMBNAIL_DIR con nombres derivados del contenido
+(`<sha256>_<tamaño>.jpg`), de modo que videos con el mismo contenido comparten
+miniaturas y la URL de Video.thumbnail_url(), que lleva `v=<hash>`, puede
+cachearse indefinidamente.
+
+Relleno de la biblioteca existente:
+
+    python -m services.thumbnails            # videos sin miniaturas
+    python -m services.thumbnails --force    # regenerar todas
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import argparse
+import time
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+from models.database import SessionLocal
+from models.models import Video
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", os.path.join("uploads", "thumbnails"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_TIMEOUT = float(os.getenv("THUMBNAIL_TIMEOUT", "60"))
+# Segundos antes de reintentar un video cuya generación falló
+THUMBNAIL_RETRY_SECONDS = float(os.getenv("THUMBNAIL_RETRY_SECONDS", "600"))
+
+# Ancho máximo por tamaño; el poster se genera primero y el resto se escala desde él
+THUMBNAIL_SIZES = {
+    "poster": 1280,
+    "large": 640,
+    "medium": 320,
+    "small": 160,
+}
+DEFAULT_SIZE = "medium"
+
+# Segundo del que se extrae el poster (se evita el primer fotograma, a menudo negro)
+POSTER_OFFSET_SECONDS = 5.0
+
+
+class ThumbnailError(Exception):
+    """ffmpeg no está disponible o no pudo extraer el fotograma"""
+
+
+def thumbnail_key(video: Video) -> Optional[str]:
+    """
+    Clave de caché de las miniaturas de un video
+
+    Es el SHA-256 del contenido; para videos anteriores al almacenamiento por
+    contenido se deriva de la ruta, el tamaño y la fecha de modificación.
+    """
+    if video.content_hash:
+        return video.content_hash
+    if not video.file_path:
+        return None
+    try:
+        stat = os.stat(video.file_path)
+    except OSError:
+        return None
+    fingerprint = f"{video.file_path}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def thumbnail_path(key: str, size: str) -> str:
+    return os.path.join(THUMBNAIL_DIR, key[:2], f"{key}_{size}.jpg")
+
+
+def _poster_offset(duration: Optional[int]) -> float:
+    if not duration:
+        return 1.0
+    return min(POSTER_OFFSET_SECONDS, duration * 0.1)
+
+
+def _run_ffmpeg(args: list):
+    try:
+        result = subprocess.run(
+            [FFMPEG_PATH, "-v", "error", "-y"] + args,
+            capture_output=True, timeout=THUMBNAIL_TIMEOUT, check=False
+        )
+    except subprocess.TimeoutExpired:
+        raise ThumbnailError(f"ffmpeg excedió {THUMBNAIL_TIMEOUT} segundos")
+    if result.returncode != 0:
+        raise ThumbnailError(result.stderr.decode("utf-8", "replace").strip() or "ffmpeg falló")
+
+
+def generate_thumbnails(file_path: str, key: str, duration: Optional[int] = None) -> Dict[str, str]:
+    """
+    Extrae el poster de un video y genera las miniaturas de cada tamaño
+
+    Returns:
+        Diccionario {tamaño: ruta} de los archivos generados
+
+    Raises:
+        ThumbnailError: Si ffmpeg no existe o no pudo extraer el fotograma
+    """
+    if shutil.which(FFMPEG_PATH) is None:
+        raise ThumbnailError(f"No se encontró ffmpeg ({FFMPEG_PATH})")
+
+    poster = thumbnail_path(key, "poster")
+    os.makedirs(os.path.dirname(poster), exist_ok=True)
+    scale = f"scale='min({THUMBNAIL_SIZES['poster']},iw)':-2"
+
+    # Escribir en un temporal y renombrar: nunca se sirve una imagen a medias
+    temp = f"{poster}.{threading.get_ident()}.tmp.jpg"
+    try:
+        _run_ffmpeg(["-ss", f"{_poster_offset(duration):.2f}", "-i", file_path,
+                     "-frames:v", "1", "-vf", scale, "-q:v", "3", temp])
+        if not os.path.exists(temp) or os.path.getsize(temp) == 0:
+            # El desplazamiento quedó fuera de un video muy corto: usar el primer fotograma
+            _run_ffmpeg(["-i", file_path, "-frames:v", "1", "-vf", scale, "-q:v", "3", temp])
+        os.replace(temp, poster)
+
+        generated = {"poster": poster}
+        for size, width in THUMBNAIL_SIZES.items():
+            if size == "poster":
+                continue
+            target = thumbnail_path(key, size)
+            temp = f"{target}.{threading.get_ident()}.tmp.jpg"
+            _run_ffmpeg(["-i", poster, "-vf", f"scale='min({width},iw)':-2", "-q:v", "4", temp])
+            os.replace(temp, target)
+            generated[size] = target
+        return generated
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def has_thumbnails(key: str) -> bool:
+    return all(os.path.exists(thumbnail_path(key, size)) for size in THUMBNAIL_SIZES)
+
+
+def remove_thumbnails(key: Optional[str]):
+    """Elimina las miniaturas de un contenido que ya no tiene videos"""
+    if not key:
+        return
+    for size in THUMBNAIL_SIZES:
+        path = thumbnail_path(key, size)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar la miniatura {path}: {e}")
+
+
+class ThumbnailPool:
+    """Pool acotado que genera miniaturas fuera de las peticiones"""
+
+    def __init__(self, max_workers: int = THUMBNAIL_WORKERS, generate=generate_thumbnails):
+        """
+        Args:
+            max_workers: Número máximo de ffmpeg simultáneos
+            generate: Función que genera las miniaturas (inyectable en tests)
+        """
+        self.max_workers = max_workers
+        self.generate = generate
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._failed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.generated = 0
+        self.failed = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="thumbnails"
+            )
+        return self._executor
+
+    def submit(self, file_path: str, key: str, duration: Optional[int] = None) -> Future:
+        """Encola la generación; las peticiones repetidas de la misma clave se unen"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None and not future.done():
+                return future
+            future = self._get_executor().submit(self._run, file_path, key, duration)
+            self._pending[key] = future
+        future.add_done_callback(lambda _f: self._discard(key, _f))
+        return future
+
+    def submit_video(self, video: Video) -> Optional[Future]:
+        """Encola las miniaturas de un video si aún no existen ni fallaron hace poco"""
+        key = thumbnail_key(video)
+        if key is None or has_thumbnails(key):
+            return None
+        failed_at = self._failed_at.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < THUMBNAIL_RETRY_SECONDS:
+            return None
+        return self.submit(video.file_path, key, video.duration)
+
+    def _discard(self, key: str, future: Future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def _run(self, file_path: str, key: str, duration: Optional[int]) -> Optional[Dict[str, str]]:
+        try:
+            generated = self.generate(file_path, key, duration)
+        except ThumbnailError as e:
+            self.failed += 1
+            self._failed_at[key] = time.monotonic()
+            logger.warning(f"No se pudieron generar miniaturas de {file_path}: {str(e)}")
+            return None
+        self.generated += 1
+        self._failed_at.pop(key, None)
+        logger.info(f"Miniaturas generadas para {file_path} ({key[:12]})")
+        return generated
+
+    def backfill(self, session_factory=SessionLocal, force: bool = False) -> int:
+        """
+        Encola las miniaturas de los videos existentes y espera a que terminen
+
+        Returns:
+            Número de generaciones encoladas
+        """
+        db = session_factory()
+        try:
+            videos = db.query(Video).order_by(Video.id).all()
+            jobs = {}
+            for video in videos:
+                key = thumbnail_key(video)
+                if key is None or key in jobs or (not force and has_thumbnails(key)):
+                    continue
+                jobs[key] = (video.file_path, video.duration)
+        finally:
+            db.close()
+
+        futures = [self.submit(file_path, key, duration) for key, (file_path, duration) in jobs.items()]
+        wait(futures)
+        return len(futures)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(1 for future in self._pending.values() if not future.done())
+        return {
+            "pending": pending,
+            "generated": self.generated,
+            "failed": self.failed,
+            "max_workers": self.max_workers,
+        }
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+
+# Instancia global del pool
+thumbnail_pool = ThumbnailPool()
+
+
+def start_thumbnail_pool(app):
+    """
+    Registra el cierre del pool de miniaturas en el ciclo de vida de la app
+
+    Args:
+        app: Instancia de FastAPI
+    """
+    @app.on_event("shutdown")
+    async def stop_thumbnails():
+        thumbnail_pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Generar miniaturas de los videos existentes")
+    parser.add_argument("--force", action="store_true", help="Regenerar aunque ya existan")
+    parser.add_argument("--workers", type=int, default=THUMBNAIL_WORKERS, help="ffmpeg simultáneos")
+    args = parser.parse_args()
+
+    pool = ThumbnailPool(max_workers=args.workers)
+    try:
+        queued = pool.backfill(force=args.force)
+    finally:
+        pool.shutdown(wait=True)
+    logger.info(f"Relleno terminado: {queued} encolados, {pool.generated} generados, {pool.failed} fallidos")
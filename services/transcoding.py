@@ -0,0 +1,542 @@
+# services/transcoding.py - Versiones H.264 de los videos para cada modelo de Raspberry Pi
+
+"""
+Sistema opcional (TRANSCODING_ENABLED=true) que genera, por video, una versión
+H.264 decodificable por hardware con la resolución máxima de cada modelo de
+reproductor de la flota.
+
+La tabla video_renditions es a la vez el resultado y la cola persistente: cada
+fila nace como `pending`, un trabajador la reclama (`processing`) y termina en
+`ready`, `failed` o `source` (el original ya es apto y no se recodifica). Las
+filas que quedaron en `processing` por un reinicio vuelven a `pending` al
+arrancar. Como mucho se ejecutan TRANSCODE_WORKERS procesos ffmpeg a la vez.
+
+Los manifiestos apuntan a cada dispositivo a la versión de su perfil
+(`?rendition=<perfil>` en la URL de descarga) cuando está lista, y al original
+mientras tanto.
+
+Encolar la biblioteca existente para los modelos registrados:
+
+    python -m services.transcoding
+"""
+
+import os
+import re
+import shutil
+import asyncio
+import logging
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.database import SessionLocal
+from models.models import Device, Video, VideoRendition
+from services import video_storage
+
+logger = logging.getLogger(__name__)
+
+TRANSCODING_ENABLED = os.getenv("TRANSCODING_ENABLED", "false").lower() in ("1", "true", "yes")
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "1"))
+TRANSCODE_POLL_INTERVAL = float(os.getenv("TRANSCODE_POLL_INTERVAL", "30"))
+TRANSCODE_MAX_ATTEMPTS = int(os.getenv("TRANSCODE_MAX_ATTEMPTS", "3"))
+TRANSCODE_TIMEOUT = float(os.getenv("TRANSCODE_TIMEOUT", str(6 * 3600)))
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+
+RENDITION_DIR = os.path.join(video_storage.UPLOAD_DIR, "renditions")
+
+# Estados de una versión
+PENDING = "pending"
+PROCESSING = "processing"
+READY = "ready"
+FAILED = "failed"
+SOURCE = "source"
+
+# Perfiles H.264 que los decodificadores de cada generación reproducen con fluidez
+RENDITION_PROFILES = {
+    "1080p60": {"width": 1920, "height": 1080, "fps": 60, "level": "4.2", "maxrate": 10_000_000},
+    "1080p30": {"width": 1920, "height": 1080, "fps": 30, "level": "4.0", "maxrate": 8_000_000},
+    "720p": {"width": 1280, "height": 720, "fps": 30, "level": "3.1", "maxrate": 4_000_000},
+}
+
+# Device.model trae el texto de /proc/device-tree/model ("Raspberry Pi 4 Model B Rev 1.4");
+# se usa la primera coincidencia
+MODEL_PROFILES = (
+    (re.compile(r"pi 5|pi 500|compute module 5", re.IGNORECASE), "1080p60"),
+    (re.compile(r"pi 4|pi 400|compute module 4", re.IGNORECASE), "1080p60"),
+    (re.compile(r"pi 3|zero 2|compute module 3", re.IGNORECASE), "1080p30"),
+    (re.compile(r"raspberry pi", re.IGNORECASE), "720p"),
+)
+DEFAULT_PROFILE = "1080p30"
+
+# Contenedores que los reproductores abren sin remultiplexar
+COMPATIBLE_CONTAINERS = {"mp4", "mov", "m4v"}
+
+
+class TranscodeError(Exception):
+    """ffmpeg no está disponible o falló al recodificar"""
+
+
+def profile_for_model(model: Optional[str]) -> str:
+    """Perfil de versión correspondiente a un Device.model"""
+    for pattern, profile in MODEL_PROFILES:
+        if model and pattern.search(model):
+            return profile
+    return DEFAULT_PROFILE
+
+
+def fleet_profiles(db: Session) -> Set[str]:
+    """Perfiles necesarios para los modelos de dispositivo registrados"""
+    return {profile_for_model(model) for (model,) in db.query(Device.model).distinct()}
+
+
+def source_fits_profile(video: Video, profile: str) -> bool:
+    """El original ya es H.264 dentro de los límites del perfil"""
+    limits = RENDITION_PROFILES[profile]
+    if video.video_codec != "h264" or not video.width or not video.height:
+        return False
+    if (video.container or "").lower() not in COMPATIBLE_CONTAINERS:
+        return False
+    if video.width > limits["width"] or video.height > limits["height"]:
+        return False
+    return not video.bitrate or video.bitrate <= limits["maxrate"] * 1.25
+
+
+def rendition_path(key: str, profile: str) -> str:
+    return os.path.join(RENDITION_DIR, key[:2], f"{key}_{profile}.mp4")
+
+
+def transcode_file(source_path: str, target_path: str, profile: str):
+    """
+    Recodifica un video a H.264/AAC en MP4 con los límites del perfil
+
+    Raises:
+        TranscodeError: Si ffmpeg no existe, falla o excede el tiempo límite
+    """
+    if shutil.which(FFMPEG_PATH) is None:
+        raise TranscodeError(f"No se encontró ffmpeg ({FFMPEG_PATH})")
+
+    limits = RENDITION_PROFILES[profile]
+    scale = (
+        f"scale='min({limits['width']},iw)':'min({limits['height']},ih)'"
+        ":force_original_aspect_ratio=decrease:force_divisible_by=2"
+    )
+    maxrate = limits["maxrate"]
+    command = [
+        FFMPEG_PATH, "-v", "error", "-y", "-i", source_path,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", scale, "-fpsmax", str(limits["fps"]),
+        "-c:v", "libx264", "-preset", "medium", "-crf", "21",
+        "-profile:v", "high", "-level:v", limits["level"], "-pix_fmt", "yuv420p",
+        "-maxrate", str(maxrate), "-bufsize", str(maxrate * 2),
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+        "-movflags", "+faststart",
+        target_path,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=TRANSCODE_TIMEOUT, check=False)
+    except subprocess.TimeoutExpired:
+        raise TranscodeError(f"ffmpeg excedió {TRANSCODE_TIMEOUT} segundos")
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.decode("utf-8", "replace").strip()[-2000:] or "ffmpeg falló")
+
+
+def enqueue_video(db: Session, video: Video, profiles: Optional[Iterable[str]] = None) -> int:
+    """
+    Crea los trabajos pendientes de un video para los perfiles indicados
+    (por defecto, los de la flota). No hace nada si el sistema está desactivado.
+
+    Returns:
+        Número de trabajos nuevos
+    """
+    if not TRANSCODING_ENABLED and profiles is None:
+        return 0
+    profiles = set(profiles) if profiles is not None else fleet_profiles(db)
+    existing = {
+        profile for (profile,) in db.query(VideoRendition.profile).filter(
+            VideoRendition.video_id == video.id
+        )
+    }
+    created = 0
+    for profile in sorted(profiles - existing):
+        db.add(VideoRendition(video_id=video.id, profile=profile, status=PENDING))
+        created += 1
+    if created:
+        db.commit()
+        transcode_worker.wake()
+    return created
+
+
+def enqueue_video_id(video_id: int, session_factory=SessionLocal) -> int:
+    """enqueue_video con sesión propia, para usar desde hilos de fondo"""
+    if not TRANSCODING_ENABLED:
+        return 0
+    db = session_factory()
+    try:
+        video = db.query(Video).filter(Video.id == video_id).first()
+        return enqueue_video(db, video) if video is not None else 0
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error al encolar la recodificación del video {video_id}: {str(e)}")
+        return 0
+    finally:
+        db.close()
+
+
+def ready_renditions(db: Session, video_ids: Iterable[int], profile: str) -> Dict[int, VideoRendition]:
+    """Versiones listas de un perfil para varios videos, en una sola consulta"""
+    video_ids = list(video_ids)
+    if not video_ids:
+        return {}
+    rows = db.query(VideoRendition).filter(
+        VideoRendition.video_id.in_(video_ids),
+        VideoRendition.profile == profile,
+        VideoRendition.status == READY
+    ).all()
+    return {rendition.video_id: rendition for rendition in rows}
+
+
+def _servable_path(video: Video, rendition: Optional[VideoRendition]) -> str:
+    if rendition is not None and rendition.file_path and os.path.exists(rendition.file_path):
+        return rendition.file_path
+    return video.file_path
+
+
+def resolve_download_path(db: Session, video: Video, profile: Optional[str]) -> str:
+    """Ruta a servir: la versión del perfil si está lista, o el original"""
+    rendition = None
+    if profile:
+        rendition = db.query(VideoRendition).filter(
+            VideoRendition.video_id == video.id,
+            VideoRendition.profile == profile,
+            VideoRendition.status == READY
+        ).first()
+    return _servable_path(video, rendition)
+
+
+def resolve_download_paths(db: Session, videos: Iterable[Video], profile: Optional[str]) -> Dict[int, str]:
+    """resolve_download_path para varios videos, con una sola consulta de versiones"""
+    videos = list(videos)
+    renditions = ready_renditions(db, {video.id for video in videos}, profile) if profile else {}
+    return {video.id: _servable_path(video, renditions.get(video.id)) for video in videos}
+
+
+def orphaned_rendition_files(db: Session, video: Video) -> Set[str]:
+    """
+    Archivos de versiones que quedarán sin referencia al borrar el video
+
+    Llamar antes de eliminar el video; borrar los archivos tras el commit.
+    """
+    paths = {
+        rendition.file_path for rendition in video.renditions
+        if rendition.status == READY and rendition.file_path
+    }
+    if not paths:
+        return set()
+    shared = {
+        path for (path,) in db.query(VideoRendition.file_path).filter(
+            VideoRendition.file_path.in_(paths),
+            VideoRendition.video_id != video.id
+        )
+    }
+    return paths - shared
+
+
+class TranscodeWorker:
+    """Reclama trabajos de la cola persistente y los ejecuta en un pool acotado"""
+
+    def __init__(self, max_workers: int = TRANSCODE_WORKERS,
+                 session_factory=SessionLocal,
+                 poll_interval: float = TRANSCODE_POLL_INTERVAL,
+                 transcode=transcode_file):
+        """
+        Args:
+            max_workers: Número máximo de ffmpeg simultáneos
+            session_factory: Fábrica de sesiones
+            poll_interval: Segundos entre revisiones de la cola
+            transcode: Función que recodifica un archivo (inyectable en tests)
+        """
+        self.max_workers = max_workers
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.transcode = transcode
+        self.running = False
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Métricas
+        self.completed = 0
+        self.failed = 0
+        self.reused = 0
+
+    def wake(self):
+        """Revisa la cola de inmediato (seguro desde cualquier hilo)"""
+        if self._wakeup is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def recover_interrupted(self) -> int:
+        """Devuelve a la cola los trabajos que quedaron a medias por un reinicio"""
+        db = self.session_factory()
+        try:
+            count = db.query(VideoRendition).filter(VideoRendition.status == PROCESSING).update(
+                {VideoRendition.status: PENDING}, synchronize_session=False
+            )
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def claim_next(self) -> Optional[int]:
+        """Marca como en proceso el trabajo pendiente más antiguo"""
+        db = self.session_factory()
+        try:
+            while True:
+                candidate = db.query(VideoRendition.id).filter(
+                    VideoRendition.status == PENDING
+                ).order_by(VideoRendition.id).first()
+                if candidate is None:
+                    return None
+                # Reclamo condicional: si otro proceso lo tomó antes, probar el siguiente
+                claimed = db.query(VideoRendition).filter(
+                    VideoRendition.id == candidate.id,
+                    VideoRendition.status == PENDING
+                ).update({
+                    VideoRendition.status: PROCESSING,
+                    VideoRendition.attempts: VideoRendition.attempts + 1,
+                    VideoRendition.started_at: datetime.now(),
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    return candidate.id
+        finally:
+            db.close()
+
+    def process(self, rendition_id: int):
+        """Ejecuta un trabajo reclamado y guarda su resultado"""
+        db = self.session_factory()
+        try:
+            rendition = db.query(VideoRendition).filter(VideoRendition.id == rendition_id).first()
+            if rendition is None:
+                return
+            try:
+                self._produce(db, rendition)
+                self.completed += 1
+            except Exception as e:
+                db.rollback()
+                rendition = db.query(VideoRendition).filter(VideoRendition.id == rendition_id).first()
+                if rendition is None:
+                    return
+                retry = rendition.attempts < TRANSCODE_MAX_ATTEMPTS
+                rendition.status = PENDING if retry else FAILED
+                rendition.error = str(e)[-2000:]
+                rendition.finished_at = datetime.now()
+                db.commit()
+                self.failed += 1
+                logger.error(
+                    f"Error al recodificar video {rendition.video_id} ({rendition.profile}), "
+                    f"intento {rendition.attempts}: {str(e)}"
+                )
+        finally:
+            db.close()
+
+    def _produce(self, db: Session, rendition: VideoRendition):
+        video = rendition.video
+        profile = rendition.profile
+
+        if source_fits_profile(video, profile):
+            rendition.status = SOURCE
+            rendition.finished_at = datetime.now()
+            db.commit()
+            logger.info(f"Video {video.id}: el original ya es apto para {profile}")
+            return
+
+        # Videos con el mismo contenido comparten la versión ya generada
+        if video.content_hash:
+            shared = db.query(VideoRendition).join(Video).filter(
+                Video.content_hash == video.content_hash,
+                VideoRendition.profile == profile,
+                VideoRendition.status == READY,
+                VideoRendition.id != rendition.id
+            ).first()
+            if shared is not None and shared.file_path and os.path.exists(shared.file_path):
+                self._mark_ready(db, rendition, shared.file_path, shared.file_size,
+                                 shared.content_hash, shared.width, shared.height)
+                self.reused += 1
+                return
+
+        key = video.content_hash or f"video{video.id}"
+        target = rendition_path(key, profile)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp = f"{target}.{rendition.id}.tmp.mp4"
+        try:
+            self.transcode(video.file_path, temp, profile)
+            content_hash, file_size = video_storage.hash_file(temp)
+            os.replace(temp, target)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+        limits = RENDITION_PROFILES[profile]
+        width, height = _fit(video.width, video.height, limits["width"], limits["height"])
+        self._mark_ready(db, rendition, target, file_size, content_hash, width, height)
+        logger.info(f"Video {video.id}: versión {profile} lista ({file_size} bytes)")
+
+    @staticmethod
+    def _mark_ready(db: Session, rendition: VideoRendition, file_path: str, file_size: Optional[int],
+                    content_hash: Optional[str], width: Optional[int], height: Optional[int]):
+        rendition.status = READY
+        rendition.file_path = file_path
+        rendition.file_size = file_size
+        rendition.content_hash = content_hash
+        rendition.width = width
+        rendition.height = height
+        rendition.error = None
+        rendition.finished_at = datetime.now()
+        db.commit()
+
+    def _run_job(self, rendition_id: int):
+        try:
+            self.process(rendition_id)
+        finally:
+            with self._active_lock:
+                self._active -= 1
+            self.wake()
+
+    def _fill_slots(self):
+        """Reclama trabajos mientras haya hueco en el pool (se ejecuta en un hilo)"""
+        while True:
+            with self._active_lock:
+                if self._active >= self.max_workers:
+                    return
+                self._active += 1
+            rendition_id = self.claim_next()
+            if rendition_id is None:
+                with self._active_lock:
+                    self._active -= 1
+                return
+            self._executor.submit(self._run_job, rendition_id)
+
+    async def start(self):
+        """Revisa la cola periódicamente hasta que se llame a stop()"""
+        if self.running:
+            logger.warning("El trabajador de recodificación ya está en ejecución")
+            return
+
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transcode")
+
+        recovered = await asyncio.to_thread(self.recover_interrupted)
+        logger.info(
+            f"Iniciando recodificación con {self.max_workers} trabajadores "
+            f"({recovered} trabajos interrumpidos reanudados)"
+        )
+
+        try:
+            while self.running:
+                try:
+                    await asyncio.to_thread(self._fill_slots)
+                except Exception as e:
+                    logger.error(f"Error al reclamar trabajos de recodificación: {str(e)}")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.running = False
+
+    def stop(self):
+        """Detiene la revisión de la cola; los ffmpeg en curso se reanudan al reiniciar"""
+        logger.info("Deteniendo trabajador de recodificación")
+        self.running = False
+        if self._wakeup is not None:
+            self.wake()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        db = self.session_factory()
+        try:
+            counts = dict(
+                db.query(VideoRendition.status, func.count(VideoRendition.id))
+                .group_by(VideoRendition.status).all()
+            )
+        except Exception:
+            counts = {}
+        finally:
+            db.close()
+        return {
+            "enabled": TRANSCODING_ENABLED,
+            "active": self._active,
+            "max_workers": self.max_workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "reused": self.reused,
+            "queue": counts,
+        }
+
+
+def _fit(width: Optional[int], height: Optional[int], max_width: int, max_height: int):
+    """Dimensiones resultantes de encajar width x height en el perfil, sin ampliar"""
+    if not width or not height:
+        return None, None
+    ratio = min(max_width / width, max_height / height, 1.0)
+    return int(width * ratio) // 2 * 2, int(height * ratio) // 2 * 2
+
+
+# Instancia global del trabajador
+transcode_worker = TranscodeWorker()
+
+
+def start_transcode_worker(app):
+    """
+    Registra el trabajador de recodificación en el ciclo de vida de la app
+    (solo si TRANSCODING_ENABLED está activo)
+
+    Args:
+        app: Instancia de FastAPI
+    """
+    if not TRANSCODING_ENABLED:
+        logger.info("Recodificación desactivada (TRANSCODING_ENABLED)")
+        return
+
+    @app.on_event("startup")
+    async def start_transcoding():
+        asyncio.create_task(transcode_worker.start())
+
+    @app.on_event("shutdown")
+    async def stop_transcoding():
+        transcode_worker.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Encolar versiones para los videos existentes")
+    parser.add_argument("--profile", action="append", choices=sorted(RENDITION_PROFILES),
+                        help="Perfil a generar (por defecto, los de los modelos registrados)")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        profiles = set(args.profile) if args.profile else fleet_profiles(session)
+        logger.info(f"Perfiles: {', '.join(sorted(profiles)) or 'ninguno'}")
+        queued = sum(enqueue_video(session, video, profiles) for video in session.query(Video).all())
+    finally:
+        session.close()
+    logger.info(f"{queued} trabajos encolados; el servidor los procesa con TRANSCODING_ENABLED=true")
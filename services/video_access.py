@@ -0,0 +1,141 @@
+# services/video_access.py - Índice en memoria de los videos autorizados por dispositivo
+
+"""
+Conjunto de videos que cada dispositivo puede descargar por la API de
+clientes: los de todas las playlists asignadas (DevicePlaylist).
+
+El conjunto de un dispositivo se construye con una consulta la primera vez y
+después la autorización es una búsqueda en memoria. Las entradas se descartan
+con los mismos eventos de sesión que los manifiestos (ver
+manifest_cache.add_change_listener):
+
+- Cambios en las asignaciones del dispositivo o su borrado.
+- Cambios en la composición de alguna de sus playlists.
+
+Como red de seguridad frente a escrituras de otros procesos, una entrada no
+vive más de VIDEO_ACCESS_TTL segundos.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from models.models import DevicePlaylist, PlaylistVideo
+from services.manifest_cache import add_change_listener
+
+logger = logging.getLogger(__name__)
+
+VIDEO_ACCESS_TTL = float(os.getenv("VIDEO_ACCESS_TTL", "300"))
+VIDEO_ACCESS_MAX_DEVICES = int(os.getenv("VIDEO_ACCESS_MAX_DEVICES", "20000"))
+
+
+class DeviceAccess:
+    """Videos autorizados de un dispositivo y las playlists de las que proceden"""
+
+    __slots__ = ("playlist_ids", "video_ids", "expires_at")
+
+    def __init__(self, playlist_ids: Iterable[int], video_ids: Iterable[int], expires_at: float):
+        self.playlist_ids: FrozenSet[int] = frozenset(playlist_ids)
+        self.video_ids: FrozenSet[int] = frozenset(video_ids)
+        self.expires_at = expires_at
+
+
+def load_device_access(db: Session, device_id: str, ttl: float = VIDEO_ACCESS_TTL) -> DeviceAccess:
+    """Consulta las playlists asignadas al dispositivo y sus videos"""
+    rows = db.query(DevicePlaylist.playlist_id, PlaylistVideo.video_id).outerjoin(
+        PlaylistVideo, PlaylistVideo.playlist_id == DevicePlaylist.playlist_id
+    ).filter(
+        DevicePlaylist.device_id == device_id
+    ).all()
+    return DeviceAccess(
+        playlist_ids={playlist_id for playlist_id, _ in rows},
+        video_ids={video_id for _, video_id in rows if video_id is not None},
+        expires_at=time.monotonic() + ttl
+    )
+
+
+class VideoAccessIndex:
+    """Índice device_id -> videos autorizados, acotado y con invalidación por dependencias"""
+
+    def __init__(self, ttl: float = VIDEO_ACCESS_TTL, max_devices: int = VIDEO_ACCESS_MAX_DEVICES):
+        """
+        Args:
+            ttl: Segundos máximos de vida de una entrada
+            max_devices: Dispositivos en memoria (se descartan los menos usados)
+        """
+        self.ttl = ttl
+        self.max_devices = max_devices
+        self._entries: "OrderedDict[str, DeviceAccess]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Evita guardar conjuntos construidos con datos que cambiaron mientras tanto
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, db: Session, device_id: str) -> DeviceAccess:
+        """Entrada del dispositivo, consultándola si no está en memoria"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(device_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+
+        entry = load_device_access(db, device_id, self.ttl)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[device_id] = entry
+                self._entries.move_to_end(device_id)
+                while len(self._entries) > self.max_devices:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def allows(self, db: Session, device_id: str, video_id: int) -> bool:
+        """Indica si el video está en alguna playlist asignada al dispositivo"""
+        return video_id in self.get(db, device_id).video_ids
+
+    def apply_changes(self, changes: dict):
+        """Callback de manifest_cache.add_change_listener"""
+        if changes["all"]:
+            self.invalidate_all()
+            return
+        device_ids = set(changes["devices"])
+        playlist_ids = set(changes["playlists"])
+        if device_ids or playlist_ids:
+            self._drop(lambda device_id, entry: device_id in device_ids
+                       or not entry.playlist_ids.isdisjoint(playlist_ids))
+
+    def invalidate_all(self):
+        self._drop(lambda device_id, entry: True)
+
+    def _drop(self, predicate):
+        with self._lock:
+            self._generation += 1
+            stale = [device_id for device_id, entry in self._entries.items() if predicate(device_id, entry)]
+            for device_id in stale:
+                del self._entries[device_id]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "devices": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "ttl_seconds": self.ttl,
+            }
+
+
+# Instancia global del índice
+video_access_index = VideoAccessIndex()
+add_change_listener(video_access_index.apply_changes)
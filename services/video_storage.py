@@ -0,0 +1,188 @@
+# services/video_storage.py - Almacenamiento de videos direccionado por contenido
+
+"""
+Los videos se guardan una sola vez por contenido, bajo su SHA-256:
+
+    uploads/blobs/<2 primeros hex>/<sha256><extensión>
+
+Cada archivo tiene una fila en video_blobs con un contador de referencias.
+Subir un video idéntico a uno existente solo incrementa el contador; eliminar
+un video lo decrementa y el archivo se borra cuando llega a cero.
+"""
+
+import os
+import uuid
+import hashlib
+import logging
+from typing import BinaryIO, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.models import VideoBlob
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploads"
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+TEMP_DIR = os.path.join(UPLOAD_DIR, "tmp")
+
+# Tamaño de los bloques al copiar y calcular el hash
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_path(content_hash: str, extension: str = "") -> str:
+    """Ruta final de un blob a partir de su hash"""
+    return os.path.join(BLOB_DIR, content_hash[:2], f"{content_hash}{extension.lower()}")
+
+
+def new_temp_path(suffix: str = "") -> str:
+    """Ruta temporal única dentro del directorio de subidas (mismo sistema de archivos)"""
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    return os.path.join(TEMP_DIR, f"{uuid.uuid4()}{suffix}")
+
+
+def hash_file(path: str) -> Tuple[str, int]:
+    """
+    Calcula el SHA-256 y el tamaño de un archivo existente
+
+    Returns:
+        Tupla (hash hexadecimal, tamaño en bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def write_and_hash(source: BinaryIO, temp_path: str) -> Tuple[str, int]:
+    """
+    Copia un flujo a un archivo temporal calculando el SHA-256 en la misma pasada
+
+    Función bloqueante: llamarla desde el threadpool en endpoints async.
+
+    Returns:
+        Tupla (hash hexadecimal, tamaño en bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(temp_path, "wb") as target:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            target.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def acquire_blob(db: Session, content_hash: str, temp_path: str, file_size: int,
+                 extension: str = "") -> VideoBlob:
+    """
+    Registra una referencia al blob con ese contenido
+
+    Si el blob ya existe se incrementa su contador y se descarta el archivo
+    temporal; si no, el temporal se mueve a su ruta definitiva. No hace commit:
+    el llamador confirma junto con la fila del Video.
+
+    Args:
+        db: Sesión de base de datos
+        content_hash: SHA-256 del contenido
+        temp_path: Archivo ya escrito con ese contenido
+        file_size: Tamaño en bytes
+        extension: Extensión original (se usa solo al crear el blob)
+
+    Returns:
+        El VideoBlob referenciado
+    """
+    for _attempt in range(2):
+        blob = _find_blob(db, content_hash)
+        if blob is not None and os.path.exists(blob.file_path):
+            db.query(VideoBlob).filter(VideoBlob.id == blob.id).update(
+                {VideoBlob.ref_count: VideoBlob.ref_count + 1},
+                synchronize_session=False
+            )
+            _discard(temp_path)
+            db.refresh(blob)
+            logger.info(f"Contenido duplicado, reutilizando blob {content_hash[:12]} ({blob.ref_count} referencias)")
+            return blob
+
+        if blob is not None:
+            # La fila existía pero faltaba el archivo: restaurarlo con este contenido
+            os.makedirs(os.path.dirname(blob.file_path), exist_ok=True)
+            os.replace(temp_path, blob.file_path)
+            logger.warning(f"Archivo de blob {content_hash[:12]} restaurado en {blob.file_path}")
+            blob.ref_count += 1
+            db.flush()
+            return blob
+
+        # La fila se inserta antes de mover nada a la ruta compartida: si otra
+        # subida del mismo contenido gana, este temporal sigue siendo solo nuestro
+        final_path = blob_path(content_hash, extension)
+        try:
+            with db.begin_nested():
+                blob = VideoBlob(
+                    content_hash=content_hash,
+                    file_path=final_path,
+                    file_size=file_size,
+                    ref_count=1
+                )
+                db.add(blob)
+        except IntegrityError:
+            # Otra subida creó el blob a la vez: sumar referencia y descartar el temporal
+            continue
+
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        return blob
+
+    raise RuntimeError(f"No se pudo registrar el blob {content_hash}")
+
+
+def _find_blob(db: Session, content_hash: str) -> Optional[VideoBlob]:
+    return db.query(VideoBlob).filter(VideoBlob.content_hash == content_hash).first()
+
+
+def release_blob(db: Session, content_hash: Optional[str]) -> Optional[str]:
+    """
+    Libera una referencia al blob
+
+    No hace commit ni borra el archivo: devuelve la ruta a eliminar (si el
+    contador llegó a cero) para que el llamador la borre tras el commit.
+
+    Returns:
+        Ruta del archivo a eliminar o None si sigue referenciado
+    """
+    if not content_hash:
+        return None
+    blob = db.query(VideoBlob).filter(VideoBlob.content_hash == content_hash).first()
+    if blob is None:
+        return None
+    if blob.ref_count > 1:
+        db.query(VideoBlob).filter(VideoBlob.id == blob.id).update(
+            {VideoBlob.ref_count: VideoBlob.ref_count - 1},
+            synchronize_session=False
+        )
+        return None
+    file_path = blob.file_path
+    db.delete(blob)
+    return file_path
+
+
+def remove_file(path: Optional[str]):
+    """Elimina un archivo físico si existe, registrando fallos sin propagarlos"""
+    if not path or not os.path.exists(path):
+        return
+    try:
+        os.remove(path)
+        logger.info(f"Archivo físico eliminado: {path}")
+    except OSError as e:
+        logger.warning(f"No se pudo eliminar el archivo físico: {e}")
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -213,9 +213,13 @@ function renderAvailableVideos() {
         <div class="col-md-6 col-lg-4 mb-3">
             <div class="card h-100 video-card">
                 <div class="position-relative">
+                    ${video.thumbnail ? `
+                    <img src="${video.thumbnail}" class="card-img-top" alt="" loading="lazy" style="height: 120px; object-fit: cover;">
+                    ` : `
                     <div class="video-thumbnail-placeholder bg-light d-flex align-items-center justify-content-center" style="height: 120px;">
                         <i class="fas fa-play-circle fa-3x text-primary"></i>
                     </div>
+                    `}
                     <div class="position-absolute top-0 end-0 m-2">
                         <button class="btn btn-sm btn-success" 
                                 onclick="addVideoToPlaylist(${video.id})"
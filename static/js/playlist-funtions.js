@@ -108,10 +108,15 @@
                     <div class="card-body p-2">
                         <div class="d-flex align-items-center">
                             <div class="video-thumbnail me-3">
+                                ${video.thumbnail ? `
+                                <img src="${video.thumbnail}" alt="" loading="lazy"
+                                     style="width: 50px; height: 40px; object-fit: cover; border-radius: 0.25rem;">
+                                ` : `
                                 <div class="bg-light d-flex align-items-center justify-content-center text-primary" 
                                      style="width: 50px; height: 40px; border-radius: 0.25rem;">
                                     <i class="fas fa-play-circle"></i>
                                 </div>
+                                `}
                             </div>
                             <div class="flex-grow-1">
                                 <h6 class="mb-1 small">${window.escapeHtml(video.title || 'Sin título')}</h6>
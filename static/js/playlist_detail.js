@@ -1237,6 +1237,11 @@
             
             console.log('📹 Intentando cargar video desde:', videoUrl);
             
+            // Mostrar el poster mientras el video carga
+            if (videoData.id) {
+                videoPlayer.poster = `${CONFIG.API_BASE}/videos/${videoData.id}/thumbnail?size=poster`;
+            }
+            
             // Configurar el source del video
             const videoSource = videoPlayer.querySelector('source');
             if (videoSource) {
@@ -0,0 +1,66 @@
+# ==========================================
+# ARCHIVO: tests/conftest.py
+# Base de datos SQLite en memoria compartida por los tests
+# ==========================================
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models.database import Base
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """Motor SQLite en memoria con todas las tablas (una sola conexión compartida)"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def session_factory(db_engine):
+    """Fábrica de sesiones sobre la base de datos de los tests"""
+    return sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+
+
+@pytest.fixture
+def clean_db(db_engine):
+    """Vacía todas las tablas al terminar el test"""
+    yield
+    with db_engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+
+@pytest.fixture
+def override_get_db(session_factory):
+    """Sustituto de get_db/get_player_db para app.dependency_overrides"""
+    def get_test_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    return get_test_db
+
+
+@pytest.fixture
+def executed(db_engine):
+    """Sentencias SQL ejecutadas durante el test"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
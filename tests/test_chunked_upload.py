@@ -0,0 +1,122 @@
+# ==========================================
+# ARCHIVO: tests/test_chunked_upload.py
+# Tests para las subidas de video por partes
+# ==========================================
+
+import os
+import asyncio
+import hashlib
+import pytest
+from datetime import datetime, timedelta
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from models.database import get_db
+from models.models import VideoUpload
+from router import videos
+from services import chunked_upload, video_storage
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, override_get_db, clean_db):
+    monkeypatch.setattr(video_storage, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(video_storage, "TEMP_DIR", str(tmp_path / "tmp"))
+    app = FastAPI()
+    app.include_router(videos.router)
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def test_resumable_upload_round_trip(client):
+    data = os.urandom(300_000)
+    created = client.post("/api/videos/uploads", json={
+        "title": "Promo", "filename": "promo.mp4", "upload_length": len(data)
+    })
+    assert created.status_code == 201
+    location = created.headers["Location"]
+
+    first = client.patch(location, content=data[:100_000], headers={"Upload-Offset": "0"})
+    assert first.status_code == 204
+    assert first.headers["Upload-Offset"] == "100000"
+
+    # Un offset desfasado (p. ej. reintento de una parte ya recibida) se rechaza
+    stale = client.patch(location, content=data[:100_000], headers={"Upload-Offset": "0"})
+    assert stale.status_code == 409
+    assert stale.headers["Upload-Offset"] == "100000"
+
+    # Tras un reinicio se pierde el hash incremental; el reanudado lo recalcula al finalizar
+    chunked_upload._hash_states.clear()
+    assert client.head(location).headers["Upload-Offset"] == "100000"
+    rest = client.patch(location, content=data[100_000:], headers={"Upload-Offset": "100000"})
+    assert rest.headers["Upload-Offset"] == str(len(data))
+
+    video = client.post(f"{location}/finalize")
+    assert video.status_code == 200
+    body = video.json()
+    assert body["file_size"] == len(data)
+    assert body["content_hash"] == hashlib.sha256(data).hexdigest()
+    with open(body["file_path"], "rb") as stored:
+        assert stored.read() == data
+    assert client.head(location).status_code == 404
+
+
+def test_finalize_rejects_incomplete_upload(client):
+    created = client.post("/api/videos/uploads", json={"title": "Promo", "upload_length": 10})
+    location = created.headers["Location"]
+    client.patch(location, content=b"12345", headers={"Upload-Offset": "0"})
+
+    response = client.post(f"{location}/finalize")
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "5"
+
+    too_long = client.patch(location, content=b"1234567890", headers={"Upload-Offset": "5"})
+    assert too_long.status_code == 413
+    assert too_long.headers["Upload-Offset"] == "10"
+
+
+def test_abandoned_upload_expires_with_its_file(client, session_factory):
+    location = client.post("/api/videos/uploads", json={"title": "Promo", "upload_length": 10}).headers["Location"]
+    client.patch(location, content=b"12345", headers={"Upload-Offset": "0"})
+    upload_id = location.rsplit("/", 1)[1]
+    db = session_factory()
+    temp_path = db.query(VideoUpload).filter(VideoUpload.id == upload_id).one().temp_path
+    assert os.path.exists(temp_path) and upload_id in chunked_upload._hash_states
+
+    # Antes de caducar no se toca; después se borran fila, archivo y estado en memoria
+    assert chunked_upload.expire_uploads(db) == 0
+    later = datetime.now() + timedelta(hours=chunked_upload.UPLOAD_EXPIRY_HOURS + 1)
+    assert chunked_upload.expire_uploads(db, now=later) == 1
+    db.close()
+
+    assert not os.path.exists(temp_path)
+    assert upload_id not in chunked_upload._hash_states and upload_id not in chunked_upload._locks
+    assert client.head(location).status_code == 404
+
+
+def test_database_work_stays_off_the_event_loop(client, db_engine):
+    on_loop = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        on_loop.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        data = os.urandom(1000)
+        location = client.post("/api/videos/uploads", json={
+            "title": "Promo", "upload_length": len(data)
+        }).headers["Location"]
+        assert client.patch(location, content=data, headers={"Upload-Offset": "0"}).status_code == 204
+        assert client.post(f"{location}/finalize").status_code == 200
+
+        direct = client.post("/api/videos/", data={"title": "Directo"},
+                             files={"file": ("directo.mp4", os.urandom(500), "video/mp4")})
+        assert direct.status_code == 200
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+
+    assert on_loop == []
@@ -0,0 +1,101 @@
+# ==========================================
+# ARCHIVO: tests/test_client_auth.py
+# Tests para la caché de tokens verificados de la API de clientes
+# ==========================================
+
+import asyncio
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from models.models import Device
+from router.client_api import get_current_client
+from services.client_auth import ClientTokenCache, DevicePrincipal, client_token_cache
+
+
+@pytest.fixture
+def db_session(session_factory, clean_db):
+    client_token_cache.invalidate_all()
+    db = session_factory()
+    db.add(Device(device_id="rpi-1", name="Caja", tienda="T01", model="Raspberry Pi 4",
+                  mac_address="00:00:00:00:00:01", is_active=True))
+    db.commit()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _authenticate(db, token):
+    request = Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+    return asyncio.run(get_current_client(request, db))
+
+
+def _cache_token(db, token="token-rpi-1"):
+    """Simula un token ya verificado (lo que hace get_current_client tras decodificarlo)"""
+    device = db.query(Device).filter(Device.device_id == "rpi-1").one()
+    client_token_cache.put(token, DevicePrincipal.from_device(device),
+                           token_expires_at=None, generation=client_token_cache.generation)
+    return token
+
+
+def test_verified_token_skips_database(db_session, executed):
+    token = _cache_token(db_session)
+
+    executed.clear()
+    principal = _authenticate(db_session, token)
+    assert (principal.device_id, principal.tienda, principal.is_active) == ("rpi-1", "T01", True)
+    assert executed == []
+    assert client_token_cache.stats()["hits"] == 1
+
+
+def test_deactivation_invalidates_token(db_session):
+    token = _cache_token(db_session)
+
+    device = db_session.query(Device).filter(Device.device_id == "rpi-1").one()
+    device.is_active = False
+    db_session.commit()
+    assert client_token_cache.get(token) is None
+
+
+def test_inactive_principal_is_rejected(db_session):
+    token = "token-inactivo"
+    client_token_cache.put(token, DevicePrincipal("rpi-1", False, "T01", None),
+                           token_expires_at=None, generation=client_token_cache.generation)
+    with pytest.raises(HTTPException) as exc_info:
+        _authenticate(db_session, token)
+    assert exc_info.value.status_code == 403
+
+
+def test_deletion_invalidates_token(db_session):
+    token = _cache_token(db_session)
+
+    db_session.delete(db_session.query(Device).filter(Device.device_id == "rpi-1").one())
+    db_session.commit()
+    assert client_token_cache.get(token) is None
+
+
+def test_last_seen_update_keeps_token(db_session):
+    token = _cache_token(db_session)
+    device = db_session.query(Device).filter(Device.device_id == "rpi-1").one()
+    device.cpu_temp = 55.0
+    db_session.commit()
+    assert client_token_cache.get(token) is not None
+
+
+def test_entries_bounded_by_expiry_and_size():
+    cache = ClientTokenCache(max_entries=2, ttl=300)
+    principal = DevicePrincipal("rpi-1", True, None, None)
+    cache.put("a", principal, token_expires_at=0, generation=cache.generation)
+    assert cache.get("a") is None
+
+    for token in ("b", "c", "d"):
+        cache.put(token, principal, token_expires_at=None, generation=cache.generation)
+    assert cache.get("b") is None and cache.get("d") is principal
+    assert cache.stats()["entries"] == 2
+
+    # Una invalidación durante la verificación descarta el resultado
+    generation = cache.generation
+    cache.invalidate_devices(["rpi-1"])
+    cache.put("e", principal, token_expires_at=None, generation=generation)
+    assert cache.get("e") is None
@@ -0,0 +1,67 @@
+# ==========================================
+# ARCHIVO: tests/test_db_pool.py
+# Tests para la configuración e instrumentación de los pools de conexiones
+# ==========================================
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import QueuePool
+
+from utils.db_pool import engine_options, pool_monitors, pool_settings, statement_timeout_args
+
+
+def test_class_settings_fall_back_to_general(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "7")
+    monkeypatch.setenv("DB_PLAYER_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    monkeypatch.setenv("DB_ADMIN_POOL_PRE_PING", "false")
+
+    player, admin = pool_settings("player"), pool_settings("admin")
+    assert (player["pool_size"], admin["pool_size"]) == (20, 7)
+    assert player["statement_timeout_ms"] == admin["statement_timeout_ms"] == 5000
+    assert player["pool_pre_ping"] is True and admin["pool_pre_ping"] is False
+
+
+def test_statement_timeout_connect_args():
+    assert statement_timeout_args(0, "psycopg2") == {}
+    assert statement_timeout_args(1500, "psycopg2") == {"options": "-c statement_timeout=1500"}
+    assert statement_timeout_args(1500, "asyncpg") == {"server_settings": {"statement_timeout": "1500"}}
+
+
+@pytest.fixture
+def small_pool(tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_TEST_POOL_SIZE", "1")
+    monkeypatch.setenv("DB_TEST_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_TEST_POOL_TIMEOUT", "0.05")
+    pool_monitors.pop("test", None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", **engine_options("test", "test", QueuePool, "sqlite"))
+    try:
+        yield engine, pool_monitors["test"]
+    finally:
+        engine.dispose()
+        pool_monitors.pop("test", None)
+
+
+def test_monitor_reports_checkouts_and_timeouts(small_pool):
+    engine, monitor = small_pool
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert monitor.stats()["checked_out"] == 1
+
+        # Pool agotado: el segundo checkout espera pool_timeout y falla
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    stats = monitor.stats()
+    assert (stats["checkouts"], stats["timeouts"], stats["checked_out"]) == (1, 1, 0)
+    assert stats["size"] == 1 and stats["max_overflow"] == 0
+
+
+def test_monitor_survives_dispose(small_pool):
+    engine, monitor = small_pool
+    engine.dispose()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert monitor.pool is engine.pool
+    assert monitor.stats()["checkouts"] == 1
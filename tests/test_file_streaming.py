@@ -0,0 +1,69 @@
+# ==========================================
+# ARCHIVO: tests/test_file_streaming.py
+# Tests para el envío de archivos con rangos de bytes
+# ==========================================
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from utils.file_streaming import (
+    RangeFileResponse, RangeNotSatisfiable, parse_byte_range, range_not_satisfiable_response
+)
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=0-1,5-6", None),   # varios rangos: se sirve completo
+    ("bytes=abc-", None),      # mal formado: se ignora
+    ("items=0-1", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+def test_parse_byte_range_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range(header, 1000)
+
+
+@pytest.fixture
+def client(tmp_path):
+    data = bytes(range(256)) * 8
+    video = tmp_path / "video.mp4"
+    video.write_bytes(data)
+
+    app = FastAPI()
+
+    @app.get("/stream")
+    def stream(request: Request):
+        try:
+            byte_range = parse_byte_range(request.headers.get("Range"), len(data))
+        except RangeNotSatisfiable:
+            return range_not_satisfiable_response(len(data))
+        return RangeFileResponse(str(video), len(data), "video/mp4", byte_range, chunk_size=100)
+
+    return TestClient(app), data
+
+
+def test_full_and_partial_responses(client):
+    client, data = client
+
+    response = client.get("/stream")
+    assert response.status_code == 200
+    assert response.content == data
+
+    response = client.get("/stream", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {len(data) - 10}-{len(data) - 1}/{len(data)}"
+    assert response.content == data[-10:]
+
+    response = client.get("/stream", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(data)}"
@@ -0,0 +1,65 @@
+# ==========================================
+# ARCHIVO: tests/test_heartbeat_buffer.py
+# Tests para el buffer de latidos de dispositivos
+# ==========================================
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy.dialects import sqlite
+
+from models.models import Device
+from services.heartbeat_buffer import HeartbeatBuffer
+
+
+def test_flush_writes_latest_timestamp_per_device(session_factory, clean_db):
+    db = session_factory()
+    db.add_all([
+        Device(device_id="hb-1", mac_address="aa:00"),
+        Device(device_id="hb-2", mac_address="aa:01"),
+    ])
+    db.commit()
+
+    buffer = HeartbeatBuffer(session_factory=session_factory, batch_size=1)
+    base = datetime(2030, 1, 1, 12, 0, 0)
+    buffer.record("hb-1", base + timedelta(seconds=5))
+    buffer.record("hb-1", base)  # más antiguo: no debe pisar el anterior
+    buffer.record("hb-2", base)
+
+    assert buffer.pending_count() == 2
+    assert buffer.flush() == 2
+    assert buffer.pending_count() == 0
+
+    db.expire_all()
+    seen = {d.device_id: d.last_seen for d in db.query(Device).all()}
+    assert seen["hb-1"] == base + timedelta(seconds=5)
+    assert seen["hb-2"] == base
+    assert buffer.stats()["flushed_rows"] == 2
+    db.close()
+
+
+class BrokenSession:
+    """Sesión que falla al ejecutar, para simular la BD caída"""
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=sqlite.dialect())
+
+    def execute(self, *args, **kwargs):
+        raise RuntimeError("db down")
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_failed_flush_keeps_pending_heartbeats():
+    buffer = HeartbeatBuffer(session_factory=BrokenSession)
+    buffer.record("hb-3")
+
+    assert buffer.flush() == 0
+    assert buffer.pending_count() == 1
+    assert buffer.stats()["flush_errors"] == 1
@@ -0,0 +1,198 @@
+# ==========================================
+# ARCHIVO: tests/test_manifest_cache.py
+# Tests para la caché de manifiestos de reproductores
+# ==========================================
+
+import pytest
+from datetime import datetime, timedelta
+
+from models.models import Device, Playlist, Video, PlaylistVideo, DevicePlaylist
+from services.manifest_cache import ManifestCache, ManifestEntry, get_manifest, manifest_cache, RASPBERRY
+
+
+@pytest.fixture
+def db_session(session_factory, clean_db):
+    """Sesión con un dispositivo que tiene una playlist con un video"""
+    manifest_cache.invalidate_all()
+    db = session_factory()
+    device = Device(device_id="rpi-test", name="Test", mac_address="00:00:00:00:00:01")
+    playlist = Playlist(title="Promos")
+    video = Video(title="Promo 1", file_path="uploads/promo1.mp4")
+    db.add_all([device, playlist, video])
+    db.commit()
+    db.add_all([
+        PlaylistVideo(playlist_id=playlist.id, video_id=video.id, position=1),
+        DevicePlaylist(device_id=device.device_id, playlist_id=playlist.id),
+    ])
+    db.commit()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_cache_hit_runs_no_sql(db_session, executed):
+    first = get_manifest(db_session, "rpi-test", RASPBERRY)
+    assert first.payload[0]["videos"][0]["file_path"].endswith("/download")
+
+    executed.clear()
+    second = get_manifest(db_session, "rpi-test", RASPBERRY)
+    assert second is first
+    assert executed == []
+
+
+def test_video_update_invalidates_entry(db_session):
+    get_manifest(db_session, "rpi-test", RASPBERRY)
+
+    video = db_session.query(Video).first()
+    video.title = "Promo renombrada"
+    db_session.commit()
+
+    entry = get_manifest(db_session, "rpi-test", RASPBERRY)
+    assert entry.payload[0]["videos"][0]["title"] == "Promo renombrada"
+
+
+def test_last_seen_update_keeps_entry(db_session):
+    first = get_manifest(db_session, "rpi-test", RASPBERRY)
+
+    device = db_session.query(Device).first()
+    device.last_seen = datetime.now()
+    db_session.commit()
+
+    assert get_manifest(db_session, "rpi-test", RASPBERRY) is first
+
+
+def test_unassign_invalidates_entry(db_session):
+    get_manifest(db_session, "rpi-test", RASPBERRY)
+
+    db_session.query(DevicePlaylist).delete()
+    db_session.commit()
+
+    assert get_manifest(db_session, "rpi-test", RASPBERRY).payload == []
+
+
+def test_entry_expires_at_video_boundary(db_session):
+    video = db_session.query(Video).first()
+    video.expiration_date = datetime.now() + timedelta(minutes=1)
+    db_session.commit()
+
+    entry = get_manifest(db_session, "rpi-test", RASPBERRY)
+    assert entry.valid_until == video.expiration_date
+    assert not entry.is_fresh(video.expiration_date)
+
+
+def test_entry_expires_at_next_start_date(db_session):
+    # Playlist asignada pero inactiva hasta su start_date
+    pending = Playlist(title="Navidad", is_active=False,
+                       start_date=datetime.now() + timedelta(minutes=1))
+    db_session.add(pending)
+    db_session.flush()
+    db_session.add(DevicePlaylist(device_id="rpi-test", playlist_id=pending.id))
+    db_session.commit()
+
+    entry = get_manifest(db_session, "rpi-test", RASPBERRY)
+    assert entry.valid_until == pending.start_date
+    assert not entry.is_fresh(pending.start_date)
+
+
+def test_unknown_device_returns_none(db_session):
+    assert get_manifest(db_session, "no-existe", RASPBERRY) is None
+
+
+def test_put_discards_stale_generation():
+    cache = ManifestCache(ttl=60)
+    generation = cache.generation
+    cache.invalidate_all()
+    entry = ManifestEntry("x", RASPBERRY, [], [], [], datetime.max, datetime.now())
+    assert cache.put(entry, generation) is False
+    assert cache.peek("x", RASPBERRY) is None
+
+
+def test_etag_matches_lists_and_weak_validators():
+    from utils.etag import etag_matches
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_raspberry_endpoint_returns_304_for_current_version(db_session, executed):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from models.database import get_player_db
+    from router import raspberry
+
+    app = FastAPI()
+    app.include_router(raspberry.router)
+    app.dependency_overrides[get_player_db] = lambda: db_session
+    client = TestClient(app)
+
+    response = client.get("/api/raspberry/playlists/active/rpi-test")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.json()[0]["title"] == "Promos"
+
+    executed.clear()
+    response = client.get("/api/raspberry/playlists/active/rpi-test",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert not any("playlists" in statement for statement in executed)
+
+
+def test_long_poll_wakes_on_change(db_session, session_factory):
+    import asyncio
+    from services.manifest_watch import wait_for_manifest_change
+
+    current = get_manifest(db_session, "rpi-test", RASPBERRY)
+
+    async def scenario():
+        waiter = asyncio.create_task(wait_for_manifest_change(
+            "rpi-test", RASPBERRY, current.version, timeout=5,
+            session_factory=session_factory
+        ))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+
+        video = db_session.query(Video).first()
+        video.title = "Promo nueva"
+        db_session.commit()
+
+        return await asyncio.wait_for(waiter, timeout=2)
+
+    changed = asyncio.run(scenario())
+    assert changed.version != current.version
+    assert changed.payload[0]["videos"][0]["title"] == "Promo nueva"
+
+
+def test_long_poll_times_out_with_same_version(db_session, session_factory):
+    import asyncio
+    from services.manifest_watch import wait_for_manifest_change
+
+    current = get_manifest(db_session, "rpi-test", RASPBERRY)
+    entry = asyncio.run(wait_for_manifest_change(
+        "rpi-test", RASPBERRY, current.version, timeout=0.1,
+        session_factory=session_factory
+    ))
+    assert entry is current
+
+
+def test_delta_reports_added_and_removed_videos(db_session):
+    from services.manifest_delta import diff_manifest
+
+    before = get_manifest(db_session, "rpi-test", RASPBERRY)
+
+    playlist = db_session.query(Playlist).first()
+    extra = Video(title="Promo 2", file_path="uploads/promo2.mp4")
+    db_session.add(extra)
+    db_session.commit()
+    db_session.add(PlaylistVideo(playlist_id=playlist.id, video_id=extra.id, position=2))
+    db_session.commit()
+
+    after = get_manifest(db_session, "rpi-test", RASPBERRY)
+    previous = manifest_cache.summary_for("rpi-test", RASPBERRY, before.version)
+    delta = diff_manifest(previous, after.payload)
+
+    assert delta["added"] == [] and delta["removed"] == []
+    assert [v["id"] for v in delta["updated"][0]["videos_added"]] == [extra.id]
+    assert manifest_cache.summary_for("rpi-test", RASPBERRY, "desconocida") is None
@@ -0,0 +1,61 @@
+# ==========================================
+# ARCHIVO: tests/test_media_probe.py
+# Tests para el análisis de metadatos de video
+# ==========================================
+
+from models.models import Video
+from services.media_probe import MediaProbePool, parse_ffprobe_output
+
+FFPROBE_OUTPUT = {
+    "streams": [
+        {"codec_type": "video", "codec_name": "mjpeg", "width": 300, "height": 300,
+         "disposition": {"attached_pic": 1}},
+        {"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080},
+        {"codec_type": "audio", "codec_name": "aac"},
+    ],
+    "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "31.48", "bit_rate": "4500000"},
+}
+
+
+def test_parse_ffprobe_output_skips_cover_art():
+    info = parse_ffprobe_output(FFPROBE_OUTPUT, "uploads/promo.mp4")
+
+    assert info == {
+        "duration": 31,
+        "width": 1920,
+        "height": 1080,
+        "video_codec": "h264",
+        "audio_codec": "aac",
+        "bitrate": 4500000,
+        "container": "mp4",
+    }
+
+
+def test_backfill_probes_shared_content_once(tmp_path, session_factory, clean_db):
+    media = tmp_path / "promo.mp4"
+    media.write_bytes(b"video")
+    db = session_factory()
+    db.add_all([
+        Video(title="A", file_path=str(media), content_hash="ab" * 32),
+        Video(title="B", file_path=str(media), content_hash="ab" * 32),
+    ])
+    db.commit()
+
+    probed = []
+
+    def fake_probe(path):
+        probed.append(path)
+        return parse_ffprobe_output(FFPROBE_OUTPUT, path)
+
+    pool = MediaProbePool(max_workers=2, session_factory=session_factory, probe=fake_probe)
+    try:
+        assert pool.backfill() == 1
+    finally:
+        pool.shutdown(wait=True)
+
+    assert probed == [str(media)]
+    videos = db.query(Video).all()
+    assert [video.duration for video in videos] == [31, 31]
+    assert all(video.resolution == "1920x1080" and video.probed_at for video in videos)
+
+    db.close()
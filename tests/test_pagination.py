@@ -0,0 +1,167 @@
+# ==========================================
+# ARCHIVO: tests/test_pagination.py
+# Tests para la paginación por cursor y los recuentos cacheados
+# ==========================================
+
+import pytest
+from datetime import datetime, timedelta
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from models.database import get_db
+from models.models import Playlist
+from services.pagination import CountCache, count_cache, decode_cursor, encode_cursor, keyset_paginate, total_count
+
+
+@pytest.fixture
+def db_session(session_factory, clean_db):
+    """Siete playlists, dos sin expiración y dos con la misma fecha"""
+    count_cache.invalidate()
+    db = session_factory()
+    base = datetime(2026, 1, 1)
+    expirations = [base, base + timedelta(days=2), None, base + timedelta(days=2), base + timedelta(days=1),
+                   None, base + timedelta(days=3)]
+    db.add_all([
+        Playlist(title=f"Playlist {i}", expiration_date=expiration, is_active=i % 2 == 0)
+        for i, expiration in enumerate(expirations)
+    ])
+    db.commit()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _walk(db, sort_column, descending=False, limit=2):
+    """Ids de todas las páginas siguiendo los cursores"""
+    ids, cursor = [], None
+    while True:
+        page = keyset_paginate(db.query(Playlist), sort_column, Playlist.id, limit,
+                               cursor=cursor, descending=descending)
+        ids.extend(playlist.id for playlist in page.items)
+        if not page.has_next:
+            return ids
+        cursor = page.next_cursor
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_cursor_walk_matches_full_ordering_with_nulls_last(db_session, descending):
+    playlists = db_session.query(Playlist).all()
+    dated = sorted((p for p in playlists if p.expiration_date),
+                   key=lambda p: (p.expiration_date, p.id), reverse=descending)
+    undated = sorted((p for p in playlists if not p.expiration_date), key=lambda p: p.id, reverse=descending)
+    expected = [p.id for p in dated + undated]
+
+    assert _walk(db_session, Playlist.expiration_date, descending) == expected
+    assert _walk(db_session, Playlist.id, descending) == sorted(expected, reverse=descending)
+
+
+def test_page_query_has_no_offset(db_session, db_engine):
+    first = keyset_paginate(db_session.query(Playlist), Playlist.title, Playlist.id, 3)
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        keyset_paginate(db_session.query(Playlist), Playlist.title, Playlist.id, 3, cursor=first.next_cursor)
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+    statement, parameters = executed[-1]
+    # SQLite siempre emite "LIMIT ? OFFSET ?": la página 2 salta 0 filas
+    assert "WHERE" in statement and parameters[-1] == 0
+
+
+def test_invalid_or_foreign_cursor_is_rejected(db_session):
+    with pytest.raises(HTTPException) as error:
+        keyset_paginate(db_session.query(Playlist), Playlist.id, Playlist.id, 2, cursor="no-es-un-cursor")
+    assert error.value.status_code == 400
+
+    title_cursor = keyset_paginate(db_session.query(Playlist), Playlist.title, Playlist.id, 2).next_cursor
+    with pytest.raises(HTTPException):
+        keyset_paginate(db_session.query(Playlist), Playlist.id, Playlist.id, 2, cursor=title_cursor)
+
+    when = datetime(2026, 5, 1, 12, 30)
+    assert decode_cursor(encode_cursor(["expiration_date", False, when, 7]), 4)[2] == when
+
+
+def test_total_count_is_cached_until_a_write_commits(db_session, executed):
+    query = db_session.query(Playlist)
+    assert total_count(db_session, query, "playlists") == (7, False)
+
+    executed.clear()
+    assert total_count(db_session, query, "playlists") == (7, False)
+    assert executed == []
+
+    db_session.add(Playlist(title="Nueva"))
+    db_session.flush()
+    db_session.rollback()
+    assert total_count(db_session, query, "playlists") == (7, False)
+
+    db_session.add(Playlist(title="Nueva"))
+    db_session.commit()
+    assert total_count(db_session, query, "playlists") == (8, False)
+
+
+def test_count_cache_expires():
+    cache = CountCache(ttl=0)
+    assert cache.get_or_count(("videos",), lambda: 1) == 1
+    assert cache.get_or_count(("videos",), lambda: 2) == 2
+    assert cache.stats()["misses"] == 2
+
+
+@pytest.fixture
+def client(db_session, override_get_db):
+    from router import playlists, videos
+
+    app = FastAPI()
+    app.include_router(playlists.router)
+    app.include_router(videos.router)
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def test_list_endpoint_keeps_array_body_and_links_next_page(client):
+    response = client.get("/api/playlists/", params={"limit": 4, "include_total": True})
+    assert response.status_code == 200
+    assert [p["title"] for p in response.json()] == [f"Playlist {i}" for i in range(4)]
+    assert response.headers["X-Total-Count"] == "7"
+    assert 'rel="next"' in response.headers["Link"]
+
+    response = client.get("/api/playlists/", params={"limit": 4, "cursor": response.headers["X-Next-Cursor"]})
+    assert [p["title"] for p in response.json()] == [f"Playlist {i}" for i in range(4, 7)]
+    assert "X-Next-Cursor" not in response.headers
+
+    # skip de los clientes antiguos
+    response = client.get("/api/playlists/", params={"skip": 5})
+    assert [p["title"] for p in response.json()] == ["Playlist 5", "Playlist 6"]
+
+    assert client.get("/api/videos/", params={"sort": "file_size"}).status_code == 400
+
+
+def test_list_endpoint_filters_by_search(client):
+    response = client.get("/api/playlists/", params={"search": "playlist 1", "include_total": True})
+    assert [p["title"] for p in response.json()] == ["Playlist 1"]
+    assert response.headers["X-Total-Count"] == "1"
+    assert client.get("/api/playlists/", params={"include_total": True}).headers["X-Total-Count"] == "7"
+
+
+def test_paginated_endpoint_cursor_and_legacy_pages(client):
+    body = client.get("/api/playlists/paginated", params={"page_size": 5, "sort_by": "title", "cursor": "",
+                                                          "sort_order": "asc", "include_total": True}).json()
+    assert body["has_next"] and body["total_items"] == 7 and not body["total_is_estimate"]
+    following = client.get("/api/playlists/paginated", params={"page_size": 5, "sort_by": "title",
+                                                               "sort_order": "asc", "cursor": body["next_cursor"]}).json()
+    assert [p["title"] for p in body["items"] + following["items"]] == [f"Playlist {i}" for i in range(7)]
+    assert "total_items" not in following
+
+    # Número de página (ordenado por creation_date, antes created_at inexistente)
+    legacy = client.get("/api/playlists/paginated", params={"page": 2, "page_size": 5}).json()
+    assert legacy["total_pages"] == 2 and len(legacy["items"]) == 2 and legacy["has_prev"]
+
+    # Sin page ni cursor se mantiene la respuesta de siempre: primera página con totales
+    default = client.get("/api/playlists/paginated", params={"page_size": 5}).json()
+    assert default["page"] == 1 and default["total_items"] == 7 and not default["has_prev"]
+    assert "next_cursor" not in default
@@ -0,0 +1,113 @@
+# ==========================================
+# ARCHIVO: tests/test_ping_checker.py
+# Tests para el barrido de ping en paralelo de la flota
+# ==========================================
+
+import time
+import asyncio
+import pytest
+
+from models.models import Device
+from services.heartbeat_buffer import HeartbeatBuffer
+from utils import ping_checker
+from utils.ping_checker import PingTarget, check_device_status, sweep_devices
+
+
+class FakePing:
+    """Ping simulado: responden las IPs de `alive`; registra la concurrencia máxima"""
+
+    def __init__(self, alive, delay=0.05):
+        self.alive = set(alive)
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.pinged = []
+
+    async def __call__(self, ip_address):
+        self.pinged.append(ip_address)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            return ip_address in self.alive
+        finally:
+            self.running -= 1
+
+
+async def _collect(targets, concurrency, ping):
+    return [(target.device_id, result) async for target, result in sweep_devices(targets, concurrency, ping)]
+
+
+def test_sweep_is_parallel_and_bounded():
+    targets = [PingTarget(f"rpi-{i}", None, f"10.0.0.{i}", f"10.1.0.{i}", True) for i in range(100)]
+    ping = FakePing(alive={"10.0.0.1", "10.1.0.2"})
+
+    started = time.monotonic()
+    results = dict(asyncio.run(_collect(targets, 50, ping)))
+    elapsed = time.monotonic() - started
+
+    # 200 pings de 50 ms: en serie 10 s; con 50 a la vez, 4 tandas
+    assert elapsed < 1.5
+    assert ping.max_running == 50
+    assert len(results) == 100
+    assert results["rpi-1"] == {"is_active": True, "lan_active": True, "wifi_active": False}
+    assert results["rpi-2"] == {"is_active": True, "lan_active": False, "wifi_active": True}
+    assert results["rpi-3"]["is_active"] is False
+
+
+def test_results_arrive_as_they_complete():
+    class SlowLan(FakePing):
+        async def __call__(self, ip_address):
+            self.delay = 0.3 if ip_address == "10.0.0.1" else 0.01
+            return await super().__call__(ip_address)
+
+    targets = [PingTarget("lenta", None, "10.0.0.1", None, True),
+               PingTarget("rapida", None, "10.0.0.2", None, True)]
+    order = [device_id for device_id, _ in asyncio.run(_collect(targets, 10, SlowLan(alive=[])))]
+    assert order == ["rapida", "lenta"]
+
+
+@pytest.fixture
+def fleet(monkeypatch, session_factory, clean_db):
+    monkeypatch.setattr(ping_checker, "SessionLocal", session_factory)
+    buffer = HeartbeatBuffer(session_factory=session_factory)
+    monkeypatch.setattr(ping_checker, "heartbeat_buffer", buffer)
+    db = session_factory()
+    db.add_all([
+        Device(device_id="rpi-lan", name="Solo LAN", mac_address="00:00:00:00:00:01",
+               ip_address_lan="10.0.0.1", ip_address_wifi="10.1.0.1", is_active=False),
+        Device(device_id="rpi-off", name="Apagado", mac_address="00:00:00:00:00:02",
+               ip_address_lan="10.0.0.2", ip_address_wifi=None, is_active=True),
+    ])
+    db.commit()
+    db.close()
+    return buffer
+
+
+def test_single_device_pings_each_interface_by_its_own_address(fleet, monkeypatch):
+    ping = FakePing(alive={"10.0.0.1"})
+    monkeypatch.setattr(ping_checker, "ping_host", ping)
+
+    results = asyncio.run(check_device_status("rpi-lan"))
+
+    assert sorted(ping.pinged) == ["10.0.0.1", "10.1.0.1"]
+    assert results == {"rpi-lan": {"is_active": True, "lan_active": True, "wifi_active": False}}
+
+
+def test_sweep_saves_status_changes(fleet, monkeypatch, session_factory):
+    monkeypatch.setattr(ping_checker, "ping_host", FakePing(alive={"10.0.0.1"}))
+
+    results = asyncio.run(check_device_status())
+
+    assert set(results) == {"rpi-lan", "rpi-off"}
+    db = session_factory()
+    status = {device.device_id: device.is_active for device in db.query(Device)}
+    assert status == {"rpi-lan": True, "rpi-off": False}
+
+    # last_seen de los que responden va por el buffer de latidos
+    assert fleet.pending_count() == 1
+    before = db.query(Device.last_seen).filter(Device.device_id == "rpi-lan").scalar()
+    fleet.flush()
+    db.expire_all()
+    assert db.query(Device.last_seen).filter(Device.device_id == "rpi-lan").scalar() >= before
+    db.close()
@@ -0,0 +1,167 @@
+# ==========================================
+# ARCHIVO: tests/test_playlist_bundle.py
+# Tests para la descarga de playlists como tar generado al vuelo
+# ==========================================
+
+import io
+import json
+import asyncio
+import tarfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from models.database import get_db
+from models.models import Playlist, Video, PlaylistVideo
+from router import playlists
+from services import rollout
+from utils.file_streaming import ZEROCOPY_EXTENSION
+from utils.tar_stream import TarLayout, TarMember, TarStreamResponse
+
+
+@pytest.fixture
+def bundle_client(tmp_path, session_factory, override_get_db, clean_db):
+    """Playlist activa con dos videos en disco"""
+    contents = {"intro.mp4": b"i" * 1500, "promo.MOV": b"p" * 700}
+    db = session_factory()
+    playlist = Playlist(title="Promos de verano", is_active=True)
+    videos = []
+    for name, data in contents.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        videos.append(Video(title=name, file_path=str(path)))
+    db.add_all([playlist] + videos)
+    db.commit()
+    db.add_all([
+        PlaylistVideo(playlist_id=playlist.id, video_id=video.id, position=position)
+        for position, video in enumerate(videos)
+    ])
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(playlists.router)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app), playlist.id, [video.id for video in videos], list(contents.values())
+    finally:
+        db.close()
+
+
+def _members(data: bytes) -> dict:
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+
+
+def test_bundle_contains_manifest_and_videos(bundle_client):
+    client, playlist_id, video_ids, contents = bundle_client
+    response = client.get(f"/api/playlists/{playlist_id}/bundle")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-tar"
+    assert int(response.headers["content-length"]) == len(response.content)
+
+    members = _members(response.content)
+    manifest = json.loads(members["playlist.json"])
+    assert [video["id"] for video in manifest["videos"]] == video_ids
+    assert manifest["videos"][1]["file"] == f"videos/{video_ids[1]}.mov"
+    assert manifest["videos"][0]["file_path"] == f"/api/videos/{video_ids[0]}/download"
+    for video, data in zip(manifest["videos"], contents):
+        assert members[video["file"]] == data
+
+
+def test_resume_with_range(bundle_client):
+    client, playlist_id, _, _ = bundle_client
+    full = client.get(f"/api/playlists/{playlist_id}/bundle")
+    etag = full.headers["etag"]
+
+    rest = client.get(f"/api/playlists/{playlist_id}/bundle",
+                      headers={"Range": "bytes=1000-", "If-Range": etag})
+    assert rest.status_code == 206
+    assert full.content[:1000] + rest.content == full.content
+
+    # Si el tar cambió, If-Range no coincide y se envía completo
+    stale = client.get(f"/api/playlists/{playlist_id}/bundle",
+                       headers={"Range": "bytes=1000-", "If-Range": '"otro"'})
+    assert stale.status_code == 200
+    assert stale.content == full.content
+
+
+def test_stale_if_range_charges_the_full_tar(bundle_client, monkeypatch):
+    client, playlist_id, _, _ = bundle_client
+    limiter = rollout.DownloadLimiter()
+    monkeypatch.setattr(rollout, "download_limiter", limiter)
+    size = len(client.get(f"/api/playlists/{playlist_id}/bundle").content)
+
+    stale = client.get(f"/api/playlists/{playlist_id}/bundle",
+                       headers={"Range": "bytes=0-99", "If-Range": '"otro"'})
+    assert stale.status_code == 200 and len(stale.content) == size
+    # Se cobra el tar completo, no los 100 bytes del Range descartado
+    assert limiter.stats()["admitted_bytes"] == 2 * size
+
+    etag = stale.headers["etag"]
+    partial = client.get(f"/api/playlists/{playlist_id}/bundle",
+                         headers={"Range": "bytes=0-99", "If-Range": etag})
+    assert partial.status_code == 206
+    assert limiter.stats()["admitted_bytes"] == 2 * size + 100
+
+
+def test_resume_by_member(bundle_client):
+    client, playlist_id, video_ids, contents = bundle_client
+    response = client.get(f"/api/playlists/{playlist_id}/bundle", params={"member": 1})
+    members = _members(response.content)
+    assert sorted(members) == ["playlist.json", f"videos/{video_ids[1]}.mov"]
+    assert json.loads(members["playlist.json"])["first_member"] == 1
+
+    assert client.get(f"/api/playlists/{playlist_id}/bundle", params={"member": 5}).status_code == 416
+
+
+def test_head_reports_size_without_body(bundle_client):
+    client, playlist_id, _, _ = bundle_client
+    full = client.get(f"/api/playlists/{playlist_id}/bundle")
+    head = client.head(f"/api/playlists/{playlist_id}/bundle")
+    assert head.status_code == 200
+    assert head.headers["content-length"] == str(len(full.content))
+    assert head.content == b""
+
+
+def test_layout_slices_match_full_stream(tmp_path):
+    video = tmp_path / "a.mp4"
+    video.write_bytes(bytes(range(256)) * 5)
+    layout = TarLayout([TarMember("m.json", data=b"{}", mtime=0), TarMember("a.mp4", path=str(video))])
+
+    def materialize(start, end):
+        out = b""
+        for data, path, offset, length in layout.slice(start, end):
+            if data is not None:
+                out += data[offset:offset + length]
+            else:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    out += f.read(length)
+        return out
+
+    full = materialize(0, layout.size - 1)
+    assert len(full) == layout.size and layout.size % 512 == 0
+    assert sorted(_members(full)) == ["a.mp4", "m.json"]
+    for start, end in [(0, 0), (511, 513), (600, 1700), (layout.size - 10, layout.size - 1)]:
+        assert materialize(start, end) == full[start:end + 1]
+
+
+def test_file_bodies_use_zerocopy_when_available(tmp_path):
+    video = tmp_path / "a.mp4"
+    video.write_bytes(b"x" * 2000)
+    layout = TarLayout([TarMember("m.json", data=b"{}", mtime=0), TarMember("a.mp4", path=str(video))])
+    messages = []
+
+    async def send(message):
+        if message["type"] == ZEROCOPY_EXTENSION:
+            message["file"].seek(message["offset"])
+            message = {"type": message["type"], "body": message["file"].read(message["count"])}
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "extensions": {ZEROCOPY_EXTENSION: {}}}
+    asyncio.run(TarStreamResponse(layout)(scope, None, send))
+
+    assert any(message["type"] == ZEROCOPY_EXTENSION for message in messages)
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    assert _members(body)["a.mp4"] == b"x" * 2000
@@ -0,0 +1,108 @@
+# ==========================================
+# ARCHIVO: tests/test_playlist_export.py
+# Tests para la exportación JSON de playlists servida desde memoria
+# ==========================================
+
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from models.database import get_db
+from models.models import Playlist, Video, PlaylistVideo
+from router import playlists
+from services.playlist_export import playlist_export_cache
+
+
+@pytest.fixture
+def export_client(session_factory, override_get_db, clean_db):
+    """Playlist activa con un video"""
+    playlist_export_cache.invalidate_all()
+    db = session_factory()
+    playlist = Playlist(title="Promos de verano", is_active=True)
+    video = Video(title="Intro", file_path="uploads/intro.mp4", duration=30)
+    db.add_all([playlist, video])
+    db.commit()
+    db.add(PlaylistVideo(playlist_id=playlist.id, video_id=video.id, position=1))
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(playlists.router)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app), db, playlist.id
+    finally:
+        db.close()
+
+
+def test_export_is_served_from_memory(export_client):
+    client, _, playlist_id = export_client
+    first = client.get(f"/api/playlists/{playlist_id}/download", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert first.headers["content-disposition"] == 'attachment; filename="playlist_Promos_de_verano.json"'
+    assert first.json()["videos"][0]["file_path"] == "uploads/intro.mp4"
+    # Mismo formato que el json.dump(indent=4) anterior
+    assert first.content == json.dumps(first.json(), indent=4).encode("utf-8")
+
+    second = client.get(f"/api/playlists/{playlist_id}/download", headers={"Accept-Encoding": "identity"})
+    assert second.content == first.content
+    stats = playlist_export_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_gzip_and_not_modified(export_client):
+    client, _, playlist_id = export_client
+    plain = client.get(f"/api/playlists/{playlist_id}/download", headers={"Accept-Encoding": "identity"})
+
+    compressed = client.get(f"/api/playlists/{playlist_id}/download",
+                            headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.content == plain.content  # httpx descomprime
+    assert gzip.decompress(playlist_export_cache._entries[("admin", playlist_id)].gzipped) == plain.content
+
+    # Cada representación tiene su propio ETag fuerte
+    assert compressed.headers["etag"] != plain.headers["etag"]
+    cached = client.get(f"/api/playlists/{playlist_id}/download",
+                        headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == compressed.headers["etag"]
+    cached = client.get(f"/api/playlists/{playlist_id}/download",
+                        headers={"Accept-Encoding": "identity", "If-None-Match": plain.headers["etag"]})
+    assert cached.status_code == 304
+    other = client.get(f"/api/playlists/{playlist_id}/download",
+                       headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["etag"]})
+    assert other.status_code == 200
+
+
+def test_gzip_refused_with_zero_quality(export_client):
+    client, _, playlist_id = export_client
+    for accept_encoding in ("gzip;q=0", "br, gzip; q=0.0", "*;q=0", "deflate"):
+        response = client.get(f"/api/playlists/{playlist_id}/download",
+                              headers={"Accept-Encoding": accept_encoding})
+        assert "content-encoding" not in response.headers, accept_encoding
+    response = client.get(f"/api/playlists/{playlist_id}/download", headers={"Accept-Encoding": "br;q=1, *;q=0.5"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_playlist_edits_invalidate_export(export_client):
+    client, db, playlist_id = export_client
+    client.get(f"/api/playlists/{playlist_id}/download")
+
+    playlist = db.query(Playlist).get(playlist_id)
+    playlist.description = "Nueva descripción"
+    db.commit()
+    assert client.get(f"/api/playlists/{playlist_id}/download").json()["description"] == "Nueva descripción"
+
+    video = Video(title="Promo", file_path="uploads/promo.mp4")
+    db.add(video)
+    db.commit()
+    db.add(PlaylistVideo(playlist_id=playlist_id, video_id=video.id, position=2))
+    db.commit()
+    assert len(client.get(f"/api/playlists/{playlist_id}/download").json()["videos"]) == 2
+
+    video.title = "Promo renombrada"
+    db.commit()
+    titles = [v["title"] for v in client.get(f"/api/playlists/{playlist_id}/download").json()["videos"]]
+    assert "Promo renombrada" in titles
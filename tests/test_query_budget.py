@@ -0,0 +1,134 @@
+# ==========================================
+# ARCHIVO: tests/test_query_budget.py
+# Tests de presupuesto de consultas: detectan N+1 en los endpoints con listas
+# ==========================================
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from models.database import Base, get_db, get_player_db
+from models.models import Device, DevicePlaylist, Playlist, PlaylistVideo, Video
+from services.client_auth import DevicePrincipal
+from services.manifest_cache import manifest_cache
+from services.pagination import count_cache
+from services.playlist_export import build_client_export
+from utils.query_budget import (
+    QueryBudgetExceeded, QueryBudgetMiddleware, assert_within_budget, budget_of, record_queries
+)
+
+
+@pytest.fixture
+def client(override_get_db):
+    from router import devices, playlists, raspberry, ui
+
+    app = FastAPI()
+    for module in (devices, playlists, raspberry, ui):
+        app.include_router(module.router)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_player_db] = override_get_db
+    app.add_middleware(QueryBudgetMiddleware)
+    return TestClient(app)
+
+
+def _clear(db_engine):
+    with db_engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+
+@pytest.fixture
+def seed(db_engine, session_factory, clean_db):
+    """Crea (sustituyendo la anterior) una flota de `size` dispositivos, cada uno con `size` playlists de `size` videos"""
+    def create(size):
+        _clear(db_engine)
+        db = session_factory()
+        videos = [Video(title=f"Video {i}", file_path=f"uploads/video_{i}.mp4") for i in range(size)]
+        playlists = [Playlist(title=f"Playlist {i}", is_active=True) for i in range(size)]
+        devices = [Device(device_id=f"rpi-{i:03d}", name=f"Caja {i}", model="Raspberry Pi 4",
+                          mac_address=f"00:00:00:00:00:{i:02x}") for i in range(size)]
+        db.add_all(videos + playlists + devices)
+        db.commit()
+        db.add_all(
+            [PlaylistVideo(playlist_id=p.id, video_id=v.id, position=i) for p in playlists
+             for i, v in enumerate(videos)] +
+            [DevicePlaylist(device_id=d.device_id, playlist_id=p.id) for d in devices for p in playlists]
+        )
+        db.commit()
+        ids = {"playlist_id": playlists[0].id, "device_id": devices[0].device_id}
+        db.close()
+        return ids
+
+    manifest_cache.invalidate_all()
+    yield create
+    manifest_cache.invalidate_all()
+
+
+ENDPOINTS = [
+    ("/ui/devices", "ui", "get_devices_page"),
+    ("/api/devices/", "devices", "get_devices"),
+    ("/api/playlists/{playlist_id}/active_videos", "playlists", "get_active_videos_in_playlist"),
+    ("/api/raspberry/playlists/active/{device_id}", "raspberry", "get_active_playlists_for_device"),
+]
+
+
+def _measure(client, path):
+    manifest_cache.invalidate_all()
+    with record_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200, response.text
+    assert response.headers["x-query-count"] == str(len(statements))
+    return statements
+
+
+@pytest.mark.parametrize("path,module,endpoint", ENDPOINTS)
+def test_endpoint_within_budget_regardless_of_fleet_size(client, seed, path, module, endpoint):
+    import importlib
+    budget = budget_of(getattr(importlib.import_module(f"router.{module}"), endpoint))
+
+    small = _measure(client, path.format(**seed(2)))
+    large = _measure(client, path.format(**seed(6)))
+
+    assert_within_budget(large, budget, path)
+    # Sin N+1: más filas no significa más sentencias
+    assert len(large) == len(small)
+
+
+def test_optional_total_does_not_count_against_budget(client, seed, executed):
+    from router.devices import get_devices
+
+    seed(4)
+    count_cache.invalidate()
+    plain = _measure(client, "/api/devices/")
+
+    executed.clear()
+    with record_queries() as with_total:
+        response = client.get("/api/devices/?include_total=true")
+
+    # El COUNT se ejecuta, pero fuera del presupuesto
+    assert response.headers["X-Total-Count"] == "4"
+    assert any("count(" in statement.lower() for statement in executed)
+    assert response.headers["x-query-count"] == str(len(with_total)) == str(len(plain))
+    assert_within_budget(with_total, budget_of(get_devices), "/api/devices/?include_total=true")
+
+
+def test_client_playlist_loads_videos_eagerly(seed, session_factory):
+    from router.client_api import get_client_playlist
+
+    ids = seed(5)
+    db = session_factory()
+    principal = DevicePrincipal(ids["device_id"], True, None, "Raspberry Pi 4")
+    with record_queries() as statements:
+        playlist = get_client_playlist(db, ids["playlist_id"], principal)
+        export = build_client_export(playlist, playlist.updated_at)
+    db.close()
+
+    assert len(export.video_ids) == 5
+    assert_within_budget(statements, 2, "get_client_playlist")
+
+
+def test_budget_failure_lists_statements():
+    with pytest.raises(QueryBudgetExceeded) as error:
+        assert_within_budget(["SELECT 1", "SELECT 2"], 1, "/api/x")
+    assert "2 sentencias SQL (presupuesto: 1)" in str(error.value)
+    assert "SELECT 2" in str(error.value)
@@ -0,0 +1,166 @@
+# ==========================================
+# ARCHIVO: tests/test_relay.py
+# Tests para el relé de tienda (caché LRU, descargas unificadas y manifiestos)
+# ==========================================
+
+import json
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from router import relay
+from services.relay_cache import RelayBlobCache
+
+VIDEO = bytes(range(256)) * 64
+UPSTREAM = "http://central.test"
+
+
+class FakeUpstream(httpx.AsyncBaseTransport):
+    """Servidor central simulado que cuenta las peticiones recibidas"""
+
+    def __init__(self):
+        self.full_downloads = 0
+        self.validations = 0
+        self.manifests = 0
+        self.manifest_version = 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.headers.get("authorization") != "Bearer ok":
+            return httpx.Response(401, json={"detail": "No autorizado"})
+
+        if request.url.path.endswith("/download"):
+            if request.headers.get("range") == "bytes=0-0":
+                self.validations += 1
+                return httpx.Response(206, content=VIDEO[:1], headers={
+                    "Content-Range": f"bytes 0-0/{len(VIDEO)}",
+                    "Content-Type": "video/mp4",
+                    "ETag": '"v1"',
+                })
+            self.full_downloads += 1
+            # Dar tiempo a que lleguen las demás peticiones simultáneas
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, content=VIDEO, headers={"Content-Type": "video/mp4", "ETag": '"v1"'})
+
+        if request.url.path == "/api/client/playlists":
+            self.manifests += 1
+            return httpx.Response(200, json={"version": self.manifest_version},
+                                  headers={"ETag": f'"m{self.manifest_version}"'})
+
+        # Cuerpo en streaming, como el de una conexión real
+        body = json.dumps({"path": request.url.path, "method": request.method}).encode("utf-8")
+
+        async def stream():
+            yield body
+
+        return httpx.Response(200, content=stream(), headers={"Content-Type": "application/json"})
+
+
+def make_relay(tmp_path, max_bytes=10 * len(VIDEO), manifest_ttl=60):
+    upstream = FakeUpstream()
+    upstream_client = httpx.AsyncClient(transport=upstream)
+    cache = RelayBlobCache(str(tmp_path / "cache"), max_bytes)
+    relay.store_relay = relay.StoreRelay(UPSTREAM, cache, upstream_client, manifest_ttl=manifest_ttl)
+
+    app = FastAPI()
+    app.include_router(relay.router)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://relay.test",
+                               headers={"Authorization": "Bearer ok"})
+    return client, upstream
+
+
+def test_concurrent_misses_share_one_upstream_download(tmp_path):
+    async def scenario():
+        client, upstream = make_relay(tmp_path)
+        async with client:
+            responses = await asyncio.gather(*[
+                client.get("/api/client/videos/1/download") for _ in range(5)
+            ])
+            assert all(response.status_code == 200 for response in responses)
+            assert all(response.content == VIDEO for response in responses)
+            assert upstream.full_downloads == 1
+
+            # Ya en caché: un rango se sirve sin volver al servidor central
+            response = await client.get("/api/client/videos/1/download", headers={"Range": "bytes=100-199"})
+            assert response.status_code == 206
+            assert response.content == VIDEO[100:200]
+            assert response.headers["x-relay-cache"] == "HIT"
+            assert upstream.full_downloads == 1
+        assert relay.store_relay.downloads.coalesced == 4
+
+    asyncio.run(scenario())
+
+
+def test_unauthorized_request_is_not_served_from_cache(tmp_path):
+    async def scenario():
+        client, upstream = make_relay(tmp_path)
+        async with client:
+            assert (await client.get("/api/videos/1/download")).status_code == 200
+            response = await client.get("/api/videos/1/download", headers={"Authorization": "Bearer otro"})
+            assert response.status_code == 401
+        assert upstream.full_downloads == 1
+
+    asyncio.run(scenario())
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    async def scenario():
+        client, upstream = make_relay(tmp_path, max_bytes=2 * len(VIDEO))
+        async with client:
+            for video_id in (1, 2, 1, 3):
+                assert (await client.get(f"/api/videos/{video_id}/download")).status_code == 200
+            stats = relay.store_relay.cache.stats()
+            assert stats["files"] == 2
+            assert stats["bytes"] <= 2 * len(VIDEO)
+            assert stats["evictions"] == 1
+
+            # El 1 se usó más recientemente que el 2: el expulsado es el 2
+            await client.get("/api/videos/1/download")
+            assert upstream.full_downloads == 3
+            await client.get("/api/videos/2/download")
+            assert upstream.full_downloads == 4
+
+    asyncio.run(scenario())
+
+
+def test_cache_index_survives_restart(tmp_path):
+    async def scenario():
+        client, _ = make_relay(tmp_path)
+        async with client:
+            await client.get("/api/videos/1/download")
+
+    asyncio.run(scenario())
+    cache = RelayBlobCache(str(tmp_path / "cache"), 10 * len(VIDEO))
+    assert cache.stats()["files"] == 1
+    assert cache.stats()["bytes"] == len(VIDEO)
+
+
+def test_manifest_is_cached_for_ttl(tmp_path):
+    async def scenario():
+        client, upstream = make_relay(tmp_path)
+        async with client:
+            first = await client.get("/api/client/playlists")
+            upstream.manifest_version = 2
+            second = await client.get("/api/client/playlists")
+            assert first.json() == second.json() == {"version": 1}
+            assert upstream.manifests == 1
+
+            response = await client.get("/api/client/playlists", headers={"If-None-Match": '"m1"'})
+            assert response.status_code == 304
+
+            relay.store_relay.manifest_ttl = 0
+            relay.store_relay._manifests.clear()
+            assert (await client.get("/api/client/playlists")).json() == {"version": 2}
+
+    asyncio.run(scenario())
+
+
+def test_other_routes_pass_through(tmp_path):
+    async def scenario():
+        client, _ = make_relay(tmp_path)
+        async with client:
+            response = await client.post("/api/raspberry/heartbeat", json={"device_id": "pi-1"})
+            assert response.status_code == 200
+            assert response.json() == {"path": "/api/raspberry/heartbeat", "method": "POST"}
+
+    asyncio.run(scenario())
@@ -0,0 +1,148 @@
+# ==========================================
+# ARCHIVO: tests/test_rollout.py
+# Tests para el despliegue escalonado (ventanas, cubetas de tokens y progreso)
+# ==========================================
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from models.models import Device, Playlist, Video, PlaylistVideo, DevicePlaylist
+from services import rollout
+from services.manifest_cache import get_manifest, manifest_cache, CLIENT
+
+ASSIGNED_AT = datetime(2024, 3, 4, 12, 0)
+
+
+@pytest.fixture
+def db_session(session_factory, clean_db):
+    """Dos tiendas con dos dispositivos cada una y un video asignado a todos"""
+    manifest_cache.invalidate_all()
+    db = session_factory()
+    devices = [
+        Device(device_id=f"rpi-{tienda}-{n}", name=f"{tienda} {n}", tienda=tienda,
+               mac_address=f"00:00:00:00:{index:02d}:{n:02d}")
+        for index, tienda in enumerate(("T01", "T02")) for n in (1, 2)
+    ]
+    playlist = Playlist(title="Promos")
+    video = Video(title="Promo", file_path="uploads/promo.mp4", upload_date=ASSIGNED_AT)
+    db.add_all(devices + [playlist, video])
+    db.commit()
+    db.add(PlaylistVideo(playlist_id=playlist.id, video_id=video.id, position=1, created_at=ASSIGNED_AT))
+    db.add_all([
+        DevicePlaylist(device_id=device.device_id, playlist_id=playlist.id, assigned_at=ASSIGNED_AT)
+        for device in devices
+    ])
+    db.commit()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _request(headers=None, method="GET"):
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": method, "headers": raw})
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("01:00-05:00", (3600, 4 * 3600)),
+    ("22:00-06:00", (22 * 3600, 8 * 3600)),
+])
+def test_parse_window(spec, expected):
+    assert rollout.parse_window(spec) == expected
+
+
+def test_windows_are_stable_and_inside_off_hours():
+    schedule = rollout.RolloutSchedule("22:00-06:00", tienda_spread=1800, device_window=1800)
+    released = datetime(2024, 3, 4, 12, 0)
+    starts = set()
+    for n in range(50):
+        start, end = schedule.window_for(f"rpi-{n}", f"T{n % 5:02d}", released)
+        assert start == schedule.window_for(f"rpi-{n}", f"T{n % 5:02d}", released)[0]
+        assert datetime(2024, 3, 4, 22, 0) <= start and end <= datetime(2024, 3, 5, 6, 0)
+        assert end - start == timedelta(seconds=1800)
+        starts.add(start)
+    assert len(starts) == 50
+
+
+def test_devices_of_a_tienda_share_its_slot():
+    schedule = rollout.RolloutSchedule("01:00-05:00", tienda_spread=600, device_window=600)
+    offsets = [schedule.offset(f"rpi-{n}", "T01") for n in range(20)]
+    assert max(offsets) - min(offsets) <= 600
+
+
+def test_release_inside_window_downloads_immediately():
+    schedule = rollout.RolloutSchedule("00:00-00:00", tienda_spread=0, device_window=86400)
+    released = datetime(2024, 3, 4, 12, 0)
+    assert schedule.not_before("rpi-1", "T01", released) == released
+
+
+def test_manifest_includes_not_before(db_session, monkeypatch):
+    monkeypatch.setattr(rollout, "ROLLOUT_ENABLED", True)
+    entry = get_manifest(db_session, "rpi-T01-1", CLIENT)
+    video = entry.payload[0]["videos"][0]
+    expected = rollout.rollout_schedule.not_before("rpi-T01-1", "T01", ASSIGNED_AT)
+    assert video["not_before"] == expected.isoformat()
+    assert expected > ASSIGNED_AT
+
+    # Cambiar de tienda cambia la ventana: la entrada se invalida
+    device = db_session.query(Device).filter(Device.device_id == "rpi-T01-1").one()
+    device.tienda = "T02"
+    db_session.commit()
+    assert get_manifest(db_session, "rpi-T01-1", CLIENT) is not entry
+
+
+def test_manifest_omits_not_before_when_disabled(db_session):
+    entry = get_manifest(db_session, "rpi-T01-1", CLIENT)
+    assert "not_before" not in entry.payload[0]["videos"][0]
+
+
+def test_token_buckets_reject_with_retry_after():
+    limiter = rollout.DownloadLimiter(global_rate=1000, tienda_rate=100, burst_seconds=1)
+
+    # La primera descarga se admite aunque supere la ráfaga; deja la cubeta en negativo
+    assert rollout.admit_download(_request(), 5000, "T01", limiter=limiter)
+    with pytest.raises(HTTPException) as exc_info:
+        rollout.admit_download(_request(), 5000, "T01", limiter=limiter)
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) >= 1
+
+    # Otra tienda solo depende de la cubeta global, también agotada
+    with pytest.raises(HTTPException):
+        rollout.admit_download(_request(), 10, "T02", limiter=limiter)
+    assert limiter.stats()["rejected"] == 2
+
+
+def test_head_and_partial_requests():
+    limiter = rollout.DownloadLimiter(global_rate=100, tienda_rate=0, burst_seconds=1)
+    assert rollout.admit_download(_request(method="HEAD"), 10 ** 9, limiter=limiter) is False
+    assert limiter.stats()["admitted"] == 0
+
+    assert rollout.admit_download(_request({"Range": "bytes=0-9"}), 1000, limiter=limiter) is False
+    assert rollout.admit_download(_request({"Range": "bytes=990-"}), 1000, limiter=limiter) is True
+    assert limiter.stats()["admitted_bytes"] == 20
+
+
+def test_unlimited_by_default():
+    limiter = rollout.DownloadLimiter(global_rate=0, tienda_rate=0)
+    for _ in range(10):
+        assert rollout.admit_download(_request(), 10 ** 9, "T01", limiter=limiter)
+
+
+def test_progress_counts_fetched_devices(db_session):
+    video = db_session.query(Video).one()
+    rollout.record_download(db_session, "rpi-T01-1", video.id)
+    rollout.record_download(db_session, "rpi-T01-1", video.id)
+    rollout.record_download(db_session, "rpi-T02-1", video.id)
+
+    [progress] = rollout.rollout_progress(db_session)
+    assert progress["devices_targeted"] == 4
+    assert progress["devices_fetched"] == 2
+    assert progress["percent"] == 50.0
+
+    by_tienda = {row["tienda"]: row for row in rollout.rollout_progress_by_tienda(db_session, video.id)}
+    assert by_tienda["T01"]["devices_fetched"] == 1
+    assert by_tienda["T02"]["devices_targeted"] == 2
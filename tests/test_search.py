@@ -0,0 +1,116 @@
+# ==========================================
+# ARCHIVO: tests/test_search.py
+# Tests para la búsqueda con documentos de trigramas (fallback SQLite)
+# ==========================================
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from models.models import Device, DevicePlaylist, Playlist
+from services import search
+from services.search import (
+    DEVICE_SEARCH, SEARCH_SPECS, apply_search, device_search_columns, devices_matching,
+    like_pattern, rank
+)
+
+
+@pytest.fixture
+def db_session(session_factory, clean_db):
+    db = session_factory()
+    db.add_all([
+        Device(device_id="rpi-001", name="Caja Norte", tienda="T0101", model="Raspberry Pi 4",
+               mac_address="00:00:00:00:00:01", ip_address_lan="10.1.0.15", location="Madrid"),
+        Device(device_id="rpi-002", name="Escaparate", tienda="T0202", model="Raspberry Pi 5",
+               mac_address="00:00:00:00:00:02", location="Norte de Sevilla"),
+        Device(device_id="rpi-003", name="Pasillo_100%", tienda="T0303", model=None,
+               mac_address="00:00:00:00:00:03"),
+    ])
+    playlist = Playlist(title="Rebajas de invierno", is_active=True)
+    db.add(playlist)
+    db.commit()
+    db.add(DevicePlaylist(device_id="rpi-003", playlist_id=playlist.id))
+    db.commit()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _device_ids(query):
+    return sorted(device.device_id for device in query.all())
+
+
+def test_search_all_columns_is_case_insensitive(db_session):
+    query = apply_search(db_session, db_session.query(Device), DEVICE_SEARCH, "  NORTE ")
+    assert _device_ids(query) == ["rpi-001", "rpi-002"]
+
+    query = apply_search(db_session, db_session.query(Device), DEVICE_SEARCH, "10.1.0")
+    assert _device_ids(query) == ["rpi-001"]
+
+
+def test_search_single_field(db_session):
+    query = apply_search(db_session, db_session.query(Device), DEVICE_SEARCH, "norte",
+                         device_search_columns("name"))
+    assert _device_ids(query) == ["rpi-001"]
+
+    # Campo desconocido: todas las columnas
+    assert device_search_columns("otro") == []
+
+
+def test_user_wildcards_are_literal(db_session):
+    assert like_pattern("100%_a\\b") == "%100\\%\\_a\\\\b%"
+    assert _device_ids(apply_search(db_session, db_session.query(Device), DEVICE_SEARCH, "%")) == ["rpi-003"]
+    # Sin escapar, "_1" también coincidiría con "t0101"
+    assert _device_ids(apply_search(db_session, db_session.query(Device), DEVICE_SEARCH, "_1")) == ["rpi-003"]
+
+
+def test_device_search_includes_assigned_playlists(db_session):
+    query = db_session.query(Device).filter(devices_matching("invierno", include_playlists=True))
+    assert _device_ids(query) == ["rpi-003"]
+    assert _device_ids(db_session.query(Device).filter(devices_matching("invierno"))) == []
+
+
+def test_no_ranking_without_pg_trgm(db_session):
+    assert rank(db_session, DEVICE_SEARCH, "norte") is None
+
+
+class _PostgresSession:
+    """Sesión mínima que responde a la comprobación de pg_trgm con los valores dados"""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.checks = 0
+        self.bind = type("Bind", (), {"dialect": postgresql.dialect()})()
+
+    def get_bind(self):
+        return self.bind
+
+    def execute(self, statement):
+        self.checks += 1
+        installed = self.answers.pop(0)
+        return type("Result", (), {"first": lambda _: (1,) if installed else None})()
+
+
+def test_missing_pg_trgm_is_rechecked_after_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(search.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(search, "_trigram_support", {})
+    db = _PostgresSession([False, True])
+
+    assert not search.trigram_ranking_available(db)
+    assert not search.trigram_ranking_available(db)
+    assert db.checks == 1
+
+    # Tras aplicar la migración se detecta sin reiniciar, y el positivo no caduca
+    clock[0] += search.SEARCH_TRIGRAM_RECHECK
+    assert search.trigram_ranking_available(db)
+    clock[0] += 10 * search.SEARCH_TRIGRAM_RECHECK
+    assert search.trigram_ranking_available(db)
+    assert db.checks == 2
+
+
+def test_index_expression_matches_query_document():
+    dialect = postgresql.dialect()
+    for spec in SEARCH_SPECS:
+        query_document = str(spec.document().compile(dialect=dialect)).replace(f"{spec.table}.", "")
+        assert f"(({query_document}) gin_trgm_ops)" in spec.index_ddl()
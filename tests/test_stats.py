@@ -0,0 +1,78 @@
+# ==========================================
+# ARCHIVO: tests/test_stats.py
+# Tests para las estadísticas agregadas de los paneles
+# ==========================================
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+
+from models.models import Device, Playlist, Tienda, User
+from services.stats import filtered_user_stats, playlist_stats, stats_cache, tienda_stats, user_stats
+
+
+@pytest.fixture
+def db_session(session_factory, clean_db):
+    stats_cache.invalidate()
+    db = session_factory()
+    db.add_all([
+        User(username="admin", email="admin@example.com", is_admin=True, auth_provider="local"),
+        User(username="ana", email="ana@example.com", auth_provider="ad"),
+        User(username="luis", email="luis@example.com", auth_provider="ad", is_active=False),
+        Playlist(title="Vigente", is_active=True),
+        Playlist(title="Caducada", is_active=True, expiration_date=datetime.now() - timedelta(days=1)),
+        Playlist(title="Inactiva", is_active=False),
+        Tienda(tienda="T0101", location="Madrid"),
+        Tienda(tienda="T0202", location="Sevilla"),
+        Device(device_id="rpi-001", tienda="T0101", is_active=True, mac_address="00:00:00:00:00:01"),
+        Device(device_id="rpi-002", tienda="T0202", is_active=False, mac_address="00:00:00:00:00:02"),
+    ])
+    db.commit()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_each_panel_is_one_statement_and_then_cached(db_session, executed):
+    executed.clear()
+    assert user_stats(db_session) == {"total": 3, "active": 2, "inactive": 1, "admins": 1, "local": 1, "ad": 2}
+    assert playlist_stats(db_session) == {"total": 3, "active": 1}
+    assert tienda_stats(db_session) == {"total": 2, "active": 1}
+    assert len(executed) == 3
+    assert all("FILTER (WHERE" in statement for statement in executed)
+
+    executed.clear()
+    user_stats(db_session)
+    playlist_stats(db_session)
+    tienda_stats(db_session)
+    assert executed == []
+
+
+def test_filtered_user_stats(db_session):
+    query = db_session.query(User).filter(User.auth_provider == "ad")
+    assert filtered_user_stats(db_session, query, ("", None, "ad")) == {
+        "total": 2, "active": 1, "inactive": 1, "admins": 0, "local": 0, "ad": 2
+    }
+
+
+def test_writes_invalidate_dependent_stats(db_session, executed):
+    tienda_stats(db_session)
+    user_stats(db_session)
+
+    # Las métricas de los reproductores no cambian ningún recuento
+    device = db_session.query(Device).filter(Device.device_id == "rpi-002").one()
+    device.cpu_temp = 55.0
+    db_session.commit()
+    executed.clear()
+    tienda_stats(db_session)
+    assert executed == []
+
+    # Un dispositivo que se activa cambia las tiendas con dispositivos activos
+    device.is_active = True
+    db_session.commit()
+    assert tienda_stats(db_session) == {"total": 2, "active": 2}
+
+    db_session.execute(update(User).where(User.username == "luis").values(is_active=True))
+    db_session.commit()
+    assert user_stats(db_session)["active"] == 3
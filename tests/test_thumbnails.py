@@ -0,0 +1,76 @@
+# ==========================================
+# ARCHIVO: tests/test_thumbnails.py
+# Tests para las miniaturas de video
+# ==========================================
+
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from models.database import get_db
+from models.models import Video
+from router import videos
+from services import thumbnails
+
+CONTENT_HASH = "cd" * 32
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, session_factory, override_get_db, clean_db):
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_DIR", str(tmp_path / "thumbnails"))
+    db = session_factory()
+    db.add(Video(id=1, title="Promo", file_path=str(tmp_path / "promo.mp4"), content_hash=CONTENT_HASH))
+    db.commit()
+    db.close()
+
+    app = FastAPI()
+    app.include_router(videos.router)
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def test_missing_thumbnail_serves_placeholder_and_queues_generation(client, monkeypatch):
+    queued = []
+    monkeypatch.setattr(videos.thumbnail_pool, "submit_video", lambda video: queued.append(video.id))
+
+    response = client.get("/api/videos/1/thumbnail")
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-store"
+    assert queued == [1]
+
+
+def test_versioned_thumbnail_is_cached_long_term(client):
+    path = thumbnails.thumbnail_path(CONTENT_HASH, "small")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as image:
+        image.write(b"jpeg")
+
+    versioned = client.get(f"/api/videos/1/thumbnail?size=small&v={CONTENT_HASH[:16]}")
+    unversioned = client.get("/api/videos/1/thumbnail?size=small")
+
+    assert versioned.content == b"jpeg"
+    assert "immutable" in versioned.headers["cache-control"]
+    assert "immutable" not in unversioned.headers["cache-control"]
+    assert client.get("/api/videos/1/thumbnail?size=huge").status_code == 400
+
+
+def test_failed_generation_is_not_retried_immediately(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_DIR", str(tmp_path))
+    attempts = []
+
+    def failing_generate(file_path, key, duration):
+        attempts.append(key)
+        raise thumbnails.ThumbnailError("sin ffmpeg")
+
+    pool = thumbnails.ThumbnailPool(max_workers=1, generate=failing_generate)
+    video = Video(id=2, title="Promo", file_path="promo.mp4", content_hash=CONTENT_HASH)
+    try:
+        pool.submit_video(video).result()
+        assert pool.submit_video(video) is None
+    finally:
+        pool.shutdown(wait=True)
+
+    assert attempts == [CONTENT_HASH]
+    assert video.thumbnail.endswith(f"&v={CONTENT_HASH[:16]}")
@@ -0,0 +1,88 @@
+# ==========================================
+# ARCHIVO: tests/test_transcoding.py
+# Tests para las versiones recodificadas por modelo de dispositivo
+# ==========================================
+
+import pytest
+
+from models.models import Device, Playlist, Video, PlaylistVideo, DevicePlaylist, VideoRendition
+from services import transcoding
+from services.manifest_cache import get_manifest, manifest_cache, RASPBERRY
+
+
+@pytest.fixture
+def db_session(tmp_path, monkeypatch, session_factory, clean_db):
+    monkeypatch.setattr(transcoding, "RENDITION_DIR", str(tmp_path / "renditions"))
+    manifest_cache.invalidate_all()
+    source = tmp_path / "promo.mov"
+    source.write_bytes(b"4k video")
+
+    db = session_factory()
+    device = Device(device_id="rpi-3", name="Caja", model="Raspberry Pi 3 Model B Plus Rev 1.3",
+                    mac_address="00:00:00:00:00:03")
+    playlist = Playlist(title="Promos")
+    video = Video(title="Promo", file_path=str(source), video_codec="hevc",
+                  width=3840, height=2160, container="mov")
+    db.add_all([device, playlist, video])
+    db.commit()
+    db.add_all([
+        PlaylistVideo(playlist_id=playlist.id, video_id=video.id, position=1),
+        DevicePlaylist(device_id=device.device_id, playlist_id=playlist.id),
+    ])
+    db.commit()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("model, profile", [
+    ("Raspberry Pi 4 Model B Rev 1.4", "1080p60"),
+    ("Raspberry Pi 3 Model B Plus Rev 1.3", "1080p30"),
+    ("Raspberry Pi Zero W Rev 1.1", "720p"),
+    (None, transcoding.DEFAULT_PROFILE),
+])
+def test_profile_for_model(model, profile):
+    assert transcoding.profile_for_model(model) == profile
+
+
+def test_ready_rendition_replaces_original_in_manifest(db_session, session_factory):
+    video = db_session.query(Video).one()
+    before = get_manifest(db_session, "rpi-3", RASPBERRY)
+    assert before.payload[0]["videos"][0]["file_path"] == f"/api/videos/{video.id}/download"
+
+    def fake_transcode(source_path, target_path, profile):
+        with open(target_path, "wb") as target:
+            target.write(b"h264 " + profile.encode())
+
+    assert transcoding.enqueue_video(db_session, video, {"1080p30"}) == 1
+    worker = transcoding.TranscodeWorker(session_factory=session_factory, transcode=fake_transcode)
+    rendition_id = worker.claim_next()
+    worker.process(rendition_id)
+
+    rendition = db_session.query(VideoRendition).one()
+    assert rendition.status == transcoding.READY
+    assert (rendition.width, rendition.height) == (1920, 1080)
+
+    after = get_manifest(db_session, "rpi-3", RASPBERRY)
+    entry = after.payload[0]["videos"][0]
+    assert after.version != before.version
+    assert entry["file_path"] == f"/api/videos/{video.id}/download?rendition=1080p30"
+    assert entry["content_hash"] == rendition.content_hash
+
+
+def test_compatible_source_is_not_transcoded(db_session, session_factory):
+    video = db_session.query(Video).one()
+    video.video_codec, video.width, video.height, video.container = "h264", 1280, 720, "mp4"
+    db_session.commit()
+
+    def unexpected_transcode(*args):
+        raise AssertionError("no debe recodificar")
+
+    transcoding.enqueue_video(db_session, video, {"720p"})
+    worker = transcoding.TranscodeWorker(session_factory=session_factory, transcode=unexpected_transcode)
+    worker.process(worker.claim_next())
+
+    db_session.expire_all()
+    assert db_session.query(VideoRendition).one().status == transcoding.SOURCE
+    assert worker.claim_next() is None
@@ -0,0 +1,97 @@
+# ==========================================
+# ARCHIVO: tests/test_video_access.py
+# Tests para el índice en memoria de videos autorizados por dispositivo
+# ==========================================
+
+import pytest
+
+from models.models import Device, Playlist, Video, PlaylistVideo, DevicePlaylist
+from services.video_access import VideoAccessIndex, video_access_index
+
+
+@pytest.fixture
+def db_session(session_factory, clean_db):
+    """Dispositivo con una playlist asignada que tiene un video, y otro video sin asignar"""
+    video_access_index.invalidate_all()
+    db = session_factory()
+    device = Device(device_id="rpi-1", name="Caja", mac_address="00:00:00:00:00:01")
+    playlist = Playlist(title="Promos")
+    other = Playlist(title="Otra")
+    assigned = Video(title="Asignado", file_path="uploads/a.mp4")
+    unassigned = Video(title="Sin asignar", file_path="uploads/b.mp4")
+    db.add_all([device, playlist, other, assigned, unassigned])
+    db.commit()
+    db.add_all([
+        PlaylistVideo(playlist_id=playlist.id, video_id=assigned.id, position=1),
+        PlaylistVideo(playlist_id=other.id, video_id=unassigned.id, position=1),
+        DevicePlaylist(device_id=device.device_id, playlist_id=playlist.id),
+    ])
+    db.commit()
+    try:
+        yield db, playlist, other, assigned, unassigned
+    finally:
+        db.close()
+
+
+def test_lookup_runs_no_sql_after_first_load(db_session, executed):
+    db, _, _, assigned, unassigned = db_session
+    assigned_id, unassigned_id = assigned.id, unassigned.id
+    assert video_access_index.allows(db, "rpi-1", assigned_id)
+
+    executed.clear()
+    assert video_access_index.allows(db, "rpi-1", assigned_id)
+    assert not video_access_index.allows(db, "rpi-1", unassigned_id)
+    assert executed == []
+
+
+def test_assignment_change_updates_access(db_session):
+    db, _, other, _, unassigned = db_session
+    assert not video_access_index.allows(db, "rpi-1", unassigned.id)
+
+    db.add(DevicePlaylist(device_id="rpi-1", playlist_id=other.id))
+    db.commit()
+    assert video_access_index.allows(db, "rpi-1", unassigned.id)
+
+    db.query(DevicePlaylist).filter(DevicePlaylist.playlist_id == other.id).delete()
+    db.commit()
+    assert not video_access_index.allows(db, "rpi-1", unassigned.id)
+
+
+def test_playlist_membership_change_updates_access(db_session):
+    db, playlist, _, assigned, unassigned = db_session
+    assert not video_access_index.allows(db, "rpi-1", unassigned.id)
+
+    db.add(PlaylistVideo(playlist_id=playlist.id, video_id=unassigned.id, position=2))
+    db.commit()
+    assert video_access_index.allows(db, "rpi-1", unassigned.id)
+
+    membership = db.query(PlaylistVideo).filter(
+        PlaylistVideo.playlist_id == playlist.id, PlaylistVideo.video_id == assigned.id
+    ).one()
+    db.delete(membership)
+    db.commit()
+    assert not video_access_index.allows(db, "rpi-1", assigned.id)
+
+
+def test_unrelated_changes_keep_entry(db_session, executed):
+    db, _, other, assigned, _ = db_session
+    assigned_id = assigned.id
+    video_access_index.allows(db, "rpi-1", assigned_id)
+    other.title = "Renombrada"
+    db.commit()
+
+    executed.clear()
+    assert video_access_index.allows(db, "rpi-1", assigned_id)
+    assert executed == []
+
+
+def test_index_is_bounded_and_expires(db_session):
+    db, _, _, assigned, _ = db_session
+    index = VideoAccessIndex(ttl=0, max_devices=1)
+    index.allows(db, "rpi-1", assigned.id)
+    index.allows(db, "rpi-2", assigned.id)
+    assert index.stats()["devices"] == 1
+
+    # Con ttl=0 cada consulta vuelve a la base de datos
+    assert index.allows(db, "rpi-1", assigned.id)
+    assert index.stats()["hits"] == 0
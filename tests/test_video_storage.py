@@ -0,0 +1,78 @@
+# ==========================================
+# ARCHIVO: tests/test_video_storage.py
+# Tests para el almacenamiento de videos direccionado por contenido
+# ==========================================
+
+import io
+import os
+import hashlib
+import pytest
+
+from models.models import VideoBlob
+from services import video_storage
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch, session_factory, clean_db):
+    monkeypatch.setattr(video_storage, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(video_storage, "TEMP_DIR", str(tmp_path / "tmp"))
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _upload(db, data: bytes):
+    temp_path = video_storage.new_temp_path(".mp4")
+    content_hash, size = video_storage.write_and_hash(io.BytesIO(data), temp_path)
+    blob = video_storage.acquire_blob(db, content_hash, temp_path, size, ".mp4")
+    db.commit()
+    return blob, temp_path
+
+
+def test_duplicate_upload_shares_blob(storage):
+    data = b"promo" * 1000
+    first, first_temp = _upload(storage, data)
+    second, second_temp = _upload(storage, data)
+
+    assert first.content_hash == hashlib.sha256(data).hexdigest()
+    assert second.id == first.id
+    assert second.ref_count == 2
+    assert first.file_path.endswith(f"{first.content_hash}.mp4")
+    assert not os.path.exists(first_temp) and not os.path.exists(second_temp)
+    assert storage.query(VideoBlob).count() == 1
+
+
+def test_release_deletes_file_on_last_reference(storage):
+    blob, _ = _upload(storage, b"a" * 10)
+    _upload(storage, b"a" * 10)
+
+    assert video_storage.release_blob(storage, blob.content_hash) is None
+    storage.commit()
+    orphan = video_storage.release_blob(storage, blob.content_hash)
+    storage.commit()
+
+    assert orphan == blob.file_path
+    assert storage.query(VideoBlob).count() == 0
+    video_storage.remove_file(orphan)
+    assert not os.path.exists(orphan)
+
+
+def test_concurrent_insert_keeps_winner_blob_file(storage, monkeypatch):
+    data = b"carrera" * 500
+    winner, _ = _upload(storage, data)
+
+    # El perdedor no ve la fila en su primera búsqueda y choca con la UNIQUE al insertar
+    find_blob = video_storage._find_blob
+    misses = iter([True])
+    monkeypatch.setattr(video_storage, "_find_blob",
+                        lambda db, content_hash: None if next(misses, False) else find_blob(db, content_hash))
+    loser, loser_temp = _upload(storage, data)
+
+    assert loser.id == winner.id
+    assert loser.ref_count == 2
+    assert os.path.exists(winner.file_path)
+    assert not os.path.exists(loser_temp)
+    with open(winner.file_path, "rb") as f:
+        assert f.read() == data
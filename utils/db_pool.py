@@ -0,0 +1,176 @@
+# utils/db_pool.py - Configuración e instrumentación de los pools de conexiones
+
+"""
+Cada clase de tráfico (reproductores, administración) usa su propio motor y
+por tanto su propio pool, para que una consulta pesada del panel no deje sin
+conexiones a los reproductores.
+
+La configuración se lee de variables de entorno: primero la de la clase
+(`DB_PLAYER_POOL_SIZE`) y si no existe la general (`DB_POOL_SIZE`):
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS
+
+Los pools registran cuánto espera cada petición para obtener una conexión
+(ver PoolMonitor); las métricas se exponen en /api/metrics/db.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict
+
+from sqlalchemy import exc
+
+# Muestras de espera conservadas para calcular percentiles
+POOL_WAIT_SAMPLES = int(os.getenv("DB_POOL_WAIT_SAMPLES", "1000"))
+
+_DEFAULTS = {
+    "POOL_SIZE": "5",
+    "MAX_OVERFLOW": "10",
+    "POOL_TIMEOUT": "30",
+    "POOL_RECYCLE": "1800",
+    "POOL_PRE_PING": "true",
+    "STATEMENT_TIMEOUT_MS": "0",
+}
+
+
+def _setting(traffic_class: str, name: str) -> str:
+    value = os.getenv(f"DB_{traffic_class.upper()}_{name}")
+    if value is None:
+        value = os.getenv(f"DB_{name}", _DEFAULTS[name])
+    return value
+
+
+def pool_settings(traffic_class: str) -> dict:
+    """
+    Configuración del pool de una clase de tráfico
+
+    Returns:
+        Diccionario con pool_size, max_overflow, pool_timeout, pool_recycle,
+        pool_pre_ping y statement_timeout_ms (0 = sin límite)
+    """
+    return {
+        "pool_size": int(_setting(traffic_class, "POOL_SIZE")),
+        "max_overflow": int(_setting(traffic_class, "MAX_OVERFLOW")),
+        "pool_timeout": float(_setting(traffic_class, "POOL_TIMEOUT")),
+        "pool_recycle": int(_setting(traffic_class, "POOL_RECYCLE")),
+        "pool_pre_ping": _setting(traffic_class, "POOL_PRE_PING").lower() in ("1", "true", "yes"),
+        "statement_timeout_ms": int(_setting(traffic_class, "STATEMENT_TIMEOUT_MS")),
+    }
+
+
+def statement_timeout_args(timeout_ms: int, driver: str) -> dict:
+    """connect_args que fijan statement_timeout en cada conexión nueva"""
+    if timeout_ms <= 0:
+        return {}
+    if driver == "asyncpg":
+        return {"server_settings": {"statement_timeout": str(timeout_ms)}}
+    return {"options": f"-c statement_timeout={timeout_ms}"}
+
+
+class PoolMonitor:
+    """Esperas y timeouts al obtener conexiones de un pool"""
+
+    def __init__(self, name: str, samples: int = POOL_WAIT_SAMPLES):
+        self.name = name
+        self.pool = None
+        self.settings: dict = {}
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            self._waits.append(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            checkouts = self.checkouts
+            data = {
+                "checkouts": checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait_seconds / checkouts * 1000, 2) if checkouts else 0.0,
+                "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            }
+        pool = self.pool
+        if pool is not None:
+            data.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": self.settings.get("max_overflow"),
+            })
+        return data
+
+
+# Monitores registrados, por nombre de pool
+pool_monitors: Dict[str, PoolMonitor] = {}
+
+
+def monitored_pool_class(base, monitor: PoolMonitor):
+    """
+    Subclase del pool que mide la espera de cada checkout
+
+    Se usa una subclase (y no un atributo de la instancia) porque
+    engine.dispose() recrea el pool con la misma clase.
+    """
+    class MonitoredPool(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            monitor.pool = self
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                monitor.record_wait(time.perf_counter() - started, timed_out=True)
+                raise
+            monitor.record_wait(time.perf_counter() - started)
+            return connection
+
+    MonitoredPool.__name__ = MonitoredPool.__qualname__ = f"Monitored{base.__name__}"
+    return MonitoredPool
+
+
+def engine_options(name: str, traffic_class: str, base_pool, driver: str) -> dict:
+    """
+    Argumentos de create_engine/create_async_engine para un pool monitorizado
+
+    Args:
+        name: Nombre del pool en las métricas (p. ej. "player", "player_async")
+        traffic_class: Clase de tráfico cuya configuración se usa
+        base_pool: Clase de pool de SQLAlchemy (QueuePool, AsyncAdaptedQueuePool)
+        driver: "psycopg2" o "asyncpg" (para statement_timeout)
+    """
+    settings = pool_settings(traffic_class)
+    monitor = pool_monitors.setdefault(name, PoolMonitor(name))
+    monitor.settings = settings
+    return {
+        "poolclass": monitored_pool_class(base_pool, monitor),
+        "pool_size": settings["pool_size"],
+        "max_overflow": settings["max_overflow"],
+        "pool_timeout": settings["pool_timeout"],
+        "pool_recycle": settings["pool_recycle"],
+        "pool_pre_ping": settings["pool_pre_ping"],
+        "connect_args": statement_timeout_args(settings["statement_timeout_ms"], driver),
+    }
+
+
+def pool_stats() -> dict:
+    """Métricas de todos los pools creados"""
+    return {name: monitor.stats() for name, monitor in pool_monitors.items()}
@@ -0,0 +1,24 @@
+# utils/etag.py
+# Validadores HTTP (ETag) sin dependencias de la base de datos
+
+from typing import Optional
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Compara un encabezado If-None-Match con un ETag
+
+    Acepta listas separadas por comas, el comodín `*` y validadores débiles
+    (If-None-Match usa comparación débil según RFC 9110).
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
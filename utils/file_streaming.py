@@ -0,0 +1,174 @@
+# utils/file_streaming.py
+# Envío de archivos con soporte de rangos de bytes sin bloquear el event loop
+
+import os
+import logging
+from typing import Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de lectura para el envío por hilos cuando no hay envío sin copia
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(256 * 1024)))
+
+# Extensión ASGI que entrega un descriptor al servidor para usar sendfile
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(Exception):
+    """El rango solicitado no se puede servir (HTTP 416)"""
+
+    def __init__(self, file_size: int):
+        self.file_size = file_size
+        super().__init__(f"Rango no satisfacible para un archivo de {file_size} bytes")
+
+
+def parse_byte_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta un encabezado Range de un único rango
+
+    Admite `bytes=inicio-fin`, `bytes=inicio-` y rangos sufijo `bytes=-N`.
+    Los encabezados mal formados o con varios rangos se ignoran (se sirve el
+    archivo completo), como permite RFC 9110.
+
+    Args:
+        range_header: Valor del encabezado Range
+        file_size: Tamaño del archivo en bytes
+
+    Returns:
+        Tupla (inicio, fin) inclusiva, o None para servir el archivo completo
+
+    Raises:
+        RangeNotSatisfiable: Si el rango es válido pero queda fuera del archivo
+    """
+    if not range_header:
+        return None
+
+    unit, _, ranges = range_header.strip().partition("=")
+    if unit.strip().lower() != "bytes" or not ranges or "," in ranges:
+        return None
+
+    first, sep, last = ranges.strip().partition("-")
+    if not sep:
+        return None
+    first, last = first.strip(), last.strip()
+
+    try:
+        if not first:
+            # Rango sufijo: los últimos N bytes
+            if not last:
+                return None
+            suffix = int(last)
+            if suffix <= 0 or file_size == 0:
+                raise RangeNotSatisfiable(file_size)
+            return max(file_size - suffix, 0), file_size - 1
+
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+
+    if end is not None and start > end:
+        return None
+    if start >= file_size:
+        raise RangeNotSatisfiable(file_size)
+    if end is None:
+        end = file_size - 1
+
+    return start, min(end, file_size - 1)
+
+
+class RangeFileResponse(Response):
+    """
+    Respuesta que envía un archivo (o un rango) sin bloquear el event loop
+
+    Si el servidor ASGI ofrece la extensión `http.response.zerocopysend`, el
+    rango se entrega al kernel (sendfile) mediante el descriptor del archivo.
+    En caso contrario las lecturas se hacen en el threadpool de anyio.
+    """
+
+    def __init__(self, path: str, file_size: int, media_type: str,
+                 byte_range: Optional[Tuple[int, int]] = None,
+                 headers: Optional[Mapping[str, str]] = None,
+                 chunk_size: int = STREAM_CHUNK_SIZE):
+        self.path = path
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+
+        if byte_range is None:
+            self.start, self.end = 0, file_size - 1
+            status_code = 200
+        else:
+            self.start, self.end = byte_range
+            status_code = 206
+
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+
+        self.headers["content-length"] = str(self.end - self.start + 1 if file_size else 0)
+        self.headers.setdefault("accept-ranges", "bytes")
+        if byte_range is not None:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{file_size}"
+
+    @property
+    def content_length(self) -> int:
+        return self.end - self.start + 1 if self.file_size else 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if scope.get("method") == "HEAD" or self.content_length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            await self._send_zerocopy(send)
+        else:
+            await self._send_chunks(send)
+
+    async def _send_zerocopy(self, send: Send):
+        # La extensión espera un objeto archivo con descriptor del sistema operativo
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": file,
+                "offset": self.start,
+                "count": self.content_length,
+                "more_body": False,
+            })
+        finally:
+            file.close()
+
+    async def _send_chunks(self, send: Send):
+        remaining = self.content_length
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                })
+        if remaining > 0:
+            # El archivo se truncó durante el envío: cerrar el cuerpo igualmente
+            logger.warning(f"Archivo truncado durante el envío: {self.path}")
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def range_not_satisfiable_response(file_size: int) -> Response:
+    """Respuesta 416 con el tamaño real del recurso"""
+    return Response(
+        status_code=416,
+        headers={"Content-Range": f"bytes */{file_size}", "Accept-Ranges": "bytes"}
+    )
@@ -1,4 +1,6 @@
 # app/utils/ping_checker.py
+import os
+import time
 import subprocess
 import platform
 import asyncio
@@ -8,15 +10,22 @@ import logging
 
 from models import models
 from models.database import SessionLocal
+from services.heartbeat_buffer import heartbeat_buffer
 
 logger = logging.getLogger(__name__)
 
-async def ping_host(ip_address):
+# Pings simultáneos como máximo en un barrido (cada uno es un proceso)
+PING_CONCURRENCY = int(os.getenv("PING_CONCURRENCY", "100"))
+# Segundos de espera de cada ping
+PING_TIMEOUT = float(os.getenv("PING_TIMEOUT", "3"))
+
+async def ping_host(ip_address, timeout=PING_TIMEOUT):
     """
     Verifica si un host está activo mediante ping
     
     Args:
         ip_address (str): Dirección IP del host a verificar
+        timeout (float): Segundos máximos de espera de la respuesta
         
     Returns:
         bool: True si el host está activo, False si no
@@ -28,15 +37,16 @@ async def ping_host(ip_address):
     param = '-n' if platform.system().lower() == 'windows' else '-c'
     command = ['ping', param, '1', ip_address]
     
+    process = None
     try:
         # Ejecutar comando ping con timeout
         process = await asyncio.create_subprocess_exec(
             *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
         )
         
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=3)
+        await asyncio.wait_for(process.wait(), timeout=timeout)
         
         # Comprobar si el ping tuvo éxito
         return process.returncode == 0
@@ -45,95 +55,162 @@ async def ping_host(ip_address):
     except Exception as e:
         logger.error(f"Error al hacer ping a {ip_address}: {str(e)}")
         return False
+    finally:
+        # Un ping que no respondió a tiempo no debe quedar vivo ocupando un proceso
+        if process is not None and process.returncode is None:
+            try:
+                process.kill()
+                await process.wait()
+            except ProcessLookupError:
+                pass
+
+
+class PingTarget:
+    """Datos de un dispositivo necesarios para el barrido (sin sesión de base de datos)"""
+
+    __slots__ = ("device_id", "name", "ip_address_lan", "ip_address_wifi", "is_active")
+
+    def __init__(self, device_id, name, ip_address_lan, ip_address_wifi, is_active):
+        self.device_id = device_id
+        self.name = name
+        self.ip_address_lan = ip_address_lan
+        self.ip_address_wifi = ip_address_wifi
+        self.is_active = is_active
+
 
-async def check_device_status(device_id=None):
+async def sweep_devices(targets, concurrency=PING_CONCURRENCY, ping=None):
     """
-    Verifica el estado de los dispositivos probando ambas interfaces (LAN y WiFi)
+    Hace ping a la LAN y la WiFi de todos los dispositivos en paralelo
+    
+    Como mucho `concurrency` pings a la vez (cada uno es un proceso); los
+    resultados se entregan según terminan, no en el orden de `targets`.
     
     Args:
-        device_id (str, optional): ID del dispositivo a verificar. Si es None, verifica todos.
+        targets (list[PingTarget]): Dispositivos a verificar
+        concurrency (int): Máximo de pings simultáneos
+        ping: Función de ping (por defecto ping_host)
         
-    Returns:
-        dict: Resultados de la verificación {device_id: is_active}
+    Yields:
+        (PingTarget, dict): Dispositivo y {'is_active', 'lan_active', 'wifi_active'}
     """
+    ping = ping or ping_host
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded_ping(ip_address):
+        if not ip_address:
+            return False
+        async with semaphore:
+            return await ping(ip_address)
+
+    async def probe(target):
+        lan_active, wifi_active = await asyncio.gather(
+            bounded_ping(target.ip_address_lan),
+            bounded_ping(target.ip_address_wifi)
+        )
+        return target, {
+            'is_active': lan_active or wifi_active,
+            'lan_active': lan_active,
+            'wifi_active': wifi_active
+        }
+
+    tasks = [asyncio.ensure_future(probe(target)) for target in targets]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # Si el consumidor abandona el barrido, no dejar pings en curso
+        for task in tasks:
+            task.cancel()
+
+
+def _load_targets(device_id=None):
     db = SessionLocal()
     try:
-        results = {}
-        
+        query = db.query(
+            models.Device.device_id, models.Device.name, models.Device.ip_address_lan,
+            models.Device.ip_address_wifi, models.Device.is_active
+        )
         if device_id:
-            # Verificar solo un dispositivo específico
-            device = db.query(models.Device).filter(models.Device.device_id == device_id).first()
-            if device:
-                # Intentar ping a LAN primero
-                lan_active = await ping_host(device.ip_address_wifi)
-                
-                # Si LAN falla, intentar WiFi
-                wifi_active = False
-                if not lan_active and device.ip_address_lan:
-                    wifi_active = await ping_host(device.ip_address_lan)
-                
-                # Dispositivo activo si cualquiera de las interfaces responde
-                is_active = lan_active or wifi_active
-                
-                # Actualizar el estado del dispositivo
-                device.is_active = is_active
-                if is_active:
-                    # Actualizar la marca de tiempo de última conexión
-                    device.last_seen = datetime.now()
-                db.commit()
-                
-                # Guardar resultado específico de cada interfaz para logs
-                results[device.device_id] = {
-                    'is_active': is_active,
-                    'lan_active': lan_active,
-                    'wifi_active': wifi_active
-                }
-                
-                # Log para debugging
-                logger.info(f"Dispositivo {device.name} ({device.device_id}): " +
-                        f"LAN ({device.ip_address_lan}): {'OK' if lan_active else 'FAIL'}, " +
-                        f"WiFi ({device.ip_address_wifi}): {'OK' if wifi_active else 'FAIL'}, " +
-                        f"Estado: {'Activo' if is_active else 'Inactivo'}")
-        else:
-            # Verificar todos los dispositivos
-            devices = db.query(models.Device).all()
-            for device in devices:
-                # Intentar ping a LAN primero
-                lan_active = await ping_host(device.ip_address_lan)
-                
-                # Si LAN falla, intentar WiFi
-                wifi_active = False
-                if not lan_active and device.ip_address_wifi:
-                    wifi_active = await ping_host(device.ip_address_wifi)
-                
-                # Dispositivo activo si cualquiera de las interfaces responde
-                is_active = lan_active or wifi_active
-                
-                # Actualizar el estado del dispositivo
-                device.is_active = is_active
-                if is_active:
-                    # Actualizar la marca de tiempo de última conexión
-                    device.last_seen = datetime.now()
-                
-                # Guardar resultado específico de cada interfaz para logs
-                results[device.device_id] = {
-                    'is_active': is_active,
-                    'lan_active': lan_active,
-                    'wifi_active': wifi_active
-                }
-                
-                # Log para debugging
-                logger.info(f"Dispositivo {device.name} ({device.device_id}): " +
-                        f"LAN ({device.ip_address_lan}): {'OK' if lan_active else 'FAIL'}, " +
-                        f"WiFi ({device.ip_address_wifi}): {'OK' if wifi_active else 'FAIL'}, " +
-                        f"Estado: {'Activo' if is_active else 'Inactivo'}")
-            
-            db.commit()
-            
-        return results
+            query = query.filter(models.Device.device_id == device_id)
+        return [PingTarget(*row) for row in query.all()]
     finally:
         db.close()
 
+
+def _save_results(results, targets):
+    """
+    Guarda el estado de los dispositivos que cambiaron; last_seen de los que
+    responden se escribe en bloque a través del buffer de latidos
+    """
+    now = datetime.now()
+    changed = {}
+    for target in targets:
+        result = results.get(target.device_id)
+        if result is None:
+            continue
+        if result['is_active']:
+            heartbeat_buffer.record(target.device_id, now)
+        if bool(target.is_active) != result['is_active']:
+            changed[target.device_id] = result['is_active']
+    if not changed:
+        return
+
+    db = SessionLocal()
+    try:
+        for device in db.query(models.Device).filter(models.Device.device_id.in_(list(changed))):
+            device.is_active = changed[device.device_id]
+        db.commit()
+    finally:
+        db.close()
+
+
+async def stream_device_status(device_id=None, concurrency=PING_CONCURRENCY):
+    """
+    Verifica los dispositivos y entrega cada resultado en cuanto termina
+    
+    El estado se guarda en la base de datos al completar el barrido; la
+    sesión solo se abre para leer la lista y para guardar, no durante los pings.
+    
+    Args:
+        device_id (str, optional): ID del dispositivo a verificar. Si es None, verifica todos.
+        concurrency (int): Máximo de pings simultáneos
+        
+    Yields:
+        (str, dict): device_id y {'is_active', 'lan_active', 'wifi_active'}
+    """
+    targets = await asyncio.to_thread(_load_targets, device_id)
+    results = {}
+    started = time.monotonic()
+
+    async for target, result in sweep_devices(targets, concurrency):
+        results[target.device_id] = result
+        logger.info(f"Dispositivo {target.name} ({target.device_id}): " +
+                f"LAN ({target.ip_address_lan}): {'OK' if result['lan_active'] else 'FAIL'}, " +
+                f"WiFi ({target.ip_address_wifi}): {'OK' if result['wifi_active'] else 'FAIL'}, " +
+                f"Estado: {'Activo' if result['is_active'] else 'Inactivo'}")
+        yield target.device_id, result
+
+    await asyncio.to_thread(_save_results, results, targets)
+    logger.info(f"Barrido de {len(targets)} dispositivos en {time.monotonic() - started:.1f} s "
+                f"(concurrencia {concurrency})")
+
+
+async def check_device_status(device_id=None, concurrency=PING_CONCURRENCY):
+    """
+    Verifica el estado de los dispositivos probando ambas interfaces (LAN y WiFi)
+    
+    Args:
+        device_id (str, optional): ID del dispositivo a verificar. Si es None, verifica todos.
+        concurrency (int): Máximo de pings simultáneos
+        
+    Returns:
+        dict: Resultados de la verificación {device_id: {'is_active', 'lan_active', 'wifi_active'}}
+    """
+    results = {}
+    async for current_id, result in stream_device_status(device_id, concurrency):
+        results[current_id] = result
+    return results
+
 async def periodic_check_devices(interval_minutes=3):
     """
     Ejecuta la verificación periódica de dispositivos
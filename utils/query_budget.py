@@ -0,0 +1,178 @@
+# utils/query_budget.py - Recuento de sentencias SQL por petición y presupuestos por endpoint
+
+"""
+Detecta consultas N+1: cada endpoint sensible declara cuántas sentencias SQL
+puede ejecutar por petición (`@query_budget(n)`), y el recuento real se mide
+escuchando before_cursor_execute en todos los motores.
+
+- En los tests, `record_queries()` captura las sentencias de un bloque y
+  `assert_within_budget()` falla si un endpoint supera su presupuesto
+  (tests/test_query_budget.py).
+- En el servidor, `start_query_budget(app)` registra un middleware que cuenta
+  las sentencias de cada petición, las expone en la cabecera X-Query-Count y
+  escribe un aviso cuando se supera el presupuesto. Se activa con
+  QUERY_BUDGET_ENABLED.
+
+El recuento se guarda en un ContextVar: las dependencias y endpoints síncronos
+se ejecutan en el threadpool con una copia del contexto, que comparte la
+misma lista de sentencias.
+
+Las consultas opcionales de coste fijo que no dependen del número de filas
+(el recuento total de include_total, la comprobación de extensiones de
+PostgreSQL) se ejecutan dentro de `outside_budget()` y no se cuentan.
+"""
+
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Contar las sentencias de cada petición en el servidor
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Atributo del endpoint con su presupuesto
+BUDGET_ATTRIBUTE = "query_budget"
+
+# Sentencias de la petición en curso (None fuera de una petición medida)
+_current_statements: ContextVar[Optional[List[str]]] = ContextVar("query_budget_statements", default=None)
+
+# Activo dentro de outside_budget()
+_exempt: ContextVar[bool] = ContextVar("query_budget_exempt", default=False)
+
+# Grabadores activos de record_queries()
+_recorders: List[List[str]] = []
+_recorders_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Un endpoint ejecutó más sentencias de las declaradas"""
+
+
+def query_budget(max_statements: int) -> Callable:
+    """
+    Declara el máximo de sentencias SQL por petición de un endpoint
+
+    Se aplica debajo del decorador de la ruta:
+
+        @router.get("/...")
+        @query_budget(3)
+        def endpoint(...):
+    """
+    def decorator(func):
+        setattr(func, BUDGET_ATTRIBUTE, max_statements)
+        return func
+    return decorator
+
+
+def budget_of(endpoint) -> Optional[int]:
+    """Presupuesto declarado de un endpoint, o None"""
+    return getattr(endpoint, BUDGET_ATTRIBUTE, None)
+
+
+@contextmanager
+def outside_budget():
+    """Excluye del recuento las sentencias del bloque (consultas opcionales de coste fijo)"""
+    token = _exempt.set(True)
+    try:
+        yield
+    finally:
+        _exempt.reset(token)
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    if _exempt.get():
+        return
+    statements = _current_statements.get()
+    if statements is not None:
+        statements.append(statement)
+    if _recorders:
+        with _recorders_lock:
+            for recorder in _recorders:
+                recorder.append(statement)
+
+
+def register_query_listener():
+    """Escucha las sentencias de todos los motores (también los asíncronos)"""
+    if not event.contains(Engine, "before_cursor_execute", _record_statement):
+        event.listen(Engine, "before_cursor_execute", _record_statement)
+
+
+@contextmanager
+def record_queries():
+    """
+    Captura las sentencias SQL ejecutadas dentro del bloque, en cualquier hilo
+
+        with record_queries() as statements:
+            client.get("/api/...")
+        assert len(statements) <= 3
+    """
+    register_query_listener()
+    statements: List[str] = []
+    with _recorders_lock:
+        _recorders.append(statements)
+    try:
+        yield statements
+    finally:
+        with _recorders_lock:
+            _recorders.remove(statements)
+
+
+def assert_within_budget(statements: List[str], budget: Optional[int], label: str = "endpoint"):
+    """Falla con las sentencias ejecutadas si se supera el presupuesto"""
+    if budget is None:
+        raise QueryBudgetExceeded(f"{label} no declara presupuesto de consultas")
+    if len(statements) > budget:
+        listing = "\n".join(f"  {index + 1}. {statement}" for index, statement in enumerate(statements))
+        raise QueryBudgetExceeded(
+            f"{label} ejecutó {len(statements)} sentencias SQL (presupuesto: {budget}):\n{listing}"
+        )
+
+
+class QueryBudgetMiddleware:
+    """Cuenta las sentencias de cada petición y las compara con el presupuesto del endpoint"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        statements: List[str] = []
+        token = _current_statements.set(statements)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                # El router ya ha resuelto el endpoint y este ya se ejecutó
+                budget = budget_of(scope.get("endpoint"))
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(len(statements)).encode()))
+                message = {**message, "headers": headers}
+                if budget is not None and len(statements) > budget:
+                    logger.warning(
+                        f"{scope.get('method')} {scope.get('path')}: {len(statements)} sentencias SQL "
+                        f"(presupuesto: {budget})"
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _current_statements.reset(token)
+
+
+def start_query_budget(app):
+    """Registra el middleware de presupuestos si QUERY_BUDGET_ENABLED está activo"""
+    if not QUERY_BUDGET_ENABLED:
+        return
+    register_query_listener()
+    app.add_middleware(QueryBudgetMiddleware)
+    logger.info("Presupuestos de consultas activos: cabecera X-Query-Count y avisos en el log")
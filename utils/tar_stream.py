@@ -0,0 +1,213 @@
+# utils/tar_stream.py
+# Archivos tar generados al vuelo, sin temporales, con rangos y envío sin copia
+
+"""
+Un tar es una secuencia de bloques de 512 bytes: cabecera de cada miembro,
+su contenido rellenado hasta múltiplo de 512, y dos bloques vacíos al final.
+Como los tamaños se conocen de antemano, la disposición completa del archivo
+(y por tanto Content-Length y cualquier rango de bytes) se calcula antes de
+enviar nada. Los contenidos de archivo se envían con sendfile cuando el
+servidor ASGI lo permite.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import tarfile
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+import anyio
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from utils.file_streaming import STREAM_CHUNK_SIZE, ZEROCOPY_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+END_OF_ARCHIVE = b"\0" * (2 * BLOCK_SIZE)
+
+
+class TarMember:
+    """Miembro del tar: bytes en memoria o un archivo en disco"""
+
+    def __init__(self, name: str, data: Optional[bytes] = None, path: Optional[str] = None,
+                 mtime: Optional[float] = None):
+        if (data is None) == (path is None):
+            raise ValueError("Un miembro necesita data o path (no ambos)")
+        self.name = name
+        self.data = data
+        self.path = path
+        if path is not None:
+            stat = os.stat(path)
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime if mtime is None else mtime
+        else:
+            self.size = len(data)
+            self.mtime = time.time() if mtime is None else mtime
+
+    def header(self) -> bytes:
+        info = tarfile.TarInfo(self.name)
+        info.size = self.size
+        info.mtime = int(self.mtime)
+        info.mode = 0o644
+        # GNU admite nombres largos y tamaños de más de 8 GiB
+        return info.tobuf(format=tarfile.GNU_FORMAT, encoding="utf-8", errors="strict")
+
+
+# Tramo del archivo: (bytes, None, 0, longitud) o (None, ruta, desplazamiento, longitud)
+Segment = Tuple[Optional[bytes], Optional[str], int, int]
+
+
+class TarLayout:
+    """Disposición completa de un tar: tramos, tamaño total y posición de cada miembro"""
+
+    def __init__(self, members: List[TarMember]):
+        self.members = members
+        self.segments: List[Segment] = []
+        # Desplazamiento de la cabecera de cada miembro dentro del tar
+        self.offsets: List[int] = []
+        position = 0
+        for member in members:
+            self.offsets.append(position)
+            header = member.header()
+            self.segments.append((header, None, 0, len(header)))
+            position += len(header)
+            if member.size:
+                if member.data is not None:
+                    self.segments.append((member.data, None, 0, member.size))
+                else:
+                    self.segments.append((None, member.path, 0, member.size))
+                position += member.size
+            padding = -member.size % BLOCK_SIZE
+            if padding:
+                self.segments.append((b"\0" * padding, None, 0, padding))
+                position += padding
+        self.segments.append((END_OF_ARCHIVE, None, 0, len(END_OF_ARCHIVE)))
+        self.size = position + len(END_OF_ARCHIVE)
+
+    @property
+    def etag(self) -> str:
+        """Validador de la disposición (cambia si cambia cualquier miembro)"""
+        digest = hashlib.sha256()
+        for member in self.members:
+            digest.update(f"{member.name}\0{member.size}\0{int(member.mtime)}\0".encode("utf-8"))
+            if member.data is not None:
+                digest.update(member.data)
+        return f'"{digest.hexdigest()[:32]}"'
+
+    def slice(self, start: int, end: int) -> Iterator[Segment]:
+        """Tramos que cubren los bytes [start, end] (inclusivo)"""
+        position = 0
+        for data, path, offset, length in self.segments:
+            segment_end = position + length - 1
+            if segment_end >= start and position <= end:
+                skip = max(0, start - position)
+                take = min(segment_end, end) - (position + skip) + 1
+                yield data, path, offset + skip, take
+            position += length
+            if position > end:
+                break
+
+
+class TarStreamResponse(Response):
+    """
+    Respuesta que envía un TarLayout (o un rango) sin construirlo en disco
+
+    Los contenidos de archivo van por sendfile con la extensión ASGI
+    `http.response.zerocopysend`; si no está disponible, por lecturas en el
+    threadpool. La tarea de fondo solo se ejecuta si se envió hasta el final
+    del archivo.
+    """
+
+    def __init__(self, layout: TarLayout, byte_range: Optional[Tuple[int, int]] = None,
+                 headers: Optional[Mapping[str, str]] = None,
+                 background: Optional[BackgroundTask] = None,
+                 chunk_size: int = STREAM_CHUNK_SIZE):
+        self.layout = layout
+        self.chunk_size = chunk_size
+        if byte_range is None:
+            self.start, self.end = 0, layout.size - 1
+            status_code = 200
+        else:
+            self.start, self.end = byte_range
+            status_code = 206
+
+        super().__init__(status_code=status_code, headers=headers,
+                         media_type="application/x-tar", background=background)
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        self.headers.setdefault("accept-ranges", "bytes")
+        self.headers.setdefault("etag", layout.etag)
+        if byte_range is not None:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{layout.size}"
+
+    @property
+    def reaches_end(self) -> bool:
+        return self.end == self.layout.size - 1
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        for data, path, offset, length in self.layout.slice(self.start, self.end):
+            if data is not None:
+                await send({"type": "http.response.body", "body": data[offset:offset + length],
+                            "more_body": True})
+            elif zerocopy:
+                await self._send_zerocopy(send, path, offset, length)
+            else:
+                await self._send_chunks(send, path, offset, length)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        if self.background is not None and self.reaches_end:
+            await self.background()
+
+    async def _send_zerocopy(self, send: Send, path: str, offset: int, length: int):
+        file = await anyio.to_thread.run_sync(open, path, "rb")
+        try:
+            available = max(0, os.fstat(file.fileno()).st_size - offset)
+            count = min(length, available)
+            if count:
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": file,
+                    "offset": offset,
+                    "count": count,
+                    "more_body": True,
+                })
+        finally:
+            file.close()
+        await self._pad(send, path, length - count)
+
+    async def _send_chunks(self, send: Send, path: str, offset: int, length: int):
+        remaining = length
+        async with await anyio.open_file(path, mode="rb") as file:
+            await file.seek(offset)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await self._pad(send, path, remaining)
+
+    async def _pad(self, send: Send, path: str, missing: int):
+        # El archivo se truncó tras calcular la disposición: rellenar para no romper el tar
+        if missing <= 0:
+            return
+        logger.warning(f"Archivo truncado durante el envío del tar: {path} ({missing} bytes rellenados)")
+        while missing > 0:
+            block = min(missing, self.chunk_size)
+            await send({"type": "http.response.body", "body": b"\0" * block, "more_body": True})
+            missing -= block
+